@@ -0,0 +1,254 @@
+# Embedding API: compile a source once, run it and call its functions from python
+#
+#     program = lox.api.compile(source)
+#     program.run(globals={"limit": 10, "log": logger.info})
+#     check = program.get_function("check")
+#     check("alice", 3)
+#
+# Thread safety: the tree of a Program is only read once compiled (the caches
+# the interpreter keeps on it are single assignments and atomic list
+# operations), so a Program can be shared by threads. Each run owns its
+# interpreter state, protected by a lock: the calls of the functions of one
+# run are serialized, whatever the thread calling them. Threads needing calls
+# in parallel run the Program once each. compile is serialized as the
+# compilation errors are collected from LoxError (see LoxError.collecting).
+#
+# Asyncio: python coroutine functions given as globals are async natives, and
+# run_async(program) runs a program in its own thread while these coroutines
+# run on the calling event loop, so many scripts wait for I/O concurrently.
+# The functions of such a run must not be called from the event loop thread,
+# it would wait for itself: use loop.run_in_executor.
+import asyncio
+import inspect
+import threading
+from typing import List
+
+from lox.scanner import scan_tokens
+from lox.parser import Parser
+from lox.resolver import Resolver
+from lox.interpreter import Interpreter
+from lox.callable import LoxCallable
+from lox.loxstring import LoxString
+from lox.constants import LoxConstant
+from lox.error import LoxError, LoxRuntimeError
+from lox.native import AsyncNative
+from lox.instrumentation import ExecutionBudget, HeapTracker
+from lox.output import OutputSink
+
+# python values used as they are by the interpreter
+_plain_types = (type(None), bool, float, str)
+
+
+class CompileError(Exception):
+    """A source with scanning, parsing or resolution errors."""
+
+    def __init__(self, messages: List[str], errors: list = None):
+        """messages -- the reported lines
+        errors -- the same errors as Diagnostic, with their line and token"""
+        self.messages = messages
+        self.errors = errors if errors is not None else []
+        super().__init__("\n".join(messages))
+
+
+def to_lox(value: object) -> object:
+    """Lox value of a python value."""
+    if type(value) in _plain_types or isinstance(value, LoxCallable):
+        return value
+    if type(value) is int:
+        # the interpreter only keeps exact integers as int
+        if -LoxConstant.max_int <= value <= LoxConstant.max_int:
+            return value
+        return float(value)
+    if inspect.iscoroutinefunction(value):
+        return AsyncFunction(value)
+    if callable(value):
+        return PythonFunction(value)
+    raise TypeError("no lox value for {!r}".format(value))
+
+
+def to_python(value: object) -> object:
+    """Python value of a lox value, functions and instances stay lox objects."""
+    if type(value) is LoxString:
+        return value.flatten()
+    return value
+
+
+def compile(source: str) -> "Program":
+    """Scan, parse and resolve a source, raise CompileError on errors."""
+    errors = []
+    with LoxError.collecting() as messages:
+        tokens = []
+        scan_tokens(source, {'start': 0, 'current': 0, 'line': 1}, tokens, errors)
+        statements = Parser(tokens, errors).parse()
+        # the resolver stores the depths of the locals in an interpreter
+        resolving = Interpreter()
+        if not LoxError.haderror:
+            Resolver(resolving, errors).resolvelist(statements)
+        failed = LoxError.haderror
+    if failed:
+        raise CompileError(messages, errors)
+    return Program(statements, resolving.locals)
+
+
+class Program:
+    """A compiled source, run as many times as needed."""
+
+    def __init__(self, statements, locals: dict):
+        """statements -- the resolved tree
+        locals -- depth of the local variables, shared by all the runs"""
+        self.statements = statements
+        self.locals = locals
+        self.interpreter = None
+        self.lock = None
+        self.budget = None
+
+    def run(self, globals: dict = None, output: OutputSink = None,
+            budget: ExecutionBudget = None, heap: HeapTracker = None) -> "Program":
+        """Run the top level statements in new global variables.
+
+        globals -- python values defined before the run, python functions
+                   can be called from lox
+        output -- sink of the print statements, buffered stdout by default
+        budget -- limits of the run, and of each call of its functions
+        heap -- tracker of the objects of the run, and its heap limit
+        Runtime errors (InterpreterError, LoxRuntimeError, BudgetExceeded,
+        HeapLimitExceeded) are raised. The functions of the latest run are the ones of
+        get_function."""
+        return self._run(globals, output, budget, heap, None)
+
+    def _run(self, globals: dict, output: OutputSink, budget: ExecutionBudget,
+             heap: HeapTracker, loop) -> "Program":
+        interpreter = Interpreter(output)
+        interpreter.loop = loop
+        if budget is not None:
+            budget.attach(interpreter)
+            budget.reset()
+        if heap is not None:
+            heap.attach(interpreter)
+        interpreter.locals = self.locals
+        lock = threading.RLock()
+        if globals:
+            for name, value in globals.items():
+                interpreter.global_env.define(name, to_lox(value))
+        with lock:
+            try:
+                for statement in self.statements:
+                    interpreter.execute(statement)
+            finally:
+                interpreter.output.flush()
+        self.interpreter = interpreter
+        self.lock = lock
+        self.budget = budget
+        return self
+
+    def get_global(self, name: str) -> object:
+        """Value of a global variable of the latest run."""
+        if self.interpreter is None:
+            self.run()
+        try:
+            return to_python(self.interpreter.global_env.get(name))
+        except LoxRuntimeError:
+            raise KeyError(name) from None
+
+    def get_function(self, name: str) -> "ExportedFunction":
+        """Python callable calling a function (or class) of the latest run,
+        the program is run first if it never ran."""
+        function = self.get_global(name)
+        if not isinstance(function, LoxCallable):
+            raise TypeError("{} is not a lox function".format(name))
+        return ExportedFunction(function, self.interpreter, self.lock, self.budget)
+
+
+async def run_async(program: Program, globals: dict = None,
+                    output: OutputSink = None, budget: ExecutionBudget = None,
+                    heap: HeapTracker = None) -> Program:
+    """Program.run in a thread of its own, the coroutines of the async
+    natives run on the current event loop.
+
+    The thread cannot be interrupted: cancelling the task only stops
+    waiting for it, a budget bounds how long it runs."""
+    loop = asyncio.get_running_loop()
+    done = loop.create_future()
+
+    def settle(error, result):
+        if done.cancelled():
+            return
+        if error is not None:
+            done.set_exception(error)
+        else:
+            done.set_result(result)
+
+    def target():
+        try:
+            result = program._run(globals, output, budget, heap, loop)
+        except BaseException as error:
+            loop.call_soon_threadsafe(settle, error, None)
+        else:
+            loop.call_soon_threadsafe(settle, None, result)
+
+    threading.Thread(target=target, daemon=True).start()
+    return await done
+
+
+class ExportedFunction:
+    """Lox function called with python arguments.
+
+    The arguments and the result are converted with to_lox and to_python,
+    runtime errors are raised as in Program.run."""
+
+    def __init__(self, function: LoxCallable, interpreter: Interpreter, lock,
+                 budget: ExecutionBudget = None):
+        self.function = function
+        self.interpreter = interpreter
+        self.lock = lock
+        self.budget = budget
+        self.arity = function.arity()
+
+    def __call__(self, *args):
+        if len(args) != self.arity:
+            raise TypeError("{} expects {} arguments, {} given".format(
+                self.function, self.arity, len(args)))
+        arguments = list(args)
+        for i, value in enumerate(arguments):
+            if type(value) not in _plain_types:
+                arguments[i] = to_lox(value)
+        interpreter = self.interpreter
+        with self.lock:
+            if self.budget is not None:
+                self.budget.reset()
+            try:
+                result = self.function.call(interpreter, arguments)
+            finally:
+                interpreter.output.flush()
+        if type(result) is LoxString:
+            return result.flatten()
+        return result
+
+    def __repr__(self):
+        return "ExportedFunction(" + str(self.function) + ")"
+
+
+class PythonFunction(LoxCallable):
+    """Python function called from lox, its arity comes from its signature."""
+
+    def __init__(self, function):
+        self.function = function
+        parameters = inspect.signature(function).parameters.values()
+        self.parameters = len([p for p in parameters
+                               if p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD)])
+
+    def arity(self) -> int:
+        return self.parameters
+
+    def call(self, interpreter, arguments: List[object]) -> object:
+        return to_lox(self.function(*[to_python(arg) for arg in arguments]))
+
+    def __str__(self):
+        return "<" + getattr(self.function, "__name__", "python") + ": native function>"
+
+
+class AsyncFunction(AsyncNative, PythonFunction):
+    """Python coroutine function called from lox."""
+
+    async def run(self, arguments: List[object]) -> object:
+        return to_lox(await self.function(*[to_python(arg) for arg in arguments]))
@@ -37,7 +37,7 @@ class PrinterVisitor(Visitor):
         return self.parenthesize("get", [get.name])
 
     def visitgrouping(self, grouping):
-        return self.parenthesize("group", [grouping.expr])
+        return self.parenthesize("group", [grouping.expression])
 
     def visitliteral(self, literal):
         if not literal.value:
@@ -77,9 +77,18 @@ class PrinterVisitor(Visitor):
     def visitexpression(self, expstmt):
         return self.parenthesize("Expression statement", [expstmt.expression])
 
+    def visitfor(self, forstmt):
+        return self.parenthesize("For", [forstmt.initializer, forstmt.condition, forstmt.increment])
+
+    def visitforin(self, forin):
+        return self.parenthesize("For in", [forin.name, forin.iterable])
+
     def visitif(self, ifstmt):
         return self.parenthesize("If", [ifstmt.condition, ifstmt.thenbranch, ifstmt.elsebranch])
 
+    def visitimport(self, importstmt):
+        return self.parenthesize("Import", [importstmt.path.literal])
+
     def visitprint(self, printstmt):
         return self.parenthesize("Print", [printstmt.expression])
 
@@ -92,6 +101,9 @@ class PrinterVisitor(Visitor):
     def visitwhile(self, whilestmt):
         return self.parenthesize("While", [whilestmt.condition])
 
+    def visityield(self, yieldstmt):
+        return self.parenthesize("Yield", [yieldstmt.value])
+
 
 if __name__ == "__main__":
     expr = Binary(
@@ -1,10 +1,8 @@
 # Definition of the LoxCallable classfrom
 
-from lox.environment import Environment
 from typing import List
 from lox.stmt import Function
 from lox.expr import FunctionExp
-from lox.instance import LoxInstance
 from lox.tokentype import TokensDic as Tk
 from lox.constants import LoxConstant
 from lox.error import ReturnException
@@ -14,44 +12,83 @@ from lox.functiontypes import FunctionType
 class LoxCallable:
     """Superclass for runtime of callable objects."""
 
+    # no __dict__ of its own, so that the slots of a subclass save memory
+    __slots__ = ()
+
     def call(self, interpreter, arguments: List[object]):
         pass
 
     def arity(self) -> int:
         pass
 
+    def invoke(self, interpreter, arguments: List[object]):
+        """Entry point of the interpreter, the arity is already checked."""
+        return self.call(interpreter, arguments)
+
 
 class LoxFunction(LoxCallable):
     """Runtime for function."""
 
-    def __init__(self, name: "LoxToken", fundec: FunctionExp, closure):
+    def __init__(self, name: "LoxToken", fundec: FunctionExp, closure, globals=None):
+        """globals -- global environment of the declaration, None for the
+        one running the call"""
         self.name = name
         self.fundec = fundec
-        self.call_env = None
         self.closure = closure
+        self.globals = globals
 
     def arity(self) -> int:
         return len(self.fundec.params)
 
     def call(self, interpreter, arguments: List[object]):
+        fundec = self.fundec
+        if fundec.pending is not None:
+            # first call of a function parsed lazily
+            fundec.pending.complete(fundec, interpreter)
+        if fundec.generator:
+            # the body runs as the generator is iterated, in a frame of its
+            # own: no reuse
+            call_env = self.closure
+            if fundec.scoped:
+                call_env = interpreter.newenvironment(self.closure)
+            for i in range(len(arguments)):
+                call_env.define(fundec.params[i].lexeme, arguments[i])
+            return interpreter.newgenerator(interpreter, self, call_env)
         # create an environment for this call, inside the calling env
-        self.call_env = Environment(self.closure)
+        if not fundec.scoped:
+            # nothing to declare: the body runs in the closure
+            call_env = self.closure
+        elif fundec.captured:
+            call_env = interpreter.newenvironment(self.closure)
+        else:
+            # no closure can keep the frame: reuse one from a previous call
+            call_env = interpreter.newframe(fundec, self.closure)
         # Add the parameters to this env with their "calling" value
         for i in range(len(arguments)):
-            self.call_env.define(self.fundec.params[i].lexeme, arguments[i])
-        # call the function: execute the block wit the current env
+            call_env.define(fundec.params[i].lexeme, arguments[i])
+        # call the function: execute the body with the current env
         try:
-            interpreter.executeblock(self.fundec.body, self.call_env)
+            # a function of a module reads the module globals
+            globals = self.globals
+            if globals is None or globals is interpreter.global_env:
+                return interpreter.executebody(fundec, call_env)
+            return interpreter.executein(globals, fundec, call_env)
         except ReturnException as exc:
-            if self.fundec.functiontype is FunctionType.INIT:
+            if fundec.functiontype is FunctionType.INIT:
                 return self.closure.getat(0, Tk.lexeme_from_type[Tk.THIS])
             return exc.value
+        finally:
+            if fundec.scoped and not fundec.captured:
+                fundec.frames.append(call_env)
 
-    def bind(self, instance):
+    # the interpreter calls the function directly
+    invoke = call
+
+    def bind(self, instance, interpreter):
         """Bind the instance to the method."""
-        this_env = Environment(self.closure)
+        this_env = interpreter.newenvironment(self.closure)
         this_env.define(Tk.lexeme_from_type[Tk.THIS], instance)
-        return LoxFunction(self.name, self.fundec, this_env)
+        return interpreter.newfunction(self.name, self.fundec, this_env, self.globals)
 
     def __str__(self):
         if self.name is None:
@@ -69,21 +106,24 @@ class LoxClass(LoxCallable):
         self.methods = {}
         for method in methods:
             self.methods[method.name.lexeme] = method
+        # methods never change: no lookup of the initializer on each call
+        self.initializer = self.methods.get(LoxConstant.init_method)
 
     def __str__(self):
         return self.name
 
     def call(self, interpreter, arguments: List[object]):
-        instance = LoxInstance(self)
-        initializer = self.methods.get(LoxConstant.init_method)
-        if initializer:
-            initializer.bind(instance).call(interpreter, arguments)
+        instance = interpreter.newinstance(self)
+        if self.initializer is not None:
+            self.initializer.bind(instance, interpreter).call(
+                interpreter, arguments)
         return instance
 
+    invoke = call
+
     def arity(self) -> int:
-        initializer = self.methods.get(LoxConstant.init_method)
-        if initializer:
-            return initializer.arity()
+        if self.initializer is not None:
+            return self.initializer.arity()
         return 0
 
     def findmethod(self, name):
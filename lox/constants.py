@@ -1,3 +1,5 @@
 class LoxConstant:
     max_param = 8
     init_method = "init"
+    # Lox numbers are doubles: integers are exact up to 2**53
+    max_int = 2**53
@@ -0,0 +1,201 @@
+# Line coverage of lox programs
+#
+#     python3 -m lox.lox --coverage lcov.info script.lox other.lox
+#
+# Like the instrumentation hooks, coverage swaps the execute method of the
+# interpreter (and genstatement, running the statements of generator bodies
+# holding a yield) for one flagging each statement it runs (Stmt.covered): an
+# interpreter without coverage pays nothing for it. After each run the
+# flags of the program and of the modules it ran are collected as line hits,
+# then cleared, so a Coverage aggregates many runs. The report is in the
+# lcov tracefile format (genhtml, editors, CI services read it).
+from lox.visitor import Visitor
+
+
+class Statements(Visitor):
+    """Collect the statements of a tree, functions and lambdas included."""
+
+    def __init__(self):
+        self.statements = []
+
+    def collect(self, item):
+        if item is not None:
+            item.accept(self)
+
+    def collectall(self, items):
+        for item in items:
+            self.collect(item)
+
+    def visitassign(self, assign):
+        self.collect(assign.value)
+
+    def visitbinary(self, binary):
+        self.collect(binary.left)
+        self.collect(binary.right)
+
+    def visitcall(self, call):
+        self.collect(call.callee)
+        self.collectall(call.arguments)
+
+    def visitfunctionexp(self, functionexp):
+        if functionexp.pending is not None:
+            # lazy body never called: its lines are there, not covered
+            self.collectall(functionexp.pending.statements())
+        else:
+            self.collectall(functionexp.body)
+
+    def visitget(self, get):
+        self.collect(get.getobject)
+
+    def visitgrouping(self, grouping):
+        self.collect(grouping.expression)
+
+    def visitliteral(self, literal):
+        pass
+
+    def visitlogical(self, logical):
+        self.collect(logical.left)
+        self.collect(logical.right)
+
+    def visitset(self, var_set):
+        self.collect(var_set.setobject)
+        self.collect(var_set.value)
+
+    def visitsuper(self, var_super):
+        pass
+
+    def visitthis(self, this):
+        pass
+
+    def visitunary(self, unary):
+        self.collect(unary.right)
+
+    def visitvariable(self, variable):
+        pass
+
+    def visitblock(self, block):
+        # not a line of its own: loops run their block statements directly
+        self.collectall(block.statements)
+
+    def visitbreak(self, var_break):
+        self.statements.append(var_break)
+
+    def visitclass(self, var_class):
+        self.statements.append(var_class)
+        self.collectall(var_class.methods)
+
+    def visitexpression(self, expression):
+        self.statements.append(expression)
+        self.collect(expression.expression)
+
+    def visitfor(self, var_for):
+        self.statements.append(var_for)
+        self.collect(var_for.initializer)
+        self.collect(var_for.condition)
+        self.collect(var_for.increment)
+        self.collect(var_for.body)
+
+    def visitforin(self, forin):
+        self.statements.append(forin)
+        self.collect(forin.iterable)
+        self.collect(forin.body)
+
+    def visitfunction(self, function):
+        self.statements.append(function)
+        self.collect(function.funcexp)
+
+    def visitif(self, var_if):
+        self.statements.append(var_if)
+        self.collect(var_if.condition)
+        self.collect(var_if.thenbranch)
+        self.collect(var_if.elsebranch)
+
+    def visitimport(self, var_import):
+        self.statements.append(var_import)
+
+    def visitprint(self, print):
+        self.statements.append(print)
+        self.collect(print.expression)
+
+    def visitreturn(self, var_return):
+        self.statements.append(var_return)
+        self.collect(var_return.value)
+
+    def visitvar(self, var):
+        self.statements.append(var)
+        self.collect(var.initializer)
+
+    def visitwhile(self, var_while):
+        self.statements.append(var_while)
+        self.collect(var_while.condition)
+        self.collect(var_while.body)
+
+    def visityield(self, var_yield):
+        self.statements.append(var_yield)
+        self.collect(var_yield.value)
+
+
+class Coverage:
+    """Line hits of lox files over many runs.
+
+    files -- path: {line: number of runs executing it}"""
+
+    def __init__(self):
+        self.files = {}
+
+    def attach(self, interpreter):
+        execute = interpreter.execute
+
+        def covering_execute(statement):
+            statement.covered = True
+            return execute(statement)
+
+        interpreter.execute = covering_execute
+        # the statements holding a yield run in generator bodies
+        genstatement = interpreter.genstatement
+
+        def covering_genstatement(statement):
+            statement.covered = True
+            return genstatement(statement)
+
+        interpreter.genstatement = covering_genstatement
+
+    def collect(self, path: str, statements: list):
+        """Count the lines of a run of a file, clear its flags."""
+        collector = Statements()
+        collector.collectall(statements)
+        lines = self.files.setdefault(path, {})
+        hit = set()
+        for statement in collector.statements:
+            if statement.line is None:
+                continue
+            if statement.covered:
+                statement.covered = False
+                hit.add(statement.line)
+            lines.setdefault(statement.line, 0)
+        for line in hit:
+            lines[line] += 1
+
+    def collectrun(self, path: str, statements: list, interpreter):
+        """Collect a program and the modules it ran."""
+        self.collect(path, statements)
+        for modulepath, module in interpreter.modules.items():
+            if module.state is not None:
+                self.collect(modulepath, module.compiled.statements)
+
+    def lcov(self) -> str:
+        """Report in the lcov tracefile format."""
+        records = []
+        for path, lines in sorted(self.files.items()):
+            records.append("TN:")
+            records.append("SF:" + path)
+            for line, count in sorted(lines.items()):
+                records.append("DA:{},{}".format(line, count))
+            records.append("LF:{}".format(len(lines)))
+            records.append("LH:{}".format(sum(1 for count in lines.values() if count)))
+            records.append("end_of_record")
+        return "\n".join(records) + "\n"
+
+    def write(self, path: str):
+        with open(path, "w") as f:
+            f.write(self.lcov())
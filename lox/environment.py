@@ -9,6 +9,11 @@ class Environment:
         self.__varmap = {}
         self.enclosing = enclosing_env
 
+    def reset(self, enclosing_env):
+        """Empty the environment to reuse it as a new one."""
+        self.__varmap.clear()
+        self.enclosing = enclosing_env
+
     def assign(self, token: LoxToken, value):
         if token.lexeme in self.__varmap:
             self.__varmap[token.lexeme] = value
@@ -21,6 +26,9 @@ class Environment:
         raise LoxRuntimeError(
             token, "Undefined variable " + token.lexeme + " " + str(token))
 
+    def assignat(self, distance: int, token: LoxToken, value):
+        self.ancestor(distance).__varmap[token.lexeme] = value
+
     def ancestor(self, distance: int) -> 'Environment':
         environment = self
         for _ in range(distance):
@@ -57,3 +65,52 @@ class Environment:
             return self.ancestor(distance).__varmap[varname]
         raise LoxRuntimeError(
             name, "Undefined variable '" + varname + "'.")
+
+
+class Cell:
+    """Storage of a global variable: defining the variable again changes
+    its value, never the cell, so the sites using it can keep it."""
+
+    __slots__ = ("value", "owner")
+
+    def __init__(self, owner: "GlobalEnvironment", value=None):
+        self.owner = owner
+        self.value = value
+
+
+class GlobalEnvironment(Environment):
+    """Environment of the global variables, kept in cells.
+
+    Sites reading or assigning a global cache its cell after the first
+    lookup: the cell of a name never changes, a cell owned by another
+    global environment (the same tree run by another interpreter) is looked
+    up again."""
+
+    def __init__(self):
+        super().__init__()
+        self.cells = {}
+
+    def cell(self, name: "LoxToken or str") -> Cell:
+        varname = name.lexeme if isinstance(name, LoxToken) else name
+        cell = self.cells.get(varname)
+        if cell is None:
+            raise LoxRuntimeError(
+                name, "Undefined variable '" + varname + "'.")
+        return cell
+
+    def define(self, varname, value):
+        cell = self.cells.get(varname)
+        if cell is None:
+            self.cells[varname] = Cell(self, value)
+        else:
+            cell.value = value
+
+    def get(self, name: "LoxToken or str") -> object:
+        return self.cell(name).value
+
+    def assign(self, token: LoxToken, value):
+        cell = self.cells.get(token.lexeme)
+        if cell is None:
+            raise LoxRuntimeError(
+                token, "Undefined variable " + token.lexeme + " " + str(token))
+        cell.value = value
@@ -1,3 +1,6 @@
+import contextlib
+import threading
+
 from lox.token import LoxToken
 from lox.tokentype import TokensDic
 
@@ -9,38 +12,97 @@ class LoxRuntimeError(Exception):
         super().__init__(errordescription)
 
 
+class BudgetExceeded(LoxRuntimeError):
+    """A run went over a limit of its ExecutionBudget."""
+
+    def __init__(self, limit: str, line: int = None):
+        self.limit = limit
+        self.line = line
+        message = "execution budget exceeded: " + limit
+        if line is not None:
+            message += " [line {}]".format(line)
+        super().__init__(None, message)
+
+
+class HeapLimitExceeded(LoxRuntimeError):
+    """A run went over the heap limit of its HeapTracker."""
+
+    def __init__(self, size: int, limit: int, kind: str):
+        self.size = size
+        self.limit = limit
+        message = "heap limit exceeded: {} bytes over {} creating {}".format(
+            size, limit, kind)
+        super().__init__(None, message)
+
+
 class ParserError(Exception):
     def __init__(self, token: LoxToken, errordescription: str):
         self.token = token
+        self.description = errordescription
         if token.type == TokensDic.EOF:
-            self.message = str(token.line) + " at end " + errordescription
+            self.where = "at end"
+        elif token.type == TokensDic.STRING:
+            self.where = "at '\"" + token.literal + "\"'"
         else:
-            self.message = str(token.line) + " at '" + \
-                token.lexeme + "' " + errordescription
+            # numbers keep their value as literal, not as lexeme
+            self.where = "at '" + (token.lexeme or str(token.literal)) + "'"
+        self.message = str(token.line) + " " + self.where + " " + errordescription
         super().__init__(self.message)
 
 
+class Diagnostic:
+    """A compilation error, as collected in the errors lists.
+
+    line -- line of the error
+    where -- token of the error ("at 'x'", "at end") or empty
+    message -- what is wrong"""
+
+    def __init__(self, line: int, where: str, message: str):
+        self.line = line
+        self.where = where
+        self.message = message
+
+    def __str__(self):
+        return "[line {}] Error {}: {}".format(self.line, self.where, self.message)
+
+    def __repr__(self):
+        return "Diagnostic(" + str(self) + ")"
+
+
 class InterpreterError(Exception):
     def __init__(self, token: LoxToken, errordescription: str):
         self.token = token
         super().__init__(errordescription)
 
 
+def operand(value: object) -> str:
+    """Lox text of an operand in an error message."""
+    if value is None:
+        return "nil"
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    return str(value)
+
+
 class OperandsError(InterpreterError):
-    def __init__(self, token: LoxToken, typedescription: str = "", left: object = None, right: object = None):
-        if left is not None and right is None:
-            self.message = str(token.lexeme) + " operator requires " + typedescription + ". " +  \
-                str(left) + " is not " + typedescription
-        elif left is not None and right is not None:
-            self.message = str(token.lexeme) + " operator requires " + typedescription + ". " +  \
-                str(left) + " and " + str(right) + \
-                " are not " + typedescription
+    def __init__(self, token: LoxToken, typedescription: str, *operands):
+        """operands -- the operand of a unary operator, both operands of a
+        binary one"""
+        if len(operands) == 1:
+            self.message = "{} operator requires {}. {} is not {}".format(
+                token.lexeme, typedescription, operand(operands[0]), typedescription)
+        else:
+            left, right = operands
+            self.message = "{} operator requires {}. {} and {} are not {}".format(
+                token.lexeme, typedescription, operand(left), operand(right), typedescription)
         super().__init__(token, self.message)
 
 
 class DivisionByZeroError(InterpreterError):
     def __init__(self, token: LoxToken):
-        self.message = "Division by zero line:" + token.line
+        self.message = "Division by zero line:" + str(token.line)
         super().__init__(token, self.message)
 
 
@@ -57,18 +119,51 @@ class BreakException(Exception):
 class LoxError:
     log = []
     haderror = False
+    # messages are printed, unless a caller collects them from the log
+    echo = True
+    # held by the callers collecting messages, the state above is shared
+    lock = threading.RLock()
+
+    @staticmethod
+    @contextlib.contextmanager
+    def collecting():
+        """Collect the messages reported in the block instead of printing
+        them, in the list given to the block when it ends. haderror tells
+        whether the block reported an error."""
+        with LoxError.lock:
+            echo = LoxError.echo
+            haderror = LoxError.haderror
+            start = len(LoxError.log)
+            LoxError.echo = False
+            LoxError.haderror = False
+            messages = []
+            try:
+                yield messages
+            finally:
+                messages.extend(LoxError.log[start:])
+                del LoxError.log[start:]
+                LoxError.echo = echo
+                LoxError.haderror = haderror
+
+    @staticmethod
+    def report(line, where, message, errors: list = None):
+        """Report a compilation error, also appended to errors as a Diagnostic."""
+        diagnostic = Diagnostic(line, where, message)
+        if errors is not None:
+            errors.append(diagnostic)
+        LoxError.message(str(diagnostic))
 
     @staticmethod
-    def report(line, where, message):
-        logmsg = "[line {}] Error {}: {}".format(line, where, message)
+    def message(logmsg):
         LoxError.log.append(logmsg)
-        print(logmsg)
+        if LoxError.echo:
+            print(logmsg)
 
     @staticmethod
-    def error(lineinfo, message):
+    def error(lineinfo, message, errors: list = None):
         if isinstance(lineinfo, LoxToken):
             linenumber = lineinfo.line
         else:
             linenumber = lineinfo
         LoxError.haderror = True
-        LoxError.report(linenumber, "", message)
+        LoxError.report(linenumber, "", message, errors)
@@ -6,10 +6,16 @@ class Expr:
     pass
 
 
+# cache of a call site validating no callee yet, nil included
+UNCACHED = object()
+
+
 class Assign(Expr):
     def __init__(self, name: LoxToken, value: Expr):
         self.name = name
         self.value = value
+        # cell of the global variable assigned, cached by the interpreter
+        self.cell = None
 
     def accept(self, visitor):
         return visitor.visit(self)
@@ -30,6 +36,8 @@ class Call(Expr):
         self.callee = callee
         self.paren = paren
         self.arguments = arguments
+        # last callee validated at this call site (its declaration for functions)
+        self.cache = UNCACHED
 
     def accept(self, visitor):
         return visitor.visit(self)
@@ -41,6 +49,32 @@ class FunctionExp(Expr):
         self.params = params
         self.body = body
         self.functiontype = functiontype
+        # metadata set by the resolver:
+        # a closure created by the function may keep its frame
+        self.captured = True
+        # the function declares parameters or variables, so each call needs
+        # an environment
+        self.scoped = True
+        # the body without its last statement when it is a return, and this
+        # return, run without raising
+        self.statements = body
+        self.result = None
+        # names declared in the function, outside of its nested functions,
+        # and deepest nesting of its scopes
+        self.locals = 0
+        self.depth = 0
+        # local variables of enclosing functions it uses, 'this' and 'super'
+        # included
+        self.upvalues = set()
+        self.usesthis = False
+        self.hasloops = False
+        self.hascalls = False
+        # call frames of the function ready for reuse when not captured
+        self.frames = []
+        # body left to parse and resolve on the first call (see lox.lazy)
+        self.pending = None
+        # the body yields: a call returns a generator (see lox.generators)
+        self.generator = False
 
     def accept(self, visitor):
         return visitor.visit(self)
@@ -63,6 +97,14 @@ class Grouping(Expr):
         return visitor.visit(self)
 
 
+class Invariant(Expr):
+    def __init__(self, expression: Expr):
+        self.expression = expression
+
+    def accept(self, visitor):
+        return visitor.visit(self)
+
+
 class Literal(Expr):
     def __init__(self, value: object):
         self.value = value
@@ -120,6 +162,22 @@ class Unary(Expr):
 class Variable(Expr):
     def __init__(self, name: LoxToken):
         self.name = name
+        # cell of the global variable read, cached by the interpreter
+        self.cell = None
+
+    def accept(self, visitor):
+        return visitor.visit(self)
+
+
+class NumericBinary(Binary):
+    """Binary whose operands are proven numbers by lox.typeinfer."""
+
+    def accept(self, visitor):
+        return visitor.visit(self)
+
+
+class NumericUnary(Unary):
+    """Unary minus whose operand is proven a number by lox.typeinfer."""
 
     def accept(self, visitor):
         return visitor.visit(self)
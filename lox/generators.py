@@ -0,0 +1,136 @@
+# Generators: functions whose body yields, and lazy streams of their values
+#
+#     fun naturals() { var n = 0; while (true) { yield n; n = n + 1; } }
+#     fun square(x) { return x * x; }
+#     for (var x in take(map(naturals(), square), 5)) print x;
+#
+# A function holding a yield statement (FunctionExp.generator) returns a
+# generator when called, its body has not run yet. The interpreter runs the
+# body as a python generator (Interpreter.generatebody): the statements
+# holding a yield (Stmt.yields, set by the resolver) run through its gen*
+# methods, the other ones through execute as in any function. Each value
+# asked by a 'for (var x in ...)' loop or a stream resumes the body up to its
+# next yield, so a pipeline holds one value at a time whatever its length.
+#
+# The natives map(iterable, f), filter(iterable, f) and take(iterable, n)
+# chain generators, lists and maps (their keys) in streams. Generators, for
+# in loops and streams only run on the interpreter.
+import itertools
+
+from lox.callable import LoxCallable
+from lox.error import LoxRuntimeError
+from lox.native import NativeObject, LoxList, LoxMap
+
+
+class LoxGenerator(NativeObject):
+    """Call of a generator function, run as it is iterated.
+
+    state -- current and global environments of the suspended body"""
+
+    def __init__(self, interpreter, function, environment):
+        self.interpreter = interpreter
+        self.function = function
+        self.state = (environment, function.globals or interpreter.global_env)
+        self.body = interpreter.generatebody(function.fundec)
+        self.running = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.running:
+            raise LoxRuntimeError(self.function.name, "Generator already running.")
+        interpreter = self.interpreter
+        saved = interpreter.current_env, interpreter.global_env
+        interpreter.current_env, interpreter.global_env = self.state
+        self.running = True
+        try:
+            return next(self.body)
+        finally:
+            self.running = False
+            self.state = interpreter.current_env, interpreter.global_env
+            interpreter.current_env, interpreter.global_env = saved
+
+    def __str__(self):
+        if self.function.name is None:
+            return "<generator>"
+        return "<generator: " + self.function.name.lexeme + ">"
+
+
+class LoxStream(NativeObject):
+    """Values of map, filter or take, computed as they are iterated."""
+
+    def __init__(self, name: str, values):
+        self.name = name
+        self.values = values
+
+    def __iter__(self):
+        return self.values
+
+    def __str__(self):
+        return "<stream: " + self.name + ">"
+
+
+iterables = (LoxGenerator, LoxStream, LoxList, LoxMap)
+
+
+def iterate(token, value):
+    """Python iterator over the values of a lox iterable."""
+    if not isinstance(value, iterables):
+        raise LoxRuntimeError(token, "Can only iterate over generators, streams, lists and maps.")
+    return iter(value)
+
+
+def mapping(interpreter, values, function):
+    for value in values:
+        yield function.call(interpreter, [value])
+
+
+def filtering(interpreter, values, function):
+    for value in values:
+        if interpreter.istruthy(function.call(interpreter, [value])):
+            yield value
+
+
+class Stream(LoxCallable):
+    """Native function making a stream of an iterable and a function."""
+
+    def __init__(self, name: str, values):
+        """values -- python generator function of the interpreter, the
+        iterator and the function"""
+        self.name = name
+        self.values = values
+
+    def arity(self) -> int:
+        return 2
+
+    def call(self, interpreter, arguments: list) -> object:
+        iterable, function = arguments
+        if not isinstance(function, LoxCallable) or function.arity() != 1:
+            raise LoxRuntimeError(None, self.name + "() expects a function of one argument.")
+        return LoxStream(self.name, self.values(interpreter, iterate(None, iterable), function))
+
+    def __str__(self):
+        return "<" + self.name + ": native function>"
+
+
+class Take(LoxCallable):
+    """take(iterable, n): the first n values, the rest is never computed."""
+
+    def arity(self) -> int:
+        return 2
+
+    def call(self, interpreter, arguments: list) -> object:
+        iterable, count = arguments
+        if type(count) not in (int, float) or count < 0 or count != int(count):
+            raise LoxRuntimeError(None, "take() expects a count.")
+        return LoxStream("take", itertools.islice(iterate(None, iterable), int(count)))
+
+    def __str__(self):
+        return "<take: native function>"
+
+
+def streams() -> dict:
+    """Native globals of the interpreter chaining iterables."""
+    return {"map": Stream("map", mapping), "filter": Stream("filter", filtering),
+            "take": Take()}
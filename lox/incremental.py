@@ -0,0 +1,201 @@
+# Incremental front end for editors: a source kept scanned, parsed and
+# resolved across text edits.
+#
+# The scanner only keeps a position and a line, so after an edit it resumes
+# at the end of the last token before the edit and stops as soon as it is
+# back on a position where the first scan resumed too: the tokens after it
+# are the same, only moved. Top level declarations are resolved on their own
+# (globals are not resolved), so only the declarations holding changed tokens
+# are parsed and resolved again, the others keep their tree and the depths
+# of their local variables.
+import bisect
+
+from lox.scanner import scan_token
+from lox.parser import Parser
+from lox.resolver import Resolver
+from lox.token import LoxToken
+from lox.tokentype import TokensDic as Tk
+from lox.error import LoxError
+from lox import api
+
+
+class Resolution:
+    """Depths of the local variables found by the resolver for a declaration."""
+
+    def __init__(self):
+        self.locals = {}
+
+    def resolve(self, expr, depth: int):
+        self.locals[expr] = depth
+
+
+class Declaration:
+    """Top level declaration of a document.
+
+    start, end -- range of its tokens
+    statement -- its tree, None if it does not parse
+    locals -- depths of its local variables
+    messages -- its parsing and resolution errors"""
+
+    def __init__(self, start: int, end: int, statement, locals: dict, messages: list):
+        self.start = start
+        self.end = end
+        self.statement = statement
+        self.locals = locals
+        self.messages = messages
+
+
+class Document:
+    """A lox source with its tokens, declarations and resolved locals,
+    updated by edit()."""
+
+    def __init__(self, source: str = ""):
+        self.source = ""
+        self.tokens = []
+        # source range of each token
+        self.offsets = []
+        self.ends = []
+        # scanning errors, with their offset
+        self.scanerrors = []
+        self.declarations = []
+        self.locals = {}
+        self.eof = LoxToken(Tk.EOF, "", "", 1)
+        self.edit(0, 0, source)
+
+    @property
+    def statements(self) -> list:
+        return [declaration.statement for declaration in self.declarations]
+
+    def errors(self) -> list:
+        """Scanning, parsing and resolution errors of the source."""
+        messages = [message for _, message in self.scanerrors]
+        for declaration in self.declarations:
+            messages.extend(declaration.messages)
+        return messages
+
+    def offset(self, line: int, column: int) -> int:
+        """Offset of a position given as editors do, from line 0 column 0."""
+        offset = 0
+        for _ in range(line):
+            offset = self.source.index("\n", offset) + 1
+        return offset + column
+
+    def program(self) -> api.Program:
+        """Program running the current source, CompileError if it has errors."""
+        errors = self.errors()
+        if errors:
+            raise api.CompileError(errors)
+        return api.Program(self.statements, dict(self.locals))
+
+    def edit(self, start: int, end: int, text: str):
+        """Replace the source from offset start to end with text."""
+        old = self.source
+        source = self.source = old[:start] + text + old[end:]
+        delta = len(text) - (end - start)
+        newlines = text.count("\n") - old.count("\n", start, end)
+        first, tail, scanned = self.rescan(source, start, start + len(text), delta)
+        # the tail is the same tokens, moved
+        shift = len(scanned[0]) - (tail - first)
+        moved = self.tokens[tail:]
+        if newlines:
+            for token in moved:
+                token.line += newlines
+        self.tokens[first:tail] = scanned[0]
+        self.offsets[first:] = scanned[1] + [offset + delta for offset in self.offsets[tail:]]
+        self.ends[first:] = scanned[2] + [offset + delta for offset in self.ends[tail:]]
+        self.eof.line = source.count("\n") + 1
+        self.reparse(first, first + len(scanned[0]), tail, shift, newlines)
+
+    def rescan(self, source: str, start: int, edited: int, delta: int):
+        """Scan the new source from the last token before the edit until it
+        resumes where the old scan did, past the edited text.
+
+        Return the index of the first token scanned again, of the first old
+        token kept after them, and the new tokens with their ranges."""
+        old_ends = self.ends
+        first = bisect.bisect_left(old_ends, start)
+        resume = old_ends[first - 1] if first > 0 else 0
+        positions = {'start': resume, 'current': resume,
+                     'line': source.count("\n", 0, resume) + 1}
+        tokens, offsets, ends, scanerrors = [], [], [], []
+        tail = len(self.tokens)
+        # the lines of the scanning errors after the edit would move: rare
+        # enough (an unterminated string) to scan to the end instead
+        resync = not any(offset >= start for offset, _ in self.scanerrors)
+        with LoxError.collecting() as messages:
+            while positions['current'] < len(source):
+                current = positions['current']
+                if resync and current >= edited:
+                    # the old scan resumed here: the next tokens are the same
+                    if current == delta:
+                        # it started here
+                        tail = 0
+                        break
+                    index = bisect.bisect_left(old_ends, current - delta)
+                    if index < len(old_ends) and old_ends[index] == current - delta:
+                        tail = index + 1
+                        break
+                count = len(tokens)
+                reported = len(LoxError.log)
+                scan_token(source, positions, tokens, [])
+                if len(tokens) > count:
+                    offsets.append(current)
+                    ends.append(positions['current'])
+                if len(LoxError.log) > reported:
+                    scanerrors.extend((current, message) for message in LoxError.log[reported:])
+        self.scanerrors = [error for error in self.scanerrors if error[0] < resume] + scanerrors
+        return first, tail, (tokens, offsets, ends)
+
+    def reparse(self, first: int, scannedend: int, tail: int, shift: int, newlines: int):
+        """Parse again the declarations holding the tokens first to
+        scannedend, reuse the declarations after them."""
+        declarations = self.declarations
+        # the declaration before may look ahead at the first changed token
+        # (an if looking for an else): it is parsed again as well
+        ends = [declaration.end for declaration in declarations]
+        index = bisect.bisect_right(ends, max(first - 1, 0))
+        start = declarations[index].start if index < len(declarations) else (
+            declarations[-1].end if declarations else 0)
+        # old declarations of the moved tail, by their new start, when all
+        # the declarations after them are kept too; the error messages quote
+        # lines and the token before the error: a declaration with errors is
+        # parsed again if they may change
+        reusable = {}
+        for position in range(len(declarations) - 1, index - 1, -1):
+            declaration = declarations[position]
+            if declaration.start < tail or (declaration.messages and (
+                    newlines or declaration.start == tail)):
+                break
+            reusable[declaration.start + shift] = position
+        parser = Parser(self.tokens + [self.eof])
+        parser.current = start
+        parsed = []
+        reused = len(declarations)
+        while not parser.is_at_end():
+            if parser.current >= scannedend and parser.current in reusable:
+                reused = reusable[parser.current]
+                break
+            parsed.append(self.parse(parser))
+        for declaration in declarations[index:reused]:
+            for expr in declaration.locals:
+                del self.locals[expr]
+        for declaration in declarations[reused:]:
+            declaration.start += shift
+            declaration.end += shift
+        self.declarations[index:reused] = parsed
+
+    def parse(self, parser: Parser) -> Declaration:
+        """Parse and resolve the declaration at the parser position."""
+        start = parser.current
+        resolution = Resolution()
+        with LoxError.collecting() as messages:
+            reported = len(LoxError.log)
+            statement = parser.declaration()
+            if parser.current == start:
+                # a declaration must consume something
+                parser.advance()
+            # a tree with errors may miss parts the resolver expects
+            if statement is not None and len(LoxError.log) == reported:
+                Resolver(resolution).resolve(statement)
+        self.locals.update(resolution.locals)
+        return Declaration(start, parser.current, statement, resolution.locals, messages)
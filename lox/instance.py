@@ -9,14 +9,14 @@ class LoxInstance():
         self.xclass = xclass
         self.propertymap = {}
 
-    def get_property(self, name: LoxToken) -> object:
+    def get_property(self, name: LoxToken, interpreter) -> object:
         # is it a property ?
         if name.lexeme in self.propertymap:
             return self.propertymap[name.lexeme]
         # or a class method ?
         method = self.xclass.findmethod(name)
         if method is not None:
-            return method.bind(self)
+            return method.bind(self, interpreter)
         if name.lexeme in self.xclass.methods:
             method = self.xclass.methods[name.lexeme]
 
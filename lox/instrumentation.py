@@ -0,0 +1,319 @@
+# Instrumentation hooks for the interpreter runtime
+import gc
+import sys
+import time
+import weakref
+
+from lox.environment import Environment
+from lox.instance import LoxInstance
+from lox.loxstring import LoxString
+from lox.native import LoxList, LoxMap
+from lox.error import BudgetExceeded, HeapLimitExceeded
+
+
+class AllocationCounter:
+    """Count the environments created by the interpreter during a run.
+
+    The counter swaps the interpreter allocation methods for counting ones,
+    an interpreter without counter pays nothing for it."""
+
+    def __init__(self):
+        self.environments = 0
+        self.reused_frames = 0
+
+    def attach(self, interpreter):
+        newenvironment = interpreter.newenvironment
+        newframe = interpreter.newframe
+
+        def counting_newenvironment(enclosing):
+            self.environments += 1
+            return newenvironment(enclosing)
+
+        def counting_newframe(fundec, closure):
+            if fundec.frames:
+                self.reused_frames += 1
+            return newframe(fundec, closure)
+
+        interpreter.newenvironment = counting_newenvironment
+        interpreter.newframe = counting_newframe
+
+    def reset(self):
+        self.environments = 0
+        self.reused_frames = 0
+
+    def report(self) -> str:
+        return "environments created: {}, call frames reused: {}".format(
+            self.environments, self.reused_frames)
+
+
+class ExecutionBudget:
+    """Limits of a run, to stop untrusted scripts deterministically.
+
+    Like the AllocationCounter, the budget swaps interpreter methods for
+    checking ones, only for the limits it is given; a limit over is raised
+    as a BudgetExceeded error with the line of the running statement. A
+    budget counts the run of one interpreter at a time."""
+
+    def __init__(self, steps: int = None, seconds: float = None,
+                 environments: int = None, depth: int = None, period: int = 1024):
+        """steps -- statements executed and expressions evaluated
+        seconds -- wall clock time of a run
+        environments -- environments created
+        depth -- nested blocks and function calls
+        period -- steps between two checks of the clock"""
+        self.steps = steps
+        self.seconds = seconds
+        self.environments = environments
+        self.depth = depth
+        self.period = period
+        self.reset()
+
+    def reset(self):
+        """Start a new run: counters to zero, the clock starts now."""
+        self.steps_done = 0
+        self.environments_created = 0
+        self.nesting = 0
+        self.statement = None
+        self.deadline = None
+        if self.seconds is not None:
+            self.deadline = time.perf_counter() + self.seconds
+        # steps counted down to the next checkpoint, out of window steps
+        self.window = self.countdown = self.nextcheck()
+
+    def nextcheck(self) -> int:
+        """Steps before the next checkpoint."""
+        if self.steps is None:
+            return self.period
+        if self.seconds is None:
+            return self.steps - self.steps_done + 1
+        return min(self.period, self.steps - self.steps_done + 1)
+
+    def checkpoint(self):
+        """Account the steps of the window, check steps and clock."""
+        self.steps_done += self.window - self.countdown
+        if self.steps is not None and self.steps_done > self.steps:
+            self.exceeded("more than {} steps".format(self.steps))
+        if self.deadline is not None and time.perf_counter() > self.deadline:
+            self.exceeded("more than {}s".format(self.seconds))
+        self.window = self.countdown = self.nextcheck()
+
+    def exceeded(self, limit: str):
+        line = self.statement.line if self.statement is not None else None
+        raise BudgetExceeded(limit, line)
+
+    def attach(self, interpreter):
+        budget = self
+        execute = interpreter.execute
+
+        if self.steps is None and self.seconds is None:
+            def locating_execute(statement):
+                # the running statement locates the errors
+                budget.statement = statement
+                return execute(statement)
+
+            interpreter.execute = locating_execute
+        else:
+            evaluate = interpreter.evaluate
+
+            def counting_execute(statement):
+                budget.statement = statement
+                budget.countdown -= 1
+                if budget.countdown <= 0:
+                    budget.checkpoint()
+                return execute(statement)
+
+            def counting_evaluate(expr):
+                budget.countdown -= 1
+                if budget.countdown <= 0:
+                    budget.checkpoint()
+                return evaluate(expr)
+
+            interpreter.execute = counting_execute
+            interpreter.evaluate = counting_evaluate
+
+        if self.environments is not None:
+            newenvironment = interpreter.newenvironment
+
+            def counting_newenvironment(enclosing):
+                budget.environments_created += 1
+                if budget.environments_created > budget.environments:
+                    budget.exceeded("more than {} environments".format(budget.environments))
+                return newenvironment(enclosing)
+
+            interpreter.newenvironment = counting_newenvironment
+
+        if self.depth is not None:
+            executeblock = interpreter.executeblock
+
+            def nesting_executeblock(statements, environment):
+                if budget.nesting >= budget.depth:
+                    budget.exceeded("more than {} nested blocks and calls".format(budget.depth))
+                budget.nesting += 1
+                try:
+                    return executeblock(statements, environment)
+                finally:
+                    budget.nesting -= 1
+
+            executebody = interpreter.executebody
+
+            def nesting_executebody(fundec, environment):
+                if budget.nesting >= budget.depth:
+                    budget.exceeded("more than {} nested blocks and calls".format(budget.depth))
+                budget.nesting += 1
+                try:
+                    return executebody(fundec, environment)
+                finally:
+                    budget.nesting -= 1
+
+            interpreter.executeblock = nesting_executeblock
+            interpreter.executebody = nesting_executebody
+            # the interpreter recursion is about 20 python frames per call,
+            # twice that with the budget methods
+            sys.setrecursionlimit(max(sys.getrecursionlimit(), 50 * self.depth + 1000))
+
+
+class HeapTracker:
+    """Count and size the runtime objects created by the interpreter.
+
+    Environments, functions (closures and bound methods), instances (by
+    class name), lists and maps, and strings built by concatenation are
+    tracked until they are collected. Sizes are measured when an object is
+    created, objects growing after (variables, fields, flattened strings)
+    are measured again every few allocations and by summary(); lists and
+    maps charge their growth as they grow. Over the limit, the garbage
+    cycles are collected and a HeapLimitExceeded error is raised if the
+    live objects still need more."""
+
+    def __init__(self, limit: int = None):
+        """limit -- bytes allowed for the live tracked objects"""
+        self.limit = limit
+        # id of each live object: kind, size, weak reference
+        self.live = {}
+        # kind: [count, bytes]
+        self.kinds = {}
+        self.size = 0
+        self.allocations = 0
+        self.nextmeasure = 1024
+
+    def attach(self, interpreter):
+        for factory, kind in (("newenvironment", "environment"),
+                              ("newfunction", "function"),
+                              ("newstring", "string")):
+            setattr(interpreter, factory, self.tracking(getattr(interpreter, factory), kind))
+        newinstance = interpreter.newinstance
+
+        def tracking_newinstance(xclass):
+            instance = newinstance(xclass)
+            self.track(instance, xclass.name)
+            return instance
+
+        interpreter.newinstance = tracking_newinstance
+        newnative = interpreter.newnative
+
+        def tracking_newnative(cls):
+            native = newnative(cls)
+            native.heap = self
+            self.track(native, cls.kind)
+            return native
+
+        interpreter.newnative = tracking_newnative
+
+    def tracking(self, factory, kind: str):
+        def tracking_factory(*args):
+            item = factory(*args)
+            self.track(item, kind)
+            return item
+        return tracking_factory
+
+    @staticmethod
+    def sizeof(item) -> int:
+        size = sys.getsizeof(item)
+        if type(item) is LoxString:
+            if item.flat is not None:
+                size += sys.getsizeof(item.flat)
+        elif type(item) is Environment:
+            size += sys.getsizeof(item._Environment__varmap)
+        elif type(item) is LoxInstance:
+            size += sys.getsizeof(item.propertymap)
+        elif type(item) is LoxList:
+            size += sys.getsizeof(item.items)
+        elif type(item) is LoxMap:
+            size += sys.getsizeof(item.entries)
+        else:
+            size += sys.getsizeof(item.__dict__)
+        return size
+
+    def track(self, item, kind: str):
+        key = id(item)
+        size = self.sizeof(item)
+        self.live[key] = (kind, size, weakref.ref(item, lambda ref: self.release(key)))
+        counts = self.kinds.get(kind)
+        if counts is None:
+            counts = self.kinds[kind] = [0, 0]
+        counts[0] += 1
+        counts[1] += size
+        self.size += size
+        self.allocations += 1
+        if self.allocations >= self.nextmeasure:
+            self.measure()
+        self.checklimit(kind)
+
+    def grow(self, item):
+        """Size again a tracked native object its methods added to."""
+        key = id(item)
+        kind, size, ref = self.live[key]
+        newsize = self.sizeof(item)
+        if newsize == size:
+            return
+        self.live[key] = (kind, newsize, ref)
+        self.kinds[kind][1] += newsize - size
+        self.size += newsize - size
+        self.checklimit(kind)
+
+    def checklimit(self, kind: str):
+        if self.limit is not None and self.size > self.limit:
+            # cycles (closures and their environments) may be garbage
+            gc.collect()
+            self.measure()
+            if self.size > self.limit:
+                raise HeapLimitExceeded(self.size, self.limit, kind)
+
+    def release(self, key: int):
+        kind, size, _ = self.live.pop(key)
+        counts = self.kinds[kind]
+        counts[0] -= 1
+        counts[1] -= size
+        self.size -= size
+
+    def measure(self):
+        """Size again all the live objects."""
+        kinds = {}
+        total = 0
+        for key, (kind, _, ref) in list(self.live.items()):
+            item = ref()
+            if item is None:
+                continue
+            size = self.sizeof(item)
+            self.live[key] = (kind, size, ref)
+            counts = kinds.get(kind)
+            if counts is None:
+                counts = kinds[kind] = [0, 0]
+            counts[0] += 1
+            counts[1] += size
+            total += size
+        self.kinds = kinds
+        self.size = total
+        # the cost of measuring stays proportional to the allocations
+        self.nextmeasure = self.allocations + max(1024, len(self.live))
+
+    def summary(self) -> dict:
+        """Count and bytes of the live objects by kind or class name."""
+        self.measure()
+        return {kind: tuple(counts) for kind, counts in self.kinds.items() if counts[0]}
+
+    def report(self) -> str:
+        summary = self.summary()
+        lines = ["heap: {} bytes".format(self.size)]
+        for kind, (count, size) in sorted(summary.items(), key=lambda item: -item[1][1]):
+            lines.append("  {}: {} objects, {} bytes".format(kind, count, size))
+        return "\n".join(lines)
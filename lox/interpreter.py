@@ -8,10 +8,15 @@ from lox.token import LoxToken
 from lox.tokentype import TokensDic as tk
 from lox.callable import LoxCallable, LoxFunction, LoxClass
 from lox.instance import LoxInstance
+from lox.loxstring import LoxString
 from lox.constants import LoxConstant
-from lox.error import OperandsError, InterpreterError, DivisionByZeroError, ReturnException, BreakException
+from lox.error import OperandsError, InterpreterError, DivisionByZeroError, ReturnException, BreakException, LoxRuntimeError
 from lox.astprinter import PrinterVisitor
-from lox.native import Clock
+from lox.native import NativeObject, builtins, newnative, wait
+from lox.generators import LoxGenerator, iterate, streams
+from lox.parallel import parallel
+from lox.output import OutputSink
+from lox.modules import importmodule
 import operator
 
 # Some python operator for all operations that do not require special process
@@ -27,38 +32,89 @@ op_dic = {
     tk.EQUAL_EQUAL: operator.eq
 }
 
+# Operations done on int operands without any further check
+int_op_dic = {
+    tk.GREATER: operator.gt,
+    tk.GREATER_EQUAL: operator.ge,
+    tk.LESS: operator.lt,
+    tk.LESS_EQUAL: operator.le,
+    tk.PLUS: operator.add,
+    tk.MINUS: operator.sub,
+    tk.STAR: operator.mul,
+    tk.BANG_EQUAL: operator.ne,
+    tk.EQUAL_EQUAL: operator.eq
+}
+
 
 class Interpreter(Visitor):
-    # Main environment
-    global_env = Environment()
-    locals = {}
 
-    def __init__(self):
+    def __init__(self, output: OutputSink = None):
+        """output -- sink of the print statements, buffered stdout by default"""
+        self.output = output if output is not None else OutputSink()
+        # Main environment, and depth of the resolved local variables
+        self.global_env = GlobalEnvironment()
+        self.locals = {}
         self.current_env = self.global_env
-        self.global_env.define("clock", Clock())
+        # values of the loop invariants of the running loop
+        self.invariants = {}
+        # runtime objects are all created through these, instrumentation
+        # swaps them
+        self.newenvironment = Environment
+        self.newfunction = LoxFunction
+        self.newinstance = LoxInstance
+        self.newstring = LoxString
+        self.newgenerator = LoxGenerator
+        self.newnative = newnative
+        # event loop running the coroutines of the async natives, when the
+        # interpreter runs in its own thread for an asyncio program
+        self.loop = None
+        # modules imported (see lox.modules) by path, directory of the
+        # relative import paths
+        self.modules = {}
+        self.directory = ""
+        for name, value in {**builtins(), **streams(), **parallel()}.items():
+            self.global_env.define(name, value)
 
     def istruthy(self, value: object) -> bool:
-        # I add 0 as a False value (nostalgia)
+        # 0 is true: numbers used to be floats only and 0.0 was never False
         if value is None:
             return False
         if value is False:
             return False
-        if value is 0:
-            return False
-        if type(value) is bool:
-            return value
         # everything else is true
         return True
 
+    def stringify(self, value: object) -> str:
+        """Lox representation of a value."""
+        if value is None:
+            return "nil"
+        if value is True:
+            return "true"
+        if value is False:
+            return "false"
+        text = str(value)
+        # integral floats print as integers
+        if type(value) is float and text.endswith(".0"):
+            return text[:-2]
+        return text
+
     def check_number_operand(self, op: LoxToken, number: object, optype: str):
         if isinstance(number, (int, float, complex)):
             return
         raise OperandsError(op, optype, number)
 
-    def check_number_operands(self, op: LoxToken, left: object, right: object, optype: tuple):
-        if isinstance(left, optype) and isinstance(right, optype):
+    def check_number_operands(self, op: LoxToken, left: object, right: object):
+        if isinstance(left, (int, float, complex)) and isinstance(right, (int, float, complex)):
+            return
+        raise OperandsError(op, "two numbers", left, right)
+
+    def check_comparison_operands(self, op: LoxToken, left: object, right: object):
+        # numbers compare with numbers, strings with strings
+        if isinstance(left, (int, float, complex)) and isinstance(right, (int, float, complex)):
             return
-        raise OperandsError(op, optype, left, right)
+        if isinstance(left, (str, LoxString)) and isinstance(right, (str, LoxString)):
+            return
+        raise OperandsError(op, "two numbers or two strings", left, right)
 
     def check_division_by_zero(self, op: LoxToken, left: object, right: object):
         if right == 0:
@@ -75,13 +131,14 @@ class Interpreter(Visitor):
 
     def visitassign(self, expr: Assign) -> object:
         var_value = self.evaluate(expr.value)
-        distance = 0
-        if expr in self.locals:
-            distance = self.locals[expr]
-        if distance:
-            self.current_env.assignat(distance, expr.name, var_value)
+        cell = expr.cell
+        if cell is not None and cell.owner is self.global_env:
+            cell.value = var_value
+        elif expr in self.locals:
+            self.current_env.assignat(self.locals[expr], expr.name, var_value)
         else:
             self.global_env.assign(expr.name, var_value)
+            expr.cell = self.global_env.cell(expr.name)
         return var_value
 
     def visitcall(self, expr: Call) -> object:
@@ -89,26 +146,42 @@ class Interpreter(Visitor):
         resolved_args = []
         for arg in expr.arguments:
             resolved_args.append(self.evaluate(arg))
+        # the callee and its arity are only checked when the callee changes,
+        # bound methods are new functions each time but share a declaration
+        if type(callee) is LoxFunction:
+            if expr.cache is not callee.fundec:
+                self.checkcallee(expr, callee, callee.fundec)
+        elif expr.cache is not callee:
+            self.checkcallee(expr, callee, callee)
+        return callee.invoke(self, resolved_args)
+
+    def checkcallee(self, expr: Call, callee: object, key: object):
+        """Validate a callee for a call site and cache it."""
         if not isinstance(callee, LoxCallable):
             raise InterpreterError(expr.paren, "can only call functions.")
-        if len(resolved_args) is not callee.arity():
-            raise InterpreterError(expr.paren, "expected " +
-                                   callee.arity() + " arguments. " + len(resolved_args) + " were provided.")
-        try:
-            return callee.call(self, resolved_args)
-        except ReturnException as exc:
-            return exc.value
-        finally:
-            pass
+        arity = callee.arity()
+        if len(expr.arguments) != arity:
+            raise InterpreterError(expr.paren, "expected {} arguments. {} were provided.".format(
+                arity, len(expr.arguments)))
+        # the arity of a cached callee never changes
+        expr.cache = key
+
+    def wait(self, coroutine) -> object:
+        """Result of the coroutine of an async native: under run_async the
+        thread of the script blocks meanwhile and the other scripts of the
+        event loop go on."""
+        return wait(coroutine, self.loop)
 
     def visitfunctionexp(self, expr: FunctionExp) -> object:
         # Create a callable function from the declaration
-        return LoxFunction(None, expr, self.current_env)
+        return self.newfunction(None, expr, self.current_env, self.global_env)
 
     def visitget(self, expr: Get) -> object:
         getobj = self.evaluate(expr.getobject)
         if isinstance(getobj, LoxInstance):
-            return getobj.get_property(expr.name)
+            return getobj.get_property(expr.name, self)
+        if isinstance(getobj, NativeObject):
+            return getobj.get_property(expr.name, self)
         raise InterpreterError(
             expr.name, "Properties are allowed on instances only.")
 
@@ -134,52 +207,86 @@ class Interpreter(Visitor):
         return self.evaluate(expr.right)
 
     def visitgrouping(self, expr: Grouping) -> object:
-        return self.evaluate(expr.expr)
+        return self.evaluate(expr.expression)
+
+    def visitinvariant(self, expr: Invariant) -> object:
+        # evaluated on first use only, errors are raised as without hoisting
+        if expr in self.invariants:
+            return self.invariants[expr]
+        value = self.evaluate(expr.expression)
+        self.invariants[expr] = value
+        return value
 
     def visitunary(self, expr: Unary) -> object:
         right = self.evaluate(expr.right)
         if expr.operator.type == tk.MINUS:
-            self.check_number_operand(expr.operator, expr.operator.type, right)
+            self.check_number_operand(expr.operator, right, "a number")
             return -right
         elif expr.operator.type == tk.BANG:
-            return not right
+            return not self.istruthy(right)
 
-    def visitbinary(self, expr: Binary) -> object:
+    def visitnumericunary(self, expr: NumericUnary) -> object:
+        # the operand is proven to pass check_number_operand
+        return -self.evaluate(expr.right)
+
+    def visitnumericbinary(self, expr: NumericBinary) -> object:
+        # the operands are proven to pass check_number_operands
+        left = self.evaluate(expr.left)
         right = self.evaluate(expr.right)
+        if expr.operator.type == tk.SLASH:
+            self.check_division_by_zero(expr.operator, left, right)
+        result = expr.function(left, right)
+        # out of the double exact range int operations fall back to float
+        if type(result) is int and not -LoxConstant.max_int <= result <= LoxConstant.max_int \
+                and type(left) is int and type(right) is int:
+            return float(result)
+        return result
+
+    def visitbinary(self, expr: Binary) -> object:
         left = self.evaluate(expr.left)
+        right = self.evaluate(expr.right)
         op_type = expr.operator.type
+        # Fast path for int operands (loop counters, indexes)
+        if type(left) is int and type(right) is int:
+            int_op = int_op_dic.get(op_type)
+            if int_op is not None:
+                result = int_op(left, right)
+                # out of the double exact range we fall back to float
+                if type(result) is int and not -LoxConstant.max_int <= result <= LoxConstant.max_int:
+                    return float(result)
+                return result
         # Arithmetic operations
         if op_type == tk.MINUS:
-            self.check_number_operands(
-                expr.operator, left, right, (int, float, complex))
+            self.check_number_operands(expr.operator, left, right)
             return left - right
         elif op_type == tk.STAR:
-            self.check_number_operands(
-                expr.operator, left, right, (int, float, complex))
+            self.check_number_operands(expr.operator, left, right)
             return left * right
         elif op_type == tk.SLASH:
-            self.check_number_operands(
-                expr.operator, left, right, (int, float, complex))
+            self.check_number_operands(expr.operator, left, right)
             self.check_division_by_zero(expr.operator, left, right)
             return left / right
         elif op_type == tk.PLUS:
-            # Just for learning purpose as Python would handle that
-            if type(left) is str and type(right) is str:
-                return left + right
+            # Strings are concatenated lazily in a rope, flattened when needed
+            if isinstance(left, (str, LoxString)) and isinstance(right, (str, LoxString)):
+                return self.newstring(left, right)
             # Notice that the below test will work if right or left is True
             elif isinstance(left, (int, float)) and isinstance(right, (int, float)):
                 return left + right
             # Mixed type
-            elif type(left) is str and isinstance(right, (int, float)):
-                return left + str(right)
-            elif type(right) is str and isinstance(left, (int, float)):
-                return str(left) + right
+            elif isinstance(left, (str, LoxString)) and isinstance(right, (int, float)):
+                return self.newstring(left, self.stringify(right))
+            elif isinstance(right, (str, LoxString)) and isinstance(left, (int, float)):
+                return self.newstring(self.stringify(left), right)
         # Comparison operators: python operator are matching lox requirements
         # Notice that we follow IEEE 754 with operator equal, as NaN != NaN in python
         # We diverge here a bit from the Java isequal
-        elif op_type in (tk.GREATER, tk.GREATER_EQUAL, tk.LESS, tk.LESS_EQUAL, tk.BANG_EQUAL, tk.EQUAL_EQUAL):
-            self.check_number_operands(
-                expr.operator, left, right, (int, float, complex, str))
+        elif op_type in (tk.GREATER, tk.GREATER_EQUAL, tk.LESS, tk.LESS_EQUAL):
+            self.check_comparison_operands(expr.operator, left, right)
+            operator_function = op_dic[op_type]
+            return operator_function(left, right)
+        # Any values can be compared for equality (nil, instances...)
+        elif op_type in (tk.BANG_EQUAL, tk.EQUAL_EQUAL):
             operator_function = op_dic[op_type]
             return operator_function(left, right)
         # No matches
@@ -192,8 +299,14 @@ class Interpreter(Visitor):
             return self.global_env.get(name)
 
     def visitvariable(self, expr: Variable) -> object:
-        return self.lookupvariable(expr.name, expr)
-        # return self.current_env.get(expr.name) -- removed for resolver
+        # a global read by this site before: its cell
+        cell = expr.cell
+        if cell is not None and cell.owner is self.global_env:
+            return cell.value
+        if expr in self.locals:
+            return self.current_env.getat(self.locals[expr], expr.name)
+        cell = expr.cell = self.global_env.cell(expr.name)
+        return cell.value
 
     def visitthis(self, expr: This) -> object:
         return self.lookupvariable(expr.keyword, expr)
@@ -207,7 +320,7 @@ class Interpreter(Visitor):
         inst = self.current_env.getat(distance-1, tk.lexeme_from_type[tk.THIS])
         method = superclass.findmethod(expr.method)
         if method is not None:
-            return method.bind(inst)
+            return method.bind(inst, self)
         else:
             raise InterpreterError(
                 expr.name, "Properties can only be set on instances.")
@@ -218,8 +331,23 @@ class Interpreter(Visitor):
     # -------------------------
     #
 
+    def newframe(self, fundec: FunctionExp, closure: Environment) -> Environment:
+        """Call environment for a function no closure can capture."""
+        try:
+            frame = fundec.frames.pop()
+        except IndexError:
+            return self.newenvironment(closure)
+        frame.reset(closure)
+        return frame
+
     def visitblock(self, blockstmt: Block):
-        self.executeblock(blockstmt.statements, Environment(self.current_env))
+        if blockstmt.hasdeclarations:
+            self.executeblock(blockstmt.statements,
+                              self.newenvironment(self.current_env))
+        else:
+            # nothing declared, the resolver did not count a scope for it
+            for statement in blockstmt.statements:
+                self.execute(statement)
 
     def visitbreak(self, breakstmt: Break):
         raise BreakException(breakstmt.keyword)
@@ -233,13 +361,13 @@ class Interpreter(Visitor):
                     classstmt.name, "Superclass must be a class.")
         self.current_env.define(classstmt.name.lexeme, None)
         if superclass:
-            self.current_env = Environment(self.current_env)
+            self.current_env = self.newenvironment(self.current_env)
             self.current_env.define(tk.lexeme_from_type[tk.SUPER], superclass)
         methods = []
         for method in classstmt.methods:
             # fixme
-            methods.append(LoxFunction(
-                method.name, method, self.current_env))
+            methods.append(self.newfunction(
+                method.name, method, self.current_env, self.global_env))
         lxclass = LoxClass(classstmt.name.lexeme, superclass, methods)
         if superclass:
             self.current_env = self.current_env.enclosing
@@ -250,11 +378,72 @@ class Interpreter(Visitor):
 
     def visitfunction(self, function: Function):
         # Create a callable function from the declaration
-        callable = LoxFunction(
-            function.funcexp.name, function.funcexp, self.current_env)
+        callable = self.newfunction(
+            function.funcexp.name, function.funcexp, self.current_env, self.global_env)
         # Put the callable in the environment: how simple, it seems !
         self.current_env.define(function.funcexp.name.lexeme, callable)
 
+    def visitfor(self, forstmt: For):
+        previous_env = self.current_env
+        previous_invariants = self.invariants
+        self.invariants = {}
+        # one environment for the loop variables, as the desugared while loop
+        self.current_env = self.newenvironment(previous_env)
+        try:
+            if forstmt.initializer is not None:
+                self.execute(forstmt.initializer)
+            body = forstmt.body
+            condition = forstmt.condition
+            increment = forstmt.increment
+            if isinstance(body, Block) and not body.captured:
+                # no closure can see an iteration: reuse the body environment
+                statements = body.statements
+                if body.hasdeclarations:
+                    body_env = self.newenvironment(self.current_env)
+                else:
+                    body_env = self.current_env
+                while self.istruthy(self.evaluate(condition)):
+                    self.executeblock(statements, body_env)
+                    if increment is not None:
+                        self.evaluate(increment)
+            else:
+                while self.istruthy(self.evaluate(condition)):
+                    self.execute(body)
+                    if increment is not None:
+                        self.evaluate(increment)
+        except BreakException as exc:
+            pass
+        finally:
+            self.current_env = previous_env
+            self.invariants = previous_invariants
+
+    def visitforin(self, forin: ForIn):
+        values = iterate(forin.name, self.evaluate(forin.iterable))
+        previous_env = self.current_env
+        # one environment for the loop variable, as the for loop variables
+        environment = self.current_env = self.newenvironment(previous_env)
+        name = forin.name.lexeme
+        body = forin.body
+        try:
+            if isinstance(body, Block) and not body.captured:
+                # no closure can see an iteration: reuse the body environment
+                statements = body.statements
+                if body.hasdeclarations:
+                    body_env = self.newenvironment(environment)
+                else:
+                    body_env = environment
+                for value in values:
+                    environment.define(name, value)
+                    self.executeblock(statements, body_env)
+            else:
+                for value in values:
+                    environment.define(name, value)
+                    self.execute(body)
+        except BreakException as exc:
+            pass
+        finally:
+            self.current_env = previous_env
+
     def visitif(self, ifstmt: Stmt):
         if self.istruthy(self.evaluate(ifstmt.condition)):
             self.execute(ifstmt.thenbranch)
@@ -262,13 +451,19 @@ class Interpreter(Visitor):
             if ifstmt.elsebranch is not None:
                 self.execute(ifstmt.elsebranch)
 
+    def visitimport(self, importstmt: Import):
+        importmodule(self, importstmt.keyword, importstmt.path.literal)
+
     def visitprint(self, printstmt: Print):
-        print(str(self.evaluate(printstmt.expression)))
+        self.output.writeline(self.stringify(
+            self.evaluate(printstmt.expression)))
 
     def visitreturn(self, returnstmt: Return):
         returnvalue = None
         if returnstmt.value is not None:
             returnvalue = self.evaluate(returnstmt.value)
+        if returnstmt.last:
+            return returnvalue
         raise ReturnException(returnvalue)
 
     def visitvar(self, varstmt: Var):
@@ -277,15 +472,24 @@ class Interpreter(Visitor):
             value = self.evaluate(varstmt.initializer)
         self.current_env.define(varstmt.name.lexeme, value)
 
+    def visityield(self, yieldstmt: Yield):
+        # only reached through execute by a misplaced yield the resolver
+        # reported: generator bodies run their yields in genyield
+        raise InterpreterError(yieldstmt.keyword, "Cannot yield outside of a generator.")
+
     def visitwhile(self, whilestmt: While):
+        previous_invariants = self.invariants
+        self.invariants = {}
         try:
             while self.istruthy(self.evaluate(whilestmt.condition)):
                 self.execute(whilestmt.body)
         except BreakException as exc:
             pass
+        finally:
+            self.invariants = previous_invariants
 
     def execute(self, statement: Stmt):
-        statement.accept(self)
+        return statement.accept(self)
 
     def resolve(self, expr: Expr, depth: int):
         self.locals[expr] = depth
@@ -301,6 +505,119 @@ class Interpreter(Visitor):
         finally:
             self.current_env = previous_env
 
+    def executebody(self, fundec: FunctionExp, environment: Environment) -> object:
+        """Run the body of a function call, return the value of its last
+        statement when it is a return: only the other returns raise."""
+        previous_env = self.current_env
+        self.current_env = environment
+        try:
+            for statement in fundec.statements:
+                self.execute(statement)
+            if fundec.result is not None:
+                return self.execute(fundec.result)
+            return None
+        finally:
+            self.current_env = previous_env
+
+    def executein(self, global_env: GlobalEnvironment, fundec: FunctionExp,
+                  environment: Environment) -> object:
+        """Run the body of a function defined in other globals (a module)."""
+        previous_globals = self.global_env
+        self.global_env = global_env
+        try:
+            return self.executebody(fundec, environment)
+        finally:
+            self.global_env = previous_globals
+
+    #
+    # -------------------------
+    # Generator bodies
+    # -------------------------
+    #
+    # The body of a generator function runs as a python generator: the
+    # statements holding a yield run through the gen methods, yielding up to
+    # LoxGenerator, the others through execute. No finally clause restores
+    # the environment, LoxGenerator does it each time the body is suspended:
+    # a generator dropped while suspended must leave the interpreter alone.
+    # Loops holding a yield have no hoisted invariants (lox.invariant).
+
+    def generatebody(self, fundec: FunctionExp):
+        try:
+            yield from self.generate(fundec.body)
+        except ReturnException:
+            pass
+
+    def generate(self, statements: List[Stmt]):
+        for statement in statements:
+            if statement.yields:
+                # through genstatement, which instrumentation may swap as
+                # execute
+                yield from self.genstatement(statement)
+            else:
+                self.execute(statement)
+
+    def genstatement(self, statement: Stmt):
+        if statement.yields:
+            yield from self.generators[type(statement)](self, statement)
+        else:
+            self.execute(statement)
+
+    def genblock(self, blockstmt: Block):
+        if not blockstmt.hasdeclarations:
+            yield from self.generate(blockstmt.statements)
+            return
+        previous_env = self.current_env
+        self.current_env = self.newenvironment(previous_env)
+        yield from self.generate(blockstmt.statements)
+        self.current_env = previous_env
+
+    def genfor(self, forstmt: For):
+        previous_env = self.current_env
+        self.current_env = self.newenvironment(previous_env)
+        try:
+            if forstmt.initializer is not None:
+                self.execute(forstmt.initializer)
+            while self.istruthy(self.evaluate(forstmt.condition)):
+                yield from self.genstatement(forstmt.body)
+                if forstmt.increment is not None:
+                    self.evaluate(forstmt.increment)
+        except BreakException:
+            pass
+        self.current_env = previous_env
+
+    def genforin(self, forin: ForIn):
+        values = iterate(forin.name, self.evaluate(forin.iterable))
+        previous_env = self.current_env
+        environment = self.current_env = self.newenvironment(previous_env)
+        try:
+            for value in values:
+                environment.define(forin.name.lexeme, value)
+                yield from self.genstatement(forin.body)
+        except BreakException:
+            pass
+        self.current_env = previous_env
+
+    def genif(self, ifstmt: If):
+        if self.istruthy(self.evaluate(ifstmt.condition)):
+            yield from self.genstatement(ifstmt.thenbranch)
+        elif ifstmt.elsebranch is not None:
+            yield from self.genstatement(ifstmt.elsebranch)
+
+    def genwhile(self, whilestmt: While):
+        previous_env = self.current_env
+        try:
+            while self.istruthy(self.evaluate(whilestmt.condition)):
+                yield from self.genstatement(whilestmt.body)
+        except BreakException:
+            pass
+        self.current_env = previous_env
+
+    def genyield(self, yieldstmt: Yield):
+        yield self.evaluate(yieldstmt.value)
+
+    generators = {Block: genblock, For: genfor, ForIn: genforin, If: genif,
+                  While: genwhile, Yield: genyield}
+
     def interpret(self, statements: List[Stmt]) -> object:
         try:
             astprinter = PrinterVisitor()
@@ -309,6 +626,11 @@ class Interpreter(Visitor):
                     # print(astprinter.print(statement))
                     self.execute(statement)
                 else:
-                    print("None statement, error detected.")
-        except InterpreterError as error:
-            print("error: ", error)
+                    self.output.writeline("None statement, error detected.")
+        except (InterpreterError, LoxRuntimeError) as error:
+            self.output.writeline("error:  " + str(error))
+        except RecursionError:
+            # python ran out of stack before any budget depth limit
+            self.output.writeline("error:  Stack overflow.")
+        finally:
+            self.output.flush()
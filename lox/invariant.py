@@ -0,0 +1,270 @@
+# Loop invariant hoisting, run by the resolver on each resolved loop
+from lox.visitor import Visitor
+from lox.expr import Expr, Binary, Unary, Logical, Grouping, Invariant
+from lox.stmt import Stmt
+
+
+class LoopEffects(Visitor):
+    """Collect what a loop may change while it runs.
+
+    changing -- names assigned or declared in the loop
+    hascall -- the loop calls something, so any code can run"""
+
+    def __init__(self):
+        self.changing = set()
+        self.hascall = False
+
+    def collect(self, item):
+        if item is not None:
+            item.accept(self)
+
+    def visitassign(self, assign):
+        self.changing.add(assign.name.lexeme)
+        self.collect(assign.value)
+
+    def visitbinary(self, binary):
+        self.collect(binary.left)
+        self.collect(binary.right)
+
+    def visitcall(self, call):
+        self.hascall = True
+
+    def visitfunctionexp(self, functionexp):
+        # the body only runs if called
+        pass
+
+    def visitget(self, get):
+        self.collect(get.getobject)
+
+    def visitgrouping(self, grouping):
+        self.collect(grouping.expression)
+
+    def visitliteral(self, literal):
+        pass
+
+    def visitlogical(self, logical):
+        self.collect(logical.left)
+        self.collect(logical.right)
+
+    def visitset(self, var_set):
+        self.collect(var_set.setobject)
+        self.collect(var_set.value)
+
+    def visitsuper(self, var_super):
+        pass
+
+    def visitthis(self, this):
+        pass
+
+    def visitunary(self, unary):
+        self.collect(unary.right)
+
+    def visitvariable(self, variable):
+        pass
+
+    def visitblock(self, block):
+        for statement in block.statements:
+            self.collect(statement)
+
+    def visitbreak(self, var_break):
+        pass
+
+    def visitfunction(self, function):
+        self.changing.add(function.funcexp.name.lexeme)
+
+    def visitclass(self, var_class):
+        self.changing.add(var_class.name.lexeme)
+
+    def visitexpression(self, expression):
+        self.collect(expression.expression)
+
+    def visitfor(self, var_for):
+        self.collect(var_for.initializer)
+        self.collect(var_for.condition)
+        self.collect(var_for.increment)
+        self.collect(var_for.body)
+
+    def visitforin(self, forin):
+        # the iteration may run a generator
+        self.hascall = True
+
+    def visitif(self, var_if):
+        self.collect(var_if.condition)
+        self.collect(var_if.thenbranch)
+        self.collect(var_if.elsebranch)
+
+    def visitimport(self, var_import):
+        # the module runs on the first use of its names
+        self.hascall = True
+
+    def visitprint(self, print):
+        self.collect(print.expression)
+
+    def visitreturn(self, var_return):
+        self.collect(var_return.value)
+
+    def visitvar(self, var):
+        self.changing.add(var.name.lexeme)
+        self.collect(var.initializer)
+
+    def visitwhile(self, var_while):
+        self.collect(var_while.condition)
+        self.collect(var_while.body)
+
+    def visityield(self, var_yield):
+        # any code can run while the generator is suspended
+        self.hascall = True
+
+
+class InvariantHoister(Visitor):
+    """Wrap the loop invariant expressions of a loop in Invariant nodes.
+
+    An expression is invariant when the loop holds no call (no user code can
+    run behind its back) and it only reads variables the loop neither assigns
+    nor declares. The interpreter evaluates an Invariant once per loop run.
+    Expression visitors return True for an invariant expression, the parent
+    wraps its invariant children only when it is not invariant itself."""
+
+    # hoisting a literal or a variable read would not save anything
+    compound = (Binary, Unary, Logical, Grouping)
+
+    def __init__(self):
+        self.changing = set()
+
+    def hoist(self, loop: Stmt):
+        effects = LoopEffects()
+        effects.collect(loop)
+        if effects.hascall:
+            return
+        self.changing = effects.changing
+        loop.accept(self)
+
+    def isinvariant(self, expr: Expr) -> bool:
+        return expr.accept(self)
+
+    def wrap(self, expr: Expr, invariant: bool) -> Expr:
+        if invariant and isinstance(expr, self.compound):
+            return Invariant(expr)
+        return expr
+
+    def hoistexpr(self, expr: Expr) -> Expr:
+        if expr is None:
+            return None
+        return self.wrap(expr, self.isinvariant(expr))
+
+    def hoiststmt(self, stmt: Stmt):
+        if stmt is not None:
+            stmt.accept(self)
+
+    def visitassign(self, assign):
+        assign.value = self.hoistexpr(assign.value)
+        return False
+
+    def visitbinary(self, binary):
+        left = self.isinvariant(binary.left)
+        right = self.isinvariant(binary.right)
+        if left and right:
+            return True
+        binary.left = self.wrap(binary.left, left)
+        binary.right = self.wrap(binary.right, right)
+        return False
+
+    def visitcall(self, call):
+        return False
+
+    def visitfunctionexp(self, functionexp):
+        return False
+
+    def visitget(self, get):
+        get.getobject = self.hoistexpr(get.getobject)
+        return False
+
+    def visitgrouping(self, grouping):
+        return self.isinvariant(grouping.expression)
+
+    def visitinvariant(self, invariant):
+        return self.isinvariant(invariant.expression)
+
+    def visitliteral(self, literal):
+        return True
+
+    def visitlogical(self, logical):
+        left = self.isinvariant(logical.left)
+        right = self.isinvariant(logical.right)
+        if left and right:
+            return True
+        logical.left = self.wrap(logical.left, left)
+        logical.right = self.wrap(logical.right, right)
+        return False
+
+    def visitset(self, var_set):
+        var_set.setobject = self.hoistexpr(var_set.setobject)
+        var_set.value = self.hoistexpr(var_set.value)
+        return False
+
+    def visitsuper(self, var_super):
+        return False
+
+    def visitthis(self, this):
+        return False
+
+    def visitunary(self, unary):
+        right = self.isinvariant(unary.right)
+        if right:
+            return True
+        unary.right = self.wrap(unary.right, right)
+        return False
+
+    def visitvariable(self, variable):
+        return variable.name.lexeme not in self.changing
+
+    def visitblock(self, block):
+        for statement in block.statements:
+            self.hoiststmt(statement)
+
+    def visitbreak(self, var_break):
+        pass
+
+    def visitfunction(self, function):
+        pass
+
+    def visitclass(self, var_class):
+        pass
+
+    def visitexpression(self, expression):
+        expression.expression = self.hoistexpr(expression.expression)
+
+    def visitfor(self, var_for):
+        self.hoiststmt(var_for.initializer)
+        var_for.condition = self.hoistexpr(var_for.condition)
+        var_for.increment = self.hoistexpr(var_for.increment)
+        self.hoiststmt(var_for.body)
+
+    def visitif(self, var_if):
+        var_if.condition = self.hoistexpr(var_if.condition)
+        self.hoiststmt(var_if.thenbranch)
+        self.hoiststmt(var_if.elsebranch)
+
+    def visitforin(self, forin):
+        # not reached: LoopEffects takes a for in loop for a call
+        pass
+
+    def visitimport(self, var_import):
+        pass
+
+    def visitprint(self, print):
+        print.expression = self.hoistexpr(print.expression)
+
+    def visitreturn(self, var_return):
+        var_return.value = self.hoistexpr(var_return.value)
+
+    def visitvar(self, var):
+        var.initializer = self.hoistexpr(var.initializer)
+
+    def visitwhile(self, var_while):
+        var_while.condition = self.hoistexpr(var_while.condition)
+        self.hoiststmt(var_while.body)
+
+    def visityield(self, var_yield):
+        # not reached: LoopEffects takes a yield for a call
+        pass
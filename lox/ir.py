@@ -0,0 +1,475 @@
+# Intermediate representation of a resolved lox program
+#
+#     module = lox.ir.lower(api.compile(source).statements)
+#     print(lox.ir.dump(module))
+#
+# Each function is a Code: numbered slots (parameters first, then the cells
+# of the variables it uses from enclosing functions, then its variables and
+# temporaries) and basic blocks of three address instructions ending with one
+# terminator. Variables captured by closures live in cells (one item lists)
+# created when their declaration runs, so each run of a block gets its own;
+# closures receive the cells they use when they are created. Globals are read
+# and written by name.
+#
+# lox.passes optimizes the blocks, lox.vm runs them.
+from lox.visitor import Visitor
+from lox.expr import Get, Variable
+from lox.stmt import Function as FunctionStmt
+from lox.tokentype import TokensDic as Tk
+from lox.scopes import Scopes
+from lox.error import Diagnostic
+from lox import api
+
+# terminators, the other instructions fall through
+terminators = {"JUMP", "BRANCH", "GUARD", "RETURN", "BREAK"}
+# instructions without effects but their destination
+pure = {"MOVE", "NEWCELL", "LOADCELL", "NOT", "EQUAL", "CLOSURE"}
+
+
+class Const:
+    """Constant operand."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: object):
+        self.value = value
+
+    def __repr__(self):
+        return repr(self.value)
+
+
+NIL = Const(None)
+
+
+class Instr:
+    """Instruction: op, destination slot (or None), operands (slot numbers or
+    Const) and what else the op needs (tokens for the errors, blocks...)."""
+
+    __slots__ = ("op", "dest", "args", "extra")
+
+    def __init__(self, op: str, dest: int = None, args: list = (), extra: object = None):
+        self.op = op
+        self.dest = dest
+        self.args = list(args)
+        self.extra = extra
+
+    def uses(self) -> list:
+        return [arg for arg in self.args if type(arg) is int]
+
+    def __repr__(self):
+        args = ", ".join("r{}".format(arg) if type(arg) is int else repr(arg) for arg in self.args)
+        text = self.op + " " + args
+        name = getattr(self.extra, "lexeme", self.extra)
+        if type(name) is str:
+            text += " " + name
+        if self.dest is not None:
+            text = "r{} = {}".format(self.dest, text)
+        if self.op in ("JUMP", "BRANCH", "GUARD"):
+            text += " -> " + ", ".join("b{}".format(block.index) for block in self.targets())
+        return text
+
+    def targets(self) -> list:
+        """Blocks a terminator may go to."""
+        if self.op == "JUMP":
+            return [self.extra]
+        if self.op == "BRANCH":
+            return list(self.extra)
+        if self.op == "GUARD":
+            return list(self.extra[1:])
+        return []
+
+
+class Block:
+    """Basic block.
+
+    handler -- exit of the innermost loop around the block: a break raised
+               by a called function leaves it (as in the interpreter)"""
+
+    def __init__(self, handler: "Block" = None):
+        self.instrs = []
+        self.term = None
+        self.handler = handler
+        self.index = 0
+
+    def successors(self) -> list:
+        successors = self.term.targets() if self.term is not None else []
+        if self.handler is not None:
+            successors.append(self.handler)
+        return successors
+
+
+class Code:
+    """A lox function (or the top level code).
+
+    params -- number of lox parameters
+    method -- a method: slot 0 is 'this', the parameters follow
+    free -- number of cells received from the enclosing functions, in the
+            slots after the parameters
+    cells -- parameter slots replaced by a cell on entry"""
+
+    def __init__(self, name: str, params: int, method: bool = False):
+        self.name = name
+        self.params = params
+        self.method = method
+        self.free = 0
+        self.cells = []
+        self.slots = self.nargs
+        self.blocks = []
+
+    @property
+    def nargs(self) -> int:
+        return self.params + (1 if self.method else 0)
+
+    def newslot(self) -> int:
+        self.slots += 1
+        return self.slots - 1
+
+    def newblock(self, handler: Block = None) -> Block:
+        block = Block(handler)
+        self.blocks.append(block)
+        return block
+
+    def number(self):
+        """Number the blocks in their order, after passes changed them."""
+        for index, block in enumerate(self.blocks):
+            block.index = index
+
+    def instructions(self):
+        for block in self.blocks:
+            yield from block.instrs
+            yield block.term
+
+
+class Module:
+    """Lowered program: the top level code and the code of each function."""
+
+    def __init__(self, main: Code, codes: dict):
+        self.main = main
+        self.codes = codes
+
+    def allcodes(self) -> list:
+        return [self.main] + list(self.codes.values())
+
+
+class Lowering(Visitor):
+    """Build the Code of the top level statements and of every function."""
+
+    def __init__(self, scopes: Scopes):
+        self.scopes = scopes
+        self.codes = {}
+        # slot of each binding in the current code
+        self.slots = {}
+        self.code = None
+        self.block = None
+        # exit of the loops of the current code
+        self.loops = []
+        # function declared by a binding (global: by name), hint for inlining
+        self.functions = {}
+
+    def lowermain(self, statements: list) -> Code:
+        self.code = Code("main", 0)
+        self.block = self.code.newblock()
+        for statement in statements:
+            if type(statement) is FunctionStmt:
+                self.functions[statement.funcexp.name.lexeme] = statement.funcexp
+        for statement in statements:
+            statement.accept(self)
+        self.finish()
+        return self.code
+
+    def lowerfunction(self, name: str, functionexp, method: bool = False) -> Code:
+        state = (self.code, self.block, self.slots, self.loops)
+        code = self.codes[functionexp] = Code(name, len(functionexp.params), method)
+        scope = self.scopes.functions[functionexp]
+        self.code, self.slots, self.loops = code, {}, []
+        self.block = code.newblock()
+        bindings = [self.scopes.declared[param] for param in functionexp.params]
+        if method:
+            bindings.insert(0, self.scopes.thises[functionexp])
+        for slot, binding in enumerate(bindings):
+            self.slots[binding] = slot
+            if binding.captured:
+                code.cells.append(slot)
+        for binding in scope.uses:
+            self.slots[binding] = code.newslot()
+            code.free += 1
+        for statement in functionexp.body:
+            statement.accept(self)
+        self.finish()
+        self.code, self.block, self.slots, self.loops = state
+        return code
+
+    def finish(self):
+        if self.block.term is None:
+            self.block.term = Instr("RETURN", None, [NIL])
+
+    def emit(self, op: str, dest: int = None, args: list = (), extra: object = None) -> int:
+        self.block.instrs.append(Instr(op, dest, args, extra))
+        return dest
+
+    def temp(self) -> int:
+        return self.code.newslot()
+
+    def terminate(self, op: str, args: list = (), extra: object = None, next: Block = None):
+        """End the current block, continue in next (a new unreachable block
+        for the code following a return or a break)."""
+        if self.block.term is None:
+            self.block.term = Instr(op, None, args, extra)
+        self.block = next or self.code.newblock(self.block.handler)
+
+    def jump(self, target: Block, next: Block = None):
+        self.terminate("JUMP", extra=target, next=next)
+
+    def captures(self, functionexp) -> list:
+        return [self.slots[binding] for binding in self.scopes.functions[functionexp].uses]
+
+    def closure(self, name: str, functionexp) -> int:
+        code = self.lowerfunction(name, functionexp)
+        return self.emit("CLOSURE", self.temp(), self.captures(functionexp), code)
+
+    def lower(self, expr):
+        return expr.accept(self)
+
+    def read(self, node, token) -> int:
+        binding = self.scopes.references.get(node)
+        if binding is None:
+            return self.emit("GETGLOBAL", self.temp(), [], token)
+        if binding.captured:
+            return self.emit("LOADCELL", self.temp(), [self.slots[binding]])
+        # a copy: the variable may change before the value is used
+        return self.emit("MOVE", self.temp(), [self.slots[binding]])
+
+    def define(self, token, value):
+        binding = self.scopes.declared.get(token)
+        if binding is None:
+            self.emit("DEFGLOBAL", None, [value], token.lexeme)
+            return
+        slot = self.slots[binding] = self.code.newslot()
+        self.emit("NEWCELL" if binding.captured else "MOVE", slot, [value])
+
+    def condition(self, expr, iftrue: Block, iffalse: Block):
+        self.terminate("BRANCH", [self.lower(expr)], (iftrue, iffalse), iftrue)
+
+    #
+    # Expressions, their visitors return their operand
+    #
+
+    def visitassign(self, assign):
+        value = self.lower(assign.value)
+        binding = self.scopes.references.get(assign)
+        if binding is None:
+            self.emit("SETGLOBAL", None, [value], assign.name)
+        elif binding.captured:
+            self.emit("STORECELL", None, [self.slots[binding], value])
+        else:
+            self.emit("MOVE", self.slots[binding], [value])
+        return value
+
+    def visitbinary(self, binary):
+        left = self.lower(binary.left)
+        right = self.lower(binary.right)
+        optype = binary.operator.type
+        if optype in (Tk.EQUAL_EQUAL, Tk.BANG_EQUAL):
+            return self.emit("EQUAL", self.temp(), [left, right], optype == Tk.EQUAL_EQUAL)
+        return self.emit("BINARY", self.temp(), [left, right], binary.operator)
+
+    def visitcall(self, call):
+        callee = call.callee
+        if type(callee) is Get:
+            instance = self.lower(callee.getobject)
+            arguments = [self.lower(argument) for argument in call.arguments]
+            return self.emit("INVOKE", self.temp(), [instance] + arguments,
+                             (callee.name, call.paren))
+        function = self.lower(callee)
+        arguments = [self.lower(argument) for argument in call.arguments]
+        # the function the callee names when it is not reassigned
+        target = None
+        if type(callee) is Variable:
+            binding = self.scopes.references.get(callee)
+            target = self.functions.get(binding or callee.name.lexeme)
+        return self.emit("CALL", self.temp(), [function] + arguments, (call.paren, target))
+
+    def visitfunctionexp(self, functionexp):
+        return self.closure(None, functionexp)
+
+    def visitget(self, get):
+        return self.emit("GETPROP", self.temp(), [self.lower(get.getobject)], get.name)
+
+    def visitgrouping(self, grouping):
+        return self.lower(grouping.expression)
+
+    def visitliteral(self, literal):
+        return Const(literal.value)
+
+    def visitlogical(self, logical):
+        result = self.temp()
+        self.emit("MOVE", result, [self.lower(logical.left)])
+        right, end = self.code.newblock(self.block.handler), self.code.newblock(self.block.handler)
+        if logical.operator.type == Tk.OR:
+            self.terminate("BRANCH", [result], (end, right), right)
+        else:
+            self.terminate("BRANCH", [result], (right, end), right)
+        self.emit("MOVE", result, [self.lower(logical.right)])
+        self.jump(end, end)
+        return result
+
+    def visitset(self, var_set):
+        instance = self.emit("CHECKINSTANCE", self.temp(), [self.lower(var_set.setobject)], var_set.name)
+        self.emit("SETPROP", None, [instance, self.lower(var_set.value)], var_set.name.lexeme)
+        return NIL
+
+    def visitsuper(self, var_super):
+        superclass = self.read(var_super, var_super.keyword)
+        this = self.read(var_super.keyword, var_super.keyword)
+        return self.emit("GETSUPER", self.temp(), [superclass, this], var_super.method)
+
+    def visitthis(self, this):
+        return self.read(this, this.keyword)
+
+    def visitunary(self, unary):
+        right = self.lower(unary.right)
+        if unary.operator.type == Tk.BANG:
+            return self.emit("NOT", self.temp(), [right])
+        return self.emit("NEGATE", self.temp(), [right], unary.operator)
+
+    def visitvariable(self, variable):
+        return self.read(variable, variable.name)
+
+    #
+    # Statements
+    #
+
+    def visitblock(self, block):
+        for statement in block.statements:
+            statement.accept(self)
+
+    def visitbreak(self, var_break):
+        if self.loops:
+            self.jump(self.loops[-1])
+        else:
+            # leaves the loop of a caller
+            self.terminate("BREAK")
+
+    def visitclass(self, var_class):
+        superclass = NIL
+        if var_class.superclass is not None:
+            superclass = self.emit("CHECKCLASS", self.temp(),
+                                   [self.lower(var_class.superclass)], var_class.name)
+            binding = self.scopes.supers[var_class]
+            slot = self.slots[binding] = self.code.newslot()
+            self.emit("NEWCELL" if binding.captured else "MOVE", slot, [superclass])
+        binding = self.scopes.declared.get(var_class.name)
+        if binding is not None and binding.captured:
+            # the methods may use the class
+            self.define(var_class.name, NIL)
+        codes, captures = [], []
+        for functionexp in var_class.methods:
+            codes.append(self.lowerfunction(functionexp.name.lexeme, functionexp, method=True))
+            captures += self.captures(functionexp)
+        value = self.emit("CLASS", self.temp(), [superclass] + captures,
+                          (var_class.name.lexeme, codes))
+        if binding is not None and binding.captured:
+            self.emit("STORECELL", None, [self.slots[binding], value])
+        else:
+            self.define(var_class.name, value)
+
+    def visitexpression(self, expression):
+        self.lower(expression.expression)
+
+    def visitfor(self, var_for):
+        if var_for.initializer is not None:
+            var_for.initializer.accept(self)
+        self.loop(var_for.condition, var_for.body, var_for.increment)
+
+    def visitfunction(self, function):
+        funcexp = function.funcexp
+        binding = self.scopes.declared.get(funcexp.name)
+        if binding is None:
+            self.define(funcexp.name, self.closure(funcexp.name.lexeme, funcexp))
+            return
+        self.functions[binding] = funcexp
+        if binding.captured:
+            # a recursive function uses its own cell
+            self.define(funcexp.name, NIL)
+            value = self.closure(funcexp.name.lexeme, funcexp)
+            self.emit("STORECELL", None, [self.slots[binding], value])
+        else:
+            self.define(funcexp.name, self.closure(funcexp.name.lexeme, funcexp))
+
+    def visitif(self, var_if):
+        handler = self.block.handler
+        then, end = self.code.newblock(handler), self.code.newblock(handler)
+        otherwise = self.code.newblock(handler) if var_if.elsebranch is not None else end
+        self.condition(var_if.condition, then, otherwise)
+        var_if.thenbranch.accept(self)
+        self.jump(end, otherwise)
+        if var_if.elsebranch is not None:
+            var_if.elsebranch.accept(self)
+            self.jump(end, end)
+
+    def visitforin(self, forin):
+        raise api.CompileError([str(Diagnostic(forin.name.line, "",
+                                               "For in loops only run on the interpreter."))])
+
+    def visitimport(self, var_import):
+        raise api.CompileError([str(Diagnostic(var_import.keyword.line, "",
+                                               "Imports only run on the interpreter."))])
+
+    def visitprint(self, print):
+        self.emit("PRINT", None, [self.lower(print.expression)])
+
+    def visitreturn(self, var_return):
+        value = NIL if var_return.value is None else self.lower(var_return.value)
+        self.terminate("RETURN", [value])
+
+    def visitvar(self, var):
+        value = NIL if var.initializer is None else self.lower(var.initializer)
+        self.define(var.name, value)
+
+    def visitwhile(self, var_while):
+        self.loop(var_while.condition, var_while.body)
+
+    def visityield(self, var_yield):
+        raise api.CompileError([str(Diagnostic(var_yield.keyword.line, "",
+                                               "Generators only run on the interpreter."))])
+
+    def loop(self, condition, body, increment=None):
+        outer = self.block.handler
+        end = self.code.newblock(outer)
+        header, first = self.code.newblock(end), self.code.newblock(end)
+        self.jump(header, header)
+        self.condition(condition, first, end)
+        self.loops.append(end)
+        body.accept(self)
+        self.loops.pop()
+        if increment is not None:
+            self.lower(increment)
+        self.jump(header, end)
+
+
+def lower(statements: list) -> Module:
+    """IR of resolved statements."""
+    scopes = Scopes()
+    for statement in statements:
+        scopes.resolve(statement)
+    lowering = Lowering(scopes)
+    main = lowering.lowermain(statements)
+    module = Module(main, lowering.codes)
+    for code in module.allcodes():
+        code.number()
+    return module
+
+
+def dump(module: Module) -> str:
+    """Readable listing of the IR."""
+    lines = []
+    for code in module.allcodes():
+        lines.append("{}({}) slots {} free {}".format(
+            code.name or "<lambda>", code.nargs, code.slots, code.free))
+        for block in code.blocks:
+            handler = "" if block.handler is None else " (break: b{})".format(block.handler.index)
+            lines.append("  b{}:{}".format(block.index, handler))
+            for instr in block.instrs:
+                lines.append("    {!r}".format(instr))
+            lines.append("    {!r}".format(block.term))
+    return "\n".join(lines)
@@ -0,0 +1,53 @@
+# Lazy function bodies: python3 -m lox.lox --lazy file.lox
+#
+# In lazy mode (Parser(lazy=True), Lox(lazy=True)) the parser only matches
+# the braces of the bodies of the top level function declarations and keeps
+# their tokens: most of the functions of a large script are never called by
+# a run, which now starts without parsing nor resolving them. A top level
+# function reads no local variable of an enclosing scope, so its body is
+# parsed, resolved and specialized on its first call just as it would have
+# been up front (LoxFunction.call).
+#
+# The syntax and resolution errors of a body are reported when it is
+# completed, as a runtime error of the call: a file whose unbalanced braces
+# hide the end of a body is still rejected before the run. Nested
+# functions, lambdas and methods are parsed with their enclosing code.
+from lox.error import InterpreterError, LoxError
+from lox.token import LoxToken
+from lox.tokentype import TokensDic as Tk
+
+
+class LazyBody:
+    """Tokens of a function body, braces included, parsed on demand."""
+
+    def __init__(self, tokens: list):
+        self.tokens = tokens
+
+    def complete(self, functionexp, interpreter):
+        """Parse and resolve the body of functionexp for an interpreter,
+        InterpreterError with the messages on errors."""
+        from lox.parser import Parser
+        from lox.resolver import Resolver
+        errors = []
+        end = LoxToken(Tk.EOF, "", None, self.tokens[-1].line)
+        with LoxError.collecting() as messages:
+            body = Parser(self.tokens + [end], errors).parsebody()
+            if not LoxError.haderror:
+                functionexp.body = functionexp.statements = body
+                functionexp.pending = None
+                Resolver(interpreter, errors).resolvebody(functionexp)
+            failed = LoxError.haderror
+        if failed:
+            functionexp.pending = self
+            raise InterpreterError(functionexp.name, "Errors in the body of '{}':\n{}".format(
+                functionexp.name.lexeme, "\n".join(messages)))
+
+    def statements(self) -> list:
+        """Statements of the body parsed apart, left unresolved, for their
+        lines (lox.coverage): none when it has syntax errors."""
+        from lox.parser import Parser
+        end = LoxToken(Tk.EOF, "", None, self.tokens[-1].line)
+        with LoxError.collecting():
+            body = Parser(self.tokens + [end], []).parsebody()
+            failed = LoxError.haderror
+        return [] if failed else body
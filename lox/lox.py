@@ -1,4 +1,5 @@
 import argparse
+import os
 from lox.scanner import scan_tokens
 from lox.parser import Parser
 from lox.astprinter import PrinterVisitor
@@ -7,18 +8,45 @@ from lox.interpreter import Interpreter
 from lox.resolver import Resolver
 from lox.error import LoxError
 from lox.tokentype import TokensDic as Tk
+from lox.instrumentation import AllocationCounter, ExecutionBudget, HeapTracker
+from lox.coverage import Coverage
+from lox.output import OutputSink
+from lox import snapshot, modules
 
 
 class Lox:
-    def __init__(self):
-        self.interpreter = Interpreter()
+    def __init__(self, counter: AllocationCounter = None, output: OutputSink = None,
+                 budget: ExecutionBudget = None, heap: HeapTracker = None,
+                 maxerrors: int = None, coverage: Coverage = None, lazy: bool = False):
+        """counter -- optional hook reporting the allocations of each run
+        output -- sink of the print statements, buffered stdout by default
+        budget -- optional limits of each run
+        heap -- optional tracker of the live objects, reported after each run
+        maxerrors -- optional number of syntax errors after which parsing stops
+        coverage -- optional line coverage, collected after each run
+        lazy -- parse the top level function bodies on their first call (see lox.lazy)"""
+        self.interpreter = Interpreter(output)
         self.error = LoxError()
+        self.counter = counter
+        if counter is not None:
+            counter.attach(self.interpreter)
+        self.budget = budget
+        if budget is not None:
+            budget.attach(self.interpreter)
+        self.heap = heap
+        if heap is not None:
+            heap.attach(self.interpreter)
+        self.maxerrors = maxerrors
+        self.coverage = coverage
+        self.lazy = lazy
+        if coverage is not None:
+            coverage.attach(self.interpreter)
 
     def run_prompt(self):
         errors = []
         s = input("lox >")
         if s != "exit":
-            if s[len(s)-1] is not ";":
+            if s[len(s)-1] != ";":
                 s = s + ";"
             self.run(s, errors)
             self.run_prompt()
@@ -29,33 +57,51 @@ class Lox:
             try:
                 with open(file, 'r') as f:
                     source = f.read()
-                    lox.run(source, errors)
+                    # imports are relative to the file
+                    self.interpreter.directory = os.path.dirname(file)
+                    self.run(source, errors, file)
             except:
                 print("cannot read file {}".format(file))
 
-    def run(self, source, errors):
+    def run(self, source, errors, path: str = "<script>"):
+        """Run a source, its compilation errors are appended to errors as Diagnostic.
+
+        path -- file of the source, for the coverage"""
         #print("source : \n{}".format(source))
+        LoxError.haderror = False
         tokens = []
         statements = []
         scan_tokens(
             source, {'start': 0, 'current': 0, 'line': 1}, tokens, errors)
-        if len(tokens) is 1:
+        if len(tokens) == 1:
             if tokens[0].type is Tk.EOF:
-                LoxError.error(tokens[0], "Source file is empty.")
-        parser = Parser(tokens)
+                LoxError.error(tokens[0], "Source file is empty.", errors)
+        parser = Parser(tokens, errors, self.maxerrors, self.lazy)
         # print("Tokens:\n")
         # for t in tokens:
         #     print(t)
         #print("Lox: ready to parse")
         statements = parser.parse()
         #print("Lox: ready to resolve")
-        resolver = Resolver(self.interpreter)
-        resolver.resolvelist(statements)
+        # a tree with syntax errors has holes the resolver cannot walk
+        if not LoxError.haderror:
+            resolver = Resolver(self.interpreter, errors)
+            resolver.resolvelist(statements)
         if LoxError.haderror:
             print("Syntax errors detected during compilation")
             return
         #print("Lox: ready to interpret")
+        if self.counter is not None:
+            self.counter.reset()
+        if self.budget is not None:
+            self.budget.reset()
         self.interpreter.interpret(statements)
+        if self.coverage is not None:
+            self.coverage.collectrun(path, statements, self.interpreter)
+        if self.counter is not None:
+            print(self.counter.report())
+        if self.heap is not None:
+            print(self.heap.report())
 
 
 if __name__ == "__main__":
@@ -66,9 +112,52 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Compile lox file')
     parser.add_argument('files', nargs='*',
                         help='lox source file')
+    parser.add_argument('--max-errors', type=int,
+                        help='stop parsing after this number of syntax errors')
+    parser.add_argument('--allocations', action='store_true',
+                        help='report the environments allocated by each run')
+    parser.add_argument('--max-steps', type=int,
+                        help='stop a run after this number of statements and expressions')
+    parser.add_argument('--max-seconds', type=float,
+                        help='stop a run after this wall clock time')
+    parser.add_argument('--max-environments', type=int,
+                        help='stop a run creating more environments')
+    parser.add_argument('--max-depth', type=int,
+                        help='stop a run nesting more blocks and calls')
+    parser.add_argument('--heap', action='store_true',
+                        help='report the live objects after each run')
+    parser.add_argument('--max-heap', type=int,
+                        help='stop a run whose live objects need more bytes (implies --heap)')
+    parser.add_argument('--imports', action='store_true',
+                        help='report the compilation and run times of the imported modules')
+    parser.add_argument('--lazy', action='store_true',
+                        help='parse the top level function bodies on their first call')
+    parser.add_argument('--coverage',
+                        help='write the line coverage of the files (lcov format) to this file')
+    parser.add_argument('--snapshot',
+                        help='start from the globals saved in this snapshot file')
+    parser.add_argument('--save-snapshot',
+                        help='save the globals to this snapshot file after running the files')
     args = parser.parse_args()
-    lox = Lox()
+    heap = None
+    if args.heap or args.max_heap is not None:
+        heap = HeapTracker(args.max_heap)
+    budget = None
+    if (args.max_steps, args.max_seconds, args.max_environments, args.max_depth) != (None,) * 4:
+        budget = ExecutionBudget(args.max_steps, args.max_seconds,
+                                 args.max_environments, args.max_depth)
+    lox = Lox(AllocationCounter() if args.allocations else None, budget=budget, heap=heap,
+              maxerrors=args.max_errors,
+              coverage=Coverage() if args.coverage is not None else None, lazy=args.lazy)
+    if args.snapshot is not None:
+        snapshot.load(lox.interpreter, args.snapshot)
     if args.files:
         lox.run_files(args.files)
+        if args.imports:
+            print(modules.report(lox.interpreter))
+        if args.coverage is not None:
+            lox.coverage.write(args.coverage)
+        if args.save_snapshot is not None:
+            snapshot.save(lox.interpreter, args.save_snapshot)
     else:
         lox.run_prompt()
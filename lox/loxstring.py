@@ -0,0 +1,75 @@
+class LoxString:
+    """Runtime representation of a concatenated Lox string.
+
+    Concatenation only links both operands in a rope, the python string is
+    built on demand (printing, comparison, hashing) and then cached, so
+    building a string piece by piece stays linear."""
+
+    __slots__ = ('left', 'right', 'flat', '__weakref__')
+
+    def __init__(self, left: "str or LoxString", right: "str or LoxString"):
+        self.left = left
+        self.right = right
+        self.flat = None
+
+    def flatten(self) -> str:
+        """Join all the pieces of the rope and drop the tree."""
+        if self.flat is not None:
+            return self.flat
+        pieces = []
+        # iterative walk: a loop building a string produces a very deep rope
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if type(node) is str:
+                pieces.append(node)
+            elif node.flat is not None:
+                pieces.append(node.flat)
+            else:
+                stack.append(node.right)
+                stack.append(node.left)
+        self.flat = "".join(pieces)
+        self.left = None
+        self.right = None
+        return self.flat
+
+    def __str__(self):
+        return self.flatten()
+
+    def __reduce__(self):
+        # pickled flat: a deep rope would exceed the pickle recursion
+        return str, (self.flatten(),)
+
+    def __repr__(self):
+        return "LoxString(" + repr(self.flatten()) + ")"
+
+    def __eq__(self, other):
+        if isinstance(other, (str, LoxString)):
+            return self.flatten() == str(other)
+        return False
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self.flatten())
+
+    def __lt__(self, other):
+        if isinstance(other, (str, LoxString)):
+            return self.flatten() < str(other)
+        return NotImplemented
+
+    def __le__(self, other):
+        if isinstance(other, (str, LoxString)):
+            return self.flatten() <= str(other)
+        return NotImplemented
+
+    def __gt__(self, other):
+        if isinstance(other, (str, LoxString)):
+            return self.flatten() > str(other)
+        return NotImplemented
+
+    def __ge__(self, other):
+        if isinstance(other, (str, LoxString)):
+            return self.flatten() >= str(other)
+        return NotImplemented
@@ -0,0 +1,196 @@
+# Modules: 'import "path.lox";' runs a lox file and defines its globals
+#
+# The path is relative to the directory of the importing file (the current
+# directory for a source without file). A module is compiled (scanned,
+# parsed, resolved) once per process: the registry keeps its tree, the
+# depths of its local variables and the names it declares, by path, and
+# compiles it again when the modification time of the file changes. An
+# interpreter runs a module once, in a global environment of its own.
+#
+# Modules load lazily: an import defines the names the module declares at
+# its top level (var, fun and class, not the names it imports) in cells
+# running the module on the first use of any of them. The importer gets
+# the values the module left in its globals. A name already defined by the
+# importer is set at once, as the sites using it keep its cell.
+#
+# Times are measured for each module: its compilation by the registry, its
+# run by each interpreter (report, python3 -m lox.lox --imports).
+import os
+import threading
+import time
+
+from lox.environment import Cell, GlobalEnvironment
+from lox.error import LoxRuntimeError
+from lox.native import builtins
+from lox.generators import streams
+from lox.parallel import parallel
+from lox.stmt import Var, Function, Class
+
+
+class CompiledModule:
+    """A module file, compiled.
+
+    statements -- resolved tree
+    locals -- depths of its local variables
+    exports -- names of its top level declarations
+    compiletime -- seconds spent compiling it"""
+
+    def __init__(self, path: str, mtime: int, statements: list, locals: dict,
+                 compiletime: float):
+        self.path = path
+        self.mtime = mtime
+        self.statements = statements
+        self.locals = locals
+        self.compiletime = compiletime
+        self.exports = []
+        for statement in statements:
+            if isinstance(statement, Var):
+                self.exports.append(statement.name.lexeme)
+            elif isinstance(statement, Function):
+                self.exports.append(statement.funcexp.name.lexeme)
+            elif isinstance(statement, Class):
+                self.exports.append(statement.name.lexeme)
+
+
+class ModuleRegistry:
+    """Compiled modules of the process by path, shared by the interpreters.
+
+    hits, misses -- imports finding their module compiled or not"""
+
+    def __init__(self):
+        self.modules = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, path: str) -> CompiledModule:
+        """Compiled module of a file, OSError when it cannot be read,
+        api.CompileError on errors."""
+        mtime = os.stat(path).st_mtime_ns
+        with self.lock:
+            module = self.modules.get(path)
+            if module is not None and module.mtime == mtime:
+                self.hits += 1
+                return module
+            self.misses += 1
+            module = self.modules[path] = self.compile(path, mtime)
+            return module
+
+    def compile(self, path: str, mtime: int) -> CompiledModule:
+        from lox import api
+        with open(path) as f:
+            source = f.read()
+        before = time.perf_counter()
+        program = api.compile(source)
+        return CompiledModule(path, mtime, program.statements, program.locals,
+                              time.perf_counter() - before)
+
+
+registry = ModuleRegistry()
+
+
+class LoadedModule:
+    """A module of an interpreter.
+
+    environment -- its globals
+    state -- None before its run, "running" then "done"
+    runtime -- seconds spent running it"""
+
+    def __init__(self, compiled: CompiledModule):
+        self.compiled = compiled
+        self.environment = GlobalEnvironment()
+        for name, value in {**builtins(), **streams(), **parallel()}.items():
+            self.environment.define(name, value)
+        self.state = None
+        self.runtime = None
+
+    def load(self, interpreter):
+        """Run the module once, as its globals are needed."""
+        if self.state is not None:
+            return
+        self.state = "running"
+        compiled = self.compiled
+        interpreter.locals.update(compiled.locals)
+        saved = interpreter.global_env, interpreter.current_env, interpreter.directory
+        interpreter.global_env = interpreter.current_env = self.environment
+        interpreter.directory = os.path.dirname(compiled.path)
+        before = time.perf_counter()
+        try:
+            for statement in compiled.statements:
+                interpreter.execute(statement)
+        finally:
+            self.runtime = time.perf_counter() - before
+            interpreter.global_env, interpreter.current_env, interpreter.directory = saved
+            self.state = "done"
+
+    def get(self, interpreter, name: str) -> object:
+        """Value of a global of the module, a module importing back one
+        still running gets the globals it has so far."""
+        self.load(interpreter)
+        return self.environment.get(name)
+
+
+class LazyCell(Cell):
+    """Cell of an imported global, until the module runs.
+
+    Its value slot holds (interpreter, module, name) and the value property
+    reads the module global on first use, then the cell becomes a plain Cell:
+    same slots, so the sites keeping it never see the difference."""
+
+    __slots__ = ()
+
+    def __init__(self, owner: GlobalEnvironment, interpreter, module: LoadedModule, name: str):
+        self.owner = owner
+        Cell.value.__set__(self, (interpreter, module, name))
+
+    @property
+    def value(self):
+        interpreter, module, name = Cell.value.__get__(self)
+        value = module.get(interpreter, name)
+        self.value = value
+        return value
+
+    @value.setter
+    def value(self, value):
+        Cell.value.__set__(self, value)
+        self.__class__ = Cell
+
+    def __reduce_ex__(self, protocol):
+        # a snapshot keeps the value, not the pending import
+        self.value
+        return self.__reduce_ex__(protocol)
+
+
+def importmodule(interpreter, keyword, path: str):
+    """Define the globals of a module in the current globals."""
+    filename = os.path.realpath(os.path.join(interpreter.directory, path))
+    module = interpreter.modules.get(filename)
+    if module is None:
+        from lox import api
+        try:
+            compiled = registry.get(filename)
+        except OSError as error:
+            raise LoxRuntimeError(keyword, "Cannot import '{}': {}.".format(
+                path, error.strerror)) from None
+        except api.CompileError as error:
+            raise LoxRuntimeError(keyword, "Cannot import '{}':\n{}".format(
+                path, error)) from None
+        module = interpreter.modules[filename] = LoadedModule(compiled)
+    environment = interpreter.global_env
+    for name in module.compiled.exports:
+        if name in environment.cells:
+            environment.define(name, module.get(interpreter, name))
+        else:
+            environment.cells[name] = LazyCell(environment, interpreter, module, name)
+
+
+def report(interpreter) -> str:
+    """Compilation and run times of the modules of an interpreter."""
+    lines = []
+    for path, module in interpreter.modules.items():
+        run = "not run" if module.runtime is None else "run {:.1f}ms".format(
+            1000 * module.runtime)
+        lines.append("{}: compiled {:.1f}ms, {}".format(
+            os.path.relpath(path), 1000 * module.compiled.compiletime, run))
+    lines.append("module cache: {} hits, {} misses".format(registry.hits, registry.misses))
+    return "\n".join(lines)
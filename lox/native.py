@@ -1,5 +1,8 @@
 import lox.callable
+from lox.loxstring import LoxString
+from lox.error import InterpreterError
 from typing import List
+import asyncio
 import time
 
 
@@ -8,7 +11,220 @@ class Clock(lox.callable.LoxCallable):
         return 0
 
     def call(self, interpreter, arguments: List[object]) -> object:
-        return time.clock()
+        return time.perf_counter()
 
     def __str__(self):
         return "<clock: native function>"
+
+
+def wait(coroutine, loop) -> object:
+    """Result of the coroutine of an async native.
+
+    loop -- event loop of run_async, running in another thread than the
+    script, None for a synchronous run: the coroutine then runs on a loop of
+    its own, which a thread already running a loop cannot start."""
+    if loop is not None:
+        return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    coroutine.close()
+    raise InterpreterError(None, "An async native cannot run in a synchronous run inside "
+                           "an event loop, use lox.api.run_async.")
+
+
+class AsyncNative(lox.callable.LoxCallable):
+    """Native function implemented by a coroutine.
+
+    The interpreter waits for the coroutine (see Interpreter.wait), on the
+    event loop of run_async when the script runs in asyncio mode."""
+
+    async def run(self, arguments: List[object]) -> object:
+        raise NotImplementedError
+
+    def call(self, interpreter, arguments: List[object]) -> object:
+        return interpreter.wait(self.run(arguments))
+
+
+class NativeMethod(lox.callable.LoxCallable):
+    """Method of a native object, bound to it."""
+
+    __slots__ = ("function", "params", "token")
+
+    def __init__(self, function, params: int, token):
+        """function -- python function taking the token of the property
+        first (for the runtime errors), then the arguments"""
+        self.function = function
+        self.params = params
+        self.token = token
+
+    def arity(self) -> int:
+        return self.params
+
+    def call(self, interpreter, arguments: List[object]) -> object:
+        return self.function(self.token, *arguments)
+
+    def __str__(self):
+        return "<method: " + self.token.lexeme + ">"
+
+
+class NativeObject:
+    """Object implemented in python whose methods are lox properties
+    (Interpreter.visitget, runtime.findmethod).
+
+    methods -- lox name: (python method name, arity)
+    kind -- name of the objects in the heap summary (lox.instrumentation)"""
+
+    methods = {}
+    kind = "native"
+    # tracker of the heap when the object is tracked: the methods adding to
+    # the object charge their growth to it
+    heap = None
+
+    def get_property(self, name, interpreter) -> NativeMethod:
+        method = self.methods.get(name.lexeme)
+        if method is None:
+            raise InterpreterError(name, "Undefined property.")
+        pyname, params = method
+        return NativeMethod(getattr(self, pyname), params, name)
+
+    def __getstate__(self):
+        # the tracker stays with the interpreter (snapshots, parallelMap)
+        state = self.__dict__.copy()
+        state.pop("heap", None)
+        return state
+
+
+def newnative(cls: type) -> NativeObject:
+    """Factory of the native objects, Interpreter.newnative."""
+    return cls()
+
+
+class NativeClass(lox.callable.LoxCallable):
+    """Native function creating native objects: Map(), List()."""
+
+    def __init__(self, name: str, cls: type):
+        self.name = name
+        self.cls = cls
+
+    def arity(self) -> int:
+        return 0
+
+    def call(self, interpreter, arguments: List[object]) -> object:
+        return interpreter.newnative(self.cls)
+
+    def __str__(self):
+        return "<" + self.name + ": native class>"
+
+
+# python types of the values usable as map keys, and their lox names
+keytypes = (str, LoxString, int, float, bool, type(None))
+
+
+class LoxList(NativeObject):
+    """Native list: get(index), set(index, value), push(value), size()."""
+
+    methods = {"get": ("get", 1), "set": ("set", 2), "push": ("push", 1), "size": ("size", 0)}
+    kind = "list"
+
+    def __init__(self, items: list = None):
+        self.items = items if items is not None else []
+
+    def index(self, token, index) -> int:
+        # a division gives a float, integral ones are indexes too
+        if type(index) is float and index.is_integer():
+            index = int(index)
+        if type(index) is not int or not 0 <= index < len(self.items):
+            raise InterpreterError(token, "List index out of range.")
+        return index
+
+    def get(self, token, index):
+        return self.items[self.index(token, index)]
+
+    def set(self, token, index, value):
+        self.items[self.index(token, index)] = value
+
+    def push(self, token, value):
+        self.items.append(value)
+        if self.heap is not None:
+            self.heap.grow(self)
+
+    def size(self, token) -> int:
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __str__(self):
+        return "<list of " + str(len(self.items)) + ">"
+
+
+class LoxMap(NativeObject):
+    """Native hash map: get(key), set(key, value), has(key), delete(key),
+    keys(), size().
+
+    Keys are strings, numbers, booleans and nil, equal when '==' says so
+    (1 and 1.0 are the same key, true and 1 are not); concatenated strings
+    are stored flat."""
+
+    methods = {"get": ("get", 1), "set": ("set", 2), "has": ("has", 1),
+               "delete": ("delete", 1), "keys": ("keys", 0), "size": ("size", 0)}
+    kind = "map"
+
+    def __init__(self):
+        self.entries = {}
+
+    @staticmethod
+    def key(token, key):
+        if type(key) is LoxString:
+            return key.flatten()
+        if type(key) is bool:
+            # python takes true for 1 and false for 0, lox does not
+            return (bool, key)
+        if not isinstance(key, keytypes):
+            raise InterpreterError(token, "Map keys must be strings, numbers, booleans or nil.")
+        return key
+
+    @staticmethod
+    def value(key):
+        """Lox value of a key of entries."""
+        if type(key) is tuple:
+            return key[1]
+        return key
+
+    def get(self, token, key):
+        """Value of a key, nil when missing."""
+        return self.entries.get(self.key(token, key))
+
+    def set(self, token, key, value):
+        self.entries[self.key(token, key)] = value
+        if self.heap is not None:
+            self.heap.grow(self)
+
+    def has(self, token, key) -> bool:
+        return self.key(token, key) in self.entries
+
+    def delete(self, token, key) -> bool:
+        """Remove a key, false when missing."""
+        return self.entries.pop(self.key(token, key), self) is not self
+
+    def keys(self, token) -> LoxList:
+        """Keys in insertion order."""
+        return LoxList([self.value(key) for key in self.entries])
+
+    def size(self, token) -> int:
+        return len(self.entries)
+
+    def __iter__(self):
+        # the keys, the loop body may change the map
+        return iter([self.value(key) for key in self.entries])
+
+    def __str__(self):
+        return "<map of " + str(len(self.entries)) + ">"
+
+
+def builtins() -> dict:
+    """Native globals of a new program."""
+    return {"clock": Clock(), "Map": NativeClass("Map", LoxMap),
+            "List": NativeClass("List", LoxList)}
@@ -0,0 +1,48 @@
+import sys
+
+
+class OutputSink:
+    """Buffered destination of the print statements.
+
+    Lines are kept in memory and written to the stream when the buffer is
+    full, on flush() and at the end of each run. Without stream the lines go
+    to the sys.stdout of the flush time."""
+
+    def __init__(self, stream=None, capacity: int = 4096):
+        """stream -- file-like object receiving the output
+        capacity -- number of lines kept before writing them"""
+        self.stream = stream
+        self.capacity = capacity
+        self.lines = []
+
+    def writeline(self, line: str):
+        lines = self.lines
+        lines.append(line)
+        if len(lines) >= self.capacity:
+            self.flush()
+
+    def flush(self):
+        if not self.lines:
+            return
+        stream = self.stream if self.stream is not None else sys.stdout
+        stream.write("\n".join(self.lines))
+        stream.write("\n")
+        stream.flush()
+        self.lines = []
+
+
+class MemoryOutput(OutputSink):
+    """Sink keeping the whole output in memory, for embedding and tests."""
+
+    def writeline(self, line: str):
+        self.lines.append(line)
+
+    def flush(self):
+        pass
+
+    def getvalue(self) -> str:
+        """All the lines printed so far."""
+        return "".join(line + "\n" for line in self.lines)
+
+    def clear(self):
+        self.lines = []
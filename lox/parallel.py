@@ -0,0 +1,153 @@
+# Process parallel map: parallelMap(function, iterable, workers)
+#
+# The interpreter runs on one core. parallelMap pickles the function with
+# its closure and the globals it may read, as a snapshot does (see
+# lox.snapshot: FunctionExp trees, environments, instances...), along with
+# the depths of the resolved local variables, and starts a pool of worker
+# processes each restoring them in an interpreter of its own. The values
+# are sent in chunks, the results come back in order, and so do the lines
+# the function printed. A function reaching a value that cannot be pickled
+# (a generator, a stream, a native of the host) is refused with the name of
+# the global holding it; the values and the results must be picklable too,
+# which the caller and the workers check before sending them.
+#
+# The globals are copied: the assignments of the function in a worker are
+# not seen by the caller nor by the other workers.
+import concurrent.futures
+import io
+import math
+import pickle
+
+from lox.callable import LoxCallable
+from lox.environment import GlobalEnvironment
+from lox.error import InterpreterError, LoxRuntimeError
+from lox.generators import iterate
+from lox.native import LoxList
+from lox.output import MemoryOutput
+from lox.snapshot import SnapshotPickler
+
+# chunks sent to each worker, to even out their loads
+CHUNKS_PER_WORKER = 4
+
+# interpreter and function of a worker process, set by setup
+worker = None
+
+
+class GlobalPickler(SnapshotPickler):
+    """Pickle a global without the globals it reaches, to find the ones
+    that cannot be pickled."""
+
+    def persistent_id(self, obj):
+        if isinstance(obj, GlobalEnvironment):
+            return id(obj)
+        return None
+
+
+def dumps(value, pickler=SnapshotPickler) -> bytes:
+    stream = io.BytesIO()
+    pickler(stream, pickle.HIGHEST_PROTOCOL).dump(value)
+    return stream.getvalue()
+
+
+def payload(interpreter, function) -> bytes:
+    """The function with the globals and resolved variables it needs,
+    LoxRuntimeError when they cannot be pickled."""
+    try:
+        return dumps((interpreter.global_env, interpreter.locals, function))
+    except (pickle.PicklingError, TypeError, AttributeError) as error:
+        reason = str(error)
+    for name, cell in interpreter.global_env.cells.items():
+        try:
+            dumps(cell.value, GlobalPickler)
+        except (pickle.PicklingError, TypeError, AttributeError) as error:
+            raise LoxRuntimeError(None, "parallelMap() cannot send '{}' to the workers: {}.".format(
+                name, error)) from None
+    raise LoxRuntimeError(None, "parallelMap() cannot send the function to the workers: {}.".format(
+        reason))
+
+
+def setup(data: bytes):
+    """Worker initializer: restore the function in a new interpreter."""
+    global worker
+    from lox.interpreter import Interpreter
+    interpreter = Interpreter(MemoryOutput())
+    global_env, variables, function = pickle.loads(data)
+    interpreter.global_env = interpreter.current_env = global_env
+    interpreter.locals.update(variables)
+    worker = interpreter, function
+
+
+def runchunk(values: list) -> tuple:
+    """Worker task: results of the function on some values, lines printed
+    and message of the error if any, the results not picklable included."""
+    interpreter, function = worker
+    output = interpreter.output
+    output.clear()
+    results = []
+    try:
+        for value in values:
+            results.append(function.call(interpreter, [value]))
+    except (InterpreterError, LoxRuntimeError) as error:
+        return None, output.lines, str(error)
+    except RecursionError:
+        return None, output.lines, "Stack overflow."
+    except Exception as error:
+        return None, output.lines, "parallelMap() failed in a worker: {}.".format(error)
+    try:
+        pickle.dumps(results, pickle.HIGHEST_PROTOCOL)
+    except (pickle.PicklingError, TypeError, AttributeError) as error:
+        return None, output.lines, "parallelMap() cannot send the results back: {}.".format(error)
+    return results, output.lines, None
+
+
+class ParallelMap(LoxCallable):
+    """parallelMap(function, iterable, workers): list of the results of the
+    function on the values, computed by worker processes."""
+
+    def arity(self) -> int:
+        return 3
+
+    def call(self, interpreter, arguments: list) -> object:
+        function, iterable, workers = arguments
+        if not isinstance(function, LoxCallable) or function.arity() != 1:
+            raise LoxRuntimeError(None, "parallelMap() expects a function of one argument.")
+        if type(workers) not in (int, float) or workers < 1 or workers != int(workers):
+            raise LoxRuntimeError(None, "parallelMap() expects a number of workers.")
+        values = list(iterate(None, iterable))
+        if not values:
+            return LoxList()
+        workers = min(int(workers), len(values))
+        data = payload(interpreter, function)
+        try:
+            pickle.dumps(values, pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError) as error:
+            raise LoxRuntimeError(None, "parallelMap() cannot send the values to the workers: {}.".format(
+                error)) from None
+        size = math.ceil(len(values) / (workers * CHUNKS_PER_WORKER))
+        chunks = [values[start:start + size] for start in range(0, len(values), size)]
+        results = []
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers, initializer=setup, initargs=(data,)) as executor:
+            futures = [executor.submit(runchunk, chunk) for chunk in chunks]
+            try:
+                for future in futures:
+                    chunkresults, lines, error = future.result()
+                    for line in lines:
+                        interpreter.output.writeline(line)
+                    if error is not None:
+                        raise LoxRuntimeError(None, error)
+                    results.extend(chunkresults)
+            except concurrent.futures.process.BrokenProcessPool:
+                raise LoxRuntimeError(None, "parallelMap() lost a worker process.") from None
+            finally:
+                for future in futures:
+                    future.cancel()
+        return LoxList(results)
+
+    def __str__(self):
+        return "<parallelMap: native function>"
+
+
+def parallel() -> dict:
+    """Native globals of the interpreter running code in other processes."""
+    return {"parallelMap": ParallelMap()}
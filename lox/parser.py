@@ -7,16 +7,26 @@ from lox.expr import *
 from lox.visitor import Visitor
 from lox.error import ParserError, LoxError
 from lox.functiontypes import FunctionType
+from lox.lazy import LazyBody
 
 from typing import List
 
 
 class Parser:
     #
-    # The parser is initialized with the list of tokens to parse
-    def __init__(self, tokens: LoxToken):
+    # The parser is initialized with the list of tokens to parse, the errors
+    # are appended to errors as Diagnostic. After maxerrors errors the parser
+    # stops reporting and skips the rest of the tokens. In lazy mode the
+    # bodies of the top level functions are only brace matched, they are
+    # parsed on their first call (see lox.lazy).
+    def __init__(self, tokens: LoxToken, errors: list = None, maxerrors: int = None,
+                 lazy: bool = False):
         self.tokens = tokens
         self.current = 0
+        self.errors = errors if errors is not None else []
+        self.maxerrors = maxerrors
+        self.errorcount = 0
+        self.lazy = lazy
 
     #
     # get the current token without moving forward
@@ -85,31 +95,64 @@ class Parser:
             return self.advance()
         raise ParserError(self.peek(), message)
 
+    #
+    # Report an error found at a token
+    def error(self, token: LoxToken, where: str, message: str):
+        LoxError.haderror = True
+        if self.maxerrors is not None and self.errorcount >= self.maxerrors:
+            return
+        self.errorcount += 1
+        LoxError.report(token.line, where, message, self.errors)
+        if self.errorcount == self.maxerrors:
+            # jump to the end, the parse unwinds without reporting more
+            self.current = len(self.tokens) - 1
+
+    def parsererror(self, err: ParserError):
+        self.error(err.token, err.where, err.description)
+
+    #
+    # Panic mode: after an error skip the tokens up to the start of the next
+    # statement, so the errors after it are reported in the same pass
+    def synchronize(self):
+        self.advance()
+        while not self.is_at_end():
+            if self.previous().type == Tk.SEMICOLON:
+                return
+            if self.peek().type in (Tk.CLASS, Tk.FUN, Tk.VAR, Tk.IMPORT, Tk.FOR,
+                                    Tk.IF, Tk.WHILE, Tk.PRINT, Tk.RETURN, Tk.YIELD):
+                return
+            self.advance()
+
     #
     # -------------------------------------------------
     # Statement functions
     # -------------------------------------------------
     #
-    def declaration(self) -> Stmt:
+    def declaration(self, toplevel: bool = False) -> Stmt:
+        first = self.peek()
         try:
             # variable declaration statement
             if self.match(Tk.VAR):
-                return self.vardeclaration()
+                declaration = self.vardeclaration()
             # function declaration statement
             elif self.check(Tk.FUN):  # and self.checknext(Tk.IDENTIFIER):
-                return self.fundeclaration()
+                declaration = self.fundeclaration(self.lazy and toplevel)
             # class declaration statement
             elif self.match(Tk.CLASS):
-                return self.classdeclaration()
+                declaration = self.classdeclaration()
+            # module import statement
+            elif self.match(Tk.IMPORT):
+                declaration = self.importdeclaration()
             # generic statement
             else:
-                return self.statement()
+                declaration = self.statement()
+            declaration.first = first
+            return declaration
 
         except ParserError as err:
-            print("error in parsing at token " +
-                  str(self.previous()) + " " + err.message)
+            self.parsererror(err)
+            self.synchronize()
             return None
-            # self.synchronize()
 
     def vardeclaration(self) -> Stmt:
         # Let's get the identifier
@@ -123,10 +166,10 @@ class Parser:
         self.consume(Tk.SEMICOLON, "Expect ';' after variable declaration.")
         return Var(tk_varname, initializer)
 
-    def fundeclaration(self) -> Stmt:
+    def fundeclaration(self, lazy: bool = False) -> Stmt:
         self.consume(Tk.FUN, "Expect 'fun' for function statement.")
         # a function statement should not be anonymous and is not a lambda
-        return Function(self.functionbody(FunctionType.FUNCTION))
+        return Function(self.functionbody(FunctionType.FUNCTION, lazy))
 
     def classdeclaration(self) -> Stmt:
         superclass = None
@@ -143,22 +186,34 @@ class Parser:
         self.consume(Tk.RIGHT_BRACE, "Expect '}' after class body.")
         return Class(name, superclass, methods)
 
+    def importdeclaration(self) -> Stmt:
+        keyword = self.previous()
+        path = self.consume(Tk.STRING, "Expect a file path after 'import'.")
+        self.consume(Tk.SEMICOLON, "Expect ';' after import.")
+        return Import(keyword, path)
+
     def statement(self) -> Stmt:
+        first = self.peek()
         if self.match(Tk.PRINT):
-            return self.printstatement()
-        if self.match(Tk.LEFT_BRACE):
-            return Block(self.blockstatement())
-        if self.match(Tk.IF):
-            return self.ifstatement()
-        if self.match(Tk.WHILE):
-            return self.whilestatement()
-        if self.match(Tk.FOR):
-            return self.forstatement()
-        if self.match(Tk.BREAK):
-            return self.breakstatement()
-        if self.match(Tk.RETURN):
-            return self.returnstatement()
-        return self.expressionstatement()
+            statement = self.printstatement()
+        elif self.match(Tk.LEFT_BRACE):
+            statement = Block(self.blockstatement())
+        elif self.match(Tk.IF):
+            statement = self.ifstatement()
+        elif self.match(Tk.WHILE):
+            statement = self.whilestatement()
+        elif self.match(Tk.FOR):
+            statement = self.forstatement()
+        elif self.match(Tk.BREAK):
+            statement = self.breakstatement()
+        elif self.match(Tk.RETURN):
+            statement = self.returnstatement()
+        elif self.match(Tk.YIELD):
+            statement = self.yieldstatement()
+        else:
+            statement = self.expressionstatement()
+        statement.first = first
+        return statement
 
     def ifstatement(self) -> Stmt:
         self.consume(Tk.LEFT_PAREN,
@@ -169,7 +224,7 @@ class Parser:
         thenbranch = self.statement()
         elsebranch = None
         if self.match(Tk.ELSE):
-            elsebranch = self.statement
+            elsebranch = self.statement()
         return If(condition, thenbranch, elsebranch)
 
     def whilestatement(self) -> Stmt:
@@ -185,29 +240,35 @@ class Parser:
         self.consume(Tk.LEFT_PAREN, "expect a ( after a 'for'.")
         initializer = None
         if self.match(Tk.VAR):
+            if self.checknext(Tk.IN):
+                return self.forinstatement()
             initializer = self.vardeclaration()
         elif not self.match(Tk.SEMICOLON):
             initializer = self.expressionstatement()
         condition = None
         if not self.check(Tk.SEMICOLON):
             condition = self.expression()
-            self.consume(Tk.SEMICOLON, "expect a ; after 'for' condition.")
+        self.consume(Tk.SEMICOLON, "expect a ; after 'for' condition.")
         increment = None
         if not self.check(Tk.RIGHT_PAREN):
             increment = self.expression()
-            self.consume(Tk.RIGHT_PAREN,
-                         "expect a ) at the end of the 'for' increment.")
+        self.consume(Tk.RIGHT_PAREN,
+                     "expect a ) at the end of the 'for' increment.")
         body = self.statement()
-        # Build the equivalent while loop
-        # --> first create a while loop with condition + (body, increment)
-        body = Block([body, Expression(increment)])
+        # The loop is kept as a For node instead of being desugared in a
+        # while loop, so the interpreter can run it without extra scopes
         if condition is None:
             condition = Literal(True)
-        body = While(condition, body)
-        # --> add the initializer
-        if initializer is not None:
-            body = Block([initializer, body])
-        return body
+        return For(initializer, condition, increment, body)
+
+    def forinstatement(self) -> Stmt:
+        name = self.consume(Tk.IDENTIFIER, "Expect a variable identifier")
+        self.consume(Tk.IN, "expect 'in' after the 'for' variable.")
+        iterable = self.expression()
+        self.consume(Tk.RIGHT_PAREN,
+                     "expect a ) at the end of the 'for' iterable.")
+        body = self.statement()
+        return ForIn(name, iterable, body)
 
     def blockstatement(self) -> List[Stmt]:
         statements = []
@@ -244,6 +305,13 @@ class Parser:
             Tk.SEMICOLON, "expect a ';' at the end of the 'return' statement.")
         return Return(keyword, value)
 
+    def yieldstatement(self) -> Stmt:
+        keyword = self.previous()
+        value = self.expression()
+        self.consume(
+            Tk.SEMICOLON, "expect a ';' at the end of the 'yield' statement.")
+        return Yield(keyword, value)
+
     def expressionstatement(self) -> Stmt:
         # Retrieve the expression in the statement
         expr = self.expression()
@@ -363,13 +431,14 @@ class Parser:
                 if not self.match(Tk.COMMA):
                     break
         if len(arguments) > LoxConstant.max_param:
-            LoxError.error(self.peek(),
-                           "function cannot have more than 8 arguments")
+            self.error(self.peek(), "",
+                       "function cannot have more than {} arguments".format(
+                           LoxConstant.max_param))
         call_left_paren = self.consume(
             Tk.RIGHT_PAREN, "expect a ')' at the end of a function call.")
         return Call(callee, call_left_paren, arguments)
 
-    def functionbody(self, kind: FunctionType):
+    def functionbody(self, kind: FunctionType, lazy: bool = False):
         funcid = None
         functiontype = kind
         if kind is FunctionType.FUNCTION:
@@ -380,7 +449,7 @@ class Parser:
             self.consume(Tk.LEFT_PAREN, "expect a '(' after 'fun' for lambda.")
         elif kind is FunctionType.METHOD:
             funcid = self.consume(Tk.IDENTIFIER, "Expect a method name.")
-            if funcid is LoxConstant.init_method:
+            if funcid.lexeme == LoxConstant.init_method:
                 functiontype = FunctionType.INIT
             self.consume(Tk.LEFT_PAREN, "expect a '(' after method name.")
         else:
@@ -393,8 +462,9 @@ class Parser:
                 parameters.append(
                     self.consume(Tk.IDENTIFIER, "expect identifiers as function parameters."))
                 if len(parameters) > LoxConstant.max_param:
-                    LoxError.error(self.previous(
-                    ), "function can take at most " + LoxConstant.max_param + " parameters.")
+                    self.error(self.previous(), "",
+                               "function can take at most {} parameters.".format(
+                                   LoxConstant.max_param))
                 if not self.match(Tk.COMMA):
                     break
         self.consume(Tk.RIGHT_PAREN,
@@ -402,9 +472,36 @@ class Parser:
         # Parse the body of the function
         self.consume(
             Tk.LEFT_BRACE, "expect a { after function parameters list.")
+        if lazy:
+            functionexp = FunctionExp(funcid, parameters, [], functiontype)
+            functionexp.pending = LazyBody(self.skipbody())
+            return functionexp
         body = self.blockstatement()
         return FunctionExp(funcid, parameters, body, functiontype)
 
+    def skipbody(self) -> List[LoxToken]:
+        """Tokens of a body up to its matching brace, braces included."""
+        start = self.current - 1
+        depth = 1
+        while depth:
+            if self.is_at_end():
+                raise ParserError(self.peek(), "expect } at the end of block.")
+            token = self.advance()
+            if token.type == Tk.LEFT_BRACE:
+                depth += 1
+            elif token.type == Tk.RIGHT_BRACE:
+                depth -= 1
+        return self.tokens[start:self.current]
+
+    def parsebody(self) -> List[Stmt]:
+        """Statements of the tokens of a body skipped by a lazy parse."""
+        try:
+            self.consume(Tk.LEFT_BRACE, "expect a { after function parameters list.")
+            return self.blockstatement()
+        except ParserError as err:
+            self.parsererror(err)
+            return []
+
     def primary(self) -> Expr:
         if self.match(Tk.FALSE):
             return Literal(False)
@@ -445,11 +542,10 @@ class Parser:
     # Parsing the list of statements
 
     def parse(self) -> List[Stmt]:
+        statements = []
         try:
-            statements = []
             while not self.is_at_end():
-                statements.append(self.declaration())
-
-            return statements
-        except ParserError as e:
-            print(e.message)
+                statements.append(self.declaration(toplevel=True))
+        except ParserError as err:
+            self.parsererror(err)
+        return statements
@@ -0,0 +1,234 @@
+# Optimization passes on the IR of lox.ir
+#
+#     PassManager(["inline", "copyprop"]).run(module)
+#
+# Each pass rewrites the blocks of every code of a module and can be turned
+# on and off on its own (python -m lox.vm --passes, benchmarked by
+# python -m test.benchmark.passes). They keep what a program prints, its
+# runtime errors included.
+from lox.ir import Block, Const, Instr, pure
+
+
+class Pass:
+    """Rewrite of the codes of a module."""
+
+    name = None
+
+    def run(self, code, module):
+        raise NotImplementedError
+
+
+def copy(instr: Instr, slots, blocks) -> Instr:
+    """Instruction with its slots and blocks mapped."""
+    args = [slots(arg) if type(arg) is int else arg for arg in instr.args]
+    dest = slots(instr.dest) if instr.dest is not None else None
+    extra = instr.extra
+    if instr.op == "JUMP":
+        extra = blocks[extra]
+    elif instr.op == "BRANCH":
+        extra = tuple(blocks[block] for block in extra)
+    elif instr.op == "GUARD":
+        extra = (extra[0],) + tuple(blocks[block] for block in extra[1:])
+    return Instr(instr.op, dest, args, extra)
+
+
+class Inline(Pass):
+    """Inline the small functions at their call sites.
+
+    A call naming a function declaration (not reassigned, see
+    ir.Lowering.visitcall) with the right arity checks at run time that the
+    callee is still that function, then runs a copy of its blocks in the
+    caller slots; it is called as usual otherwise. Only functions without
+    closures nor captured variables, whose slots are their own, are inlined."""
+
+    name = "inline"
+    # instructions of the largest inlined function
+    limit = 24
+    # operations a function cannot have to be inlined
+    excluded = {"CLOSURE", "CLASS", "NEWCELL", "LOADCELL", "STORECELL", "BREAK"}
+
+    def inlinable(self, callee, caller) -> bool:
+        if callee is caller or callee.method or callee.free or callee.cells:
+            return False
+        instructions = list(callee.instructions())
+        return len(instructions) <= self.limit and not any(
+            instr.op in self.excluded for instr in instructions)
+
+    def run(self, code, module):
+        work = list(code.blocks)
+        while work:
+            block = work.pop()
+            for position, instr in enumerate(block.instrs):
+                if instr.op != "CALL" or instr.extra[1] is None:
+                    continue
+                callee = module.codes.get(instr.extra[1])
+                # a call with the wrong arity fails as usual
+                if callee is not None and callee.params == len(instr.args) - 1 and \
+                        self.inlinable(callee, code):
+                    work.append(self.inline(code, block, position, callee))
+                    break
+
+    def inline(self, code, block: Block, position: int, callee) -> Block:
+        """Replace the call at position by a guarded copy of callee, return
+        the block of the instructions following the call."""
+        call = block.instrs[position]
+        following = Block(block.handler)
+        following.instrs = block.instrs[position + 1:]
+        following.term = block.term
+        called = Block(block.handler)
+        called.instrs = [call]
+        called.term = Instr("JUMP", extra=following)
+        # the callee slots follow the caller ones
+        base = code.slots
+        code.slots += callee.slots
+        blocks = {old: Block() for old in callee.blocks}
+        for old, new in blocks.items():
+            new.handler = blocks[old.handler] if old.handler is not None else block.handler
+        for old, new in blocks.items():
+            new.instrs = [copy(instr, lambda slot: slot + base, blocks) for instr in old.instrs]
+            if old.term.op == "RETURN":
+                value = old.term.args[0]
+                new.instrs.append(Instr("MOVE", call.dest, [
+                    value + base if type(value) is int else value]))
+                new.term = Instr("JUMP", extra=following)
+            else:
+                new.term = copy(old.term, lambda slot: slot + base, blocks)
+        entry = blocks[callee.blocks[0]]
+        entry.instrs[:0] = [Instr("MOVE", base + index, [argument])
+                            for index, argument in enumerate(call.args[1:])]
+        block.instrs = block.instrs[:position]
+        block.term = Instr("GUARD", None, [call.args[0]], (callee, entry, called))
+        at = code.blocks.index(block) + 1
+        code.blocks[at:at] = list(blocks.values()) + [called, following]
+        return following
+
+
+class CopyPropagation(Pass):
+    """Use the source of a copy instead of its destination.
+
+    In a block, until either is assigned again; in the whole code for a
+    slot assigned once with a constant."""
+
+    name = "copyprop"
+
+    def run(self, code, module):
+        definitions = {}
+        for instr in code.instructions():
+            if instr.dest is not None:
+                definitions.setdefault(instr.dest, []).append(instr)
+        constants = {slot: instrs[0].args[0] for slot, instrs in definitions.items()
+                     if len(instrs) == 1 and instrs[0].op == "MOVE" and slot >= code.nargs +
+                     code.free and type(instrs[0].args[0]) is Const}
+        for block in code.blocks:
+            copies = {}
+            for instr in block.instrs + [block.term]:
+                instr.args = [copies.get(arg, constants.get(arg, arg)) if type(arg) is int
+                              else arg for arg in instr.args]
+                dest = instr.dest
+                if dest is None:
+                    continue
+                for slot, source in list(copies.items()):
+                    if slot == dest or source == dest:
+                        del copies[slot]
+                if instr.op == "MOVE" and instr.args[0] != dest:
+                    copies[dest] = instr.args[0]
+
+
+class DeadStores(Pass):
+    """Remove the instructions without effects whose result is never used:
+    unused variables, copies made useless by copy propagation."""
+
+    name = "deadstore"
+
+    def run(self, code, module):
+        blocks = code.blocks
+        livein = {block: set() for block in blocks}
+        changed = True
+        while changed:
+            changed = False
+            for block in reversed(blocks):
+                live = self.walk(block, livein, remove=False)
+                if live != livein[block]:
+                    livein[block] = live
+                    changed = True
+        for block in blocks:
+            self.walk(block, livein, remove=True)
+
+    def walk(self, block: Block, livein: dict, remove: bool) -> set:
+        """Slots live at the start of the block."""
+        live = set()
+        for successor in block.successors():
+            live |= livein.get(successor, set())
+        # a break raised by a call goes to the handler from any instruction
+        handler = livein.get(block.handler, set()) if block.handler is not None else set()
+        live |= set(block.term.uses())
+        kept = []
+        for instr in reversed(block.instrs):
+            if instr.dest is not None and instr.dest not in live and instr.op in pure:
+                continue
+            if instr.dest is not None:
+                live.discard(instr.dest)
+            live |= set(instr.uses()) | handler
+            kept.append(instr)
+        if remove:
+            kept.reverse()
+            block.instrs = kept
+        return live
+
+
+class Unreachable(Pass):
+    """Remove the blocks no path reaches (the code after a return or a
+    break) and merge the blocks that always follow each other."""
+
+    name = "unreachable"
+
+    def run(self, code, module):
+        entry = code.blocks[0]
+        reached, stack = set(), [entry]
+        while stack:
+            block = stack.pop()
+            if block not in reached:
+                reached.add(block)
+                stack.extend(block.successors())
+        blocks = [block for block in code.blocks if block in reached]
+        predecessors = {block: 0 for block in blocks}
+        for block in blocks:
+            for successor in block.successors():
+                predecessors[successor] += 1
+        merged = set()
+        for block in blocks:
+            if block in merged:
+                continue
+            while block.term.op == "JUMP":
+                target = block.term.extra
+                if target is entry or target is block or predecessors[target] != 1 \
+                        or target.handler is not block.handler:
+                    break
+                block.instrs += target.instrs
+                block.term = target.term
+                merged.add(target)
+        code.blocks = [block for block in blocks if block not in merged]
+
+
+# the passes, in the order they run
+PASSES = {cls.name: cls for cls in (Inline, CopyPropagation, DeadStores, Unreachable)}
+
+
+class PassManager:
+    """Run the chosen passes, in the order of PASSES, on every code."""
+
+    def __init__(self, names: list = None):
+        names = list(PASSES) if names is None else names
+        for name in names:
+            if name not in PASSES:
+                raise ValueError("unknown pass {!r}, passes are {}".format(
+                    name, ", ".join(PASSES)))
+        self.passes = [cls() for name, cls in PASSES.items() if name in names]
+
+    def run(self, module):
+        for optimization in self.passes:
+            for code in module.allcodes():
+                optimization.run(code, module)
+        for code in module.allcodes():
+            code.number()
+        return module
@@ -1,40 +1,101 @@
 from lox.visitor import Visitor
 from lox.interpreter import Interpreter
-from lox.stmt import Stmt
+from lox.stmt import Stmt, Var, Function, Class, Return
 from lox.token import LoxToken
 from lox.tokentype import TokensDic as Tk
 from lox.error import LoxError
 from lox.astprinter import PrinterVisitor
 from lox.functiontypes import FunctionType
 from lox.classtypes import ClassType
+from lox.invariant import InvariantHoister
+from lox.typeinfer import TypeInference
 from typing import List
 
 
 class Resolver(Visitor):
-    """Class to manage scopes and variable resolution."""
+    """Class to manage scopes and variable resolution.
 
-    def __init__(self, interpreter):
+    Functions also get the metadata the interpreter uses to pick their call
+    path (see FunctionExp)."""
+
+    instancenames = {Tk.lexeme_from_type[Tk.THIS], Tk.lexeme_from_type[Tk.SUPER]}
+
+    def __init__(self, interpreter, errors: list = None):
         """Resolver attributes:
 
+        errors -- list collecting the errors as Diagnostic, if any
         scopes -- is a list of scopes managed as a stack
-        interpreter -- the lox interpreter"""
+        interpreter -- the lox interpreter
+        captures -- names of each scope used by a closure, stacked as scopes
+        function_scope -- index in scopes of the current function scope
+        functions -- enclosing functions with the index of their scope
+        creates_closure -- the current function creates a closure
+        yields -- yield statements resolved so far in the current function
+        returns -- keywords of the returns of a value of the current function
+        candidates, specialized -- operations checking their operands, and
+                                   the ones type inference specialized"""
         self.interpreter = interpreter
+        self.errors = errors
         self.scopes = []
+        self.captures = []
+        self.function_scope = 0
+        self.functions = []
+        self.creates_closure = False
+        self.yields = 0
+        self.returns = []
         self.current_function = FunctionType.NONE
         self.current_class = ClassType.NONE
+        self.toplevel = True
+        self.outermost = True
+        self.candidates = 0
+        self.specialized = 0
+
+    def error(self, token: LoxToken, message: str):
+        LoxError.error(token, message, self.errors)
 
     def beginscope(self):
         self.scopes.append({})
+        self.captures.append(set())
+        if self.functions:
+            function = self.functions[-1][0]
+            function.depth = max(function.depth, len(self.scopes) - self.function_scope)
+
+    def declares(self, statements: List[Stmt]) -> bool:
+        return any(isinstance(statement, (Var, Function, Class))
+                   for statement in statements)
 
     def endscope(self):
         self.scopes.pop()
+        self.captures.pop()
 
     def resolvelist(self, statements: List[Stmt]):
         for stmt in statements:
             self.resolve(stmt)
 
     def resolve(self, obj):
+        toplevel, self.toplevel = self.toplevel, False
+        # read by the statements allowed at top level only
+        self.outermost = toplevel
+        yields = self.yields
         obj.accept(self)
+        self.toplevel = toplevel
+        if self.yields != yields and isinstance(obj, Stmt):
+            # the generator runs it in a python generator (Interpreter.generate)
+            obj.yields = True
+        if toplevel and isinstance(obj, Stmt):
+            # fully resolved: its types can be inferred
+            inference = TypeInference()
+            inference.infer(obj)
+            self.candidates += inference.candidates
+            self.specialized += inference.specialized
+
+    def resolvebody(self, functionexp):
+        """Resolve a top level function whose body was parsed lazily."""
+        self.resolve(functionexp)
+        inference = TypeInference()
+        inference.infer(functionexp)
+        self.candidates += inference.candidates
+        self.specialized += inference.specialized
 
     def resolvelocal(self, expr, name: LoxToken):
         """Look for the closest scope of a variable by its name."""
@@ -42,6 +103,14 @@ class Resolver(Visitor):
         for scope in reversed(self.scopes):
             if name.lexeme in scope:
                 self.interpreter.resolve(expr, i)
+                # a variable from outside the current function is captured
+                index = len(self.scopes) - 1 - i
+                if index < self.function_scope:
+                    self.captures[index].add(name.lexeme)
+                    for function, scope in reversed(self.functions):
+                        if scope <= index:
+                            break
+                        function.upvalues.add(name.lexeme)
                 return
             i += 1
 
@@ -59,11 +128,13 @@ class Resolver(Visitor):
         scope = self.scopes[-1]
         # If the variable is already there, send an error
         if name.lexeme in scope:
-            LoxError.error(
+            self.error(
                 name, "A variable with this name has already been declared in the same scope.")
             return
         # variable is marked False as it is not initialized yet
         scope[name.lexeme] = False
+        if self.functions and len(self.scopes) > self.function_scope:
+            self.functions[-1][0].locals += 1
 
     def define(self, name: LoxToken):
         """Mark a variable in the current / innermost scope as being initialized"""
@@ -80,20 +151,55 @@ class Resolver(Visitor):
         self.resolve(binary.right)
 
     def visitcall(self, call):
+        if self.functions:
+            self.functions[-1][0].hascalls = True
         self.resolve(call.callee)
         for arg in call.arguments:
             self.resolve(arg)
 
     def visitfunctionexp(self, functionexp):
+        if functionexp.pending is not None:
+            # resolved with its body, on the first call
+            return
         enclosing_function = self.current_function
+        enclosing_scope = self.function_scope
         self.current_function = functionexp.functiontype
-        self.beginscope()
+        self.function_scope = len(self.scopes)
+        self.functions.append((functionexp, self.function_scope))
+        self.creates_closure = False
+        enclosing_yields, enclosing_returns = self.yields, self.returns
+        self.returns = []
+        # a function declaring nothing gets no scope, its calls no environment
+        body = functionexp.body
+        functionexp.scoped = bool(functionexp.params) or self.declares(body)
+        if functionexp.scoped:
+            self.beginscope()
         for param in functionexp.params:
             self.declare(param)
             self.define(param)
-        self.resolvelist(functionexp.body)
-        self.endscope()
+        self.resolvelist(body)
+        # the frame escapes only through a closure created during the call
+        functionexp.captured = self.creates_closure
+        if functionexp.scoped:
+            self.endscope()
+        if functionexp.generator:
+            for keyword in self.returns:
+                self.error(keyword, "Cannot return a value from a generator.")
+        # the yields of the body are not the ones of the enclosing function
+        self.yields, self.returns = enclosing_yields, enclosing_returns
+        # an initializer returns 'this' from its return statements, a
+        # generator stops at its returns
+        if body and isinstance(body[-1], Return) and not functionexp.generator \
+                and functionexp.functiontype is not FunctionType.INIT:
+            functionexp.statements = body[:-1]
+            functionexp.result = body[-1]
+            functionexp.result.last = True
+        functionexp.usesthis = bool(functionexp.upvalues & self.instancenames)
+        self.functions.pop()
+        self.function_scope = enclosing_scope
         self.current_function = enclosing_function
+        # this function is itself a closure of the enclosing one
+        self.creates_closure = True
 
     def visitget(self, get):
         self.resolve(get.getobject)
@@ -114,16 +220,16 @@ class Resolver(Visitor):
 
     def visitsuper(self, var_super):
         if self.current_class is ClassType.NONE:
-            LoxError.error(
+            self.error(
                 var_super.keyword, "Cannot use 'super' outside of a class.")
         if self.current_class is ClassType.CLASS:
-            LoxError.error(
+            self.error(
                 var_super.keyword, "Cannot use 'super' in a class with no superclass.")
         self.resolvelocal(var_super, var_super.keyword)
 
     def visitthis(self, this):
         if self.current_class is ClassType.NONE:
-            LoxError.error(
+            self.error(
                 this.keyword, "Cannot use 'this' outside of a class.")
         self.resolvelocal(this, this.keyword)
 
@@ -136,13 +242,20 @@ class Resolver(Visitor):
         Do not allow the variable to initialize with itself."""
         if self.scopes and variable.name.lexeme in self.scopes[-1]:
             if self.scopes[-1][variable.name.lexeme] == False:
-                LoxError.error(
+                self.error(
                     variable.name, "Cannot use local variable in its own initializer.")
         self.resolvelocal(variable, variable.name)
 
     def visitblock(self, block):
+        # a block declaring nothing gets no scope, the interpreter no environment
+        block.hasdeclarations = self.declares(block.statements)
+        if not block.hasdeclarations:
+            self.resolvelist(block.statements)
+            block.captured = False
+            return
         self.beginscope()
         self.resolvelist(block.statements)
+        block.captured = bool(self.captures[-1])
         self.endscope()
 
     def visitbreak(self, var_break):
@@ -158,7 +271,7 @@ class Resolver(Visitor):
         self.define(var_class.name)
         if var_class.superclass is not None:
             if var_class.superclass.name.lexeme is var_class.name.lexeme:
-                LoxError.error(var_class.name,
+                self.error(var_class.name,
                                "Class cannot have the same name as super class.")
             self.resolve(var_class.superclass)
         previous_class = self.current_class
@@ -181,23 +294,55 @@ class Resolver(Visitor):
     def visitexpression(self, expression):
         self.resolve(expression.expression)
 
+    def visitfor(self, var_for):
+        if self.functions:
+            self.functions[-1][0].hasloops = True
+        # the loop variables live in their own scope, as in the desugared loop
+        self.beginscope()
+        if var_for.initializer is not None:
+            self.resolve(var_for.initializer)
+        self.resolve(var_for.condition)
+        if var_for.increment is not None:
+            self.resolve(var_for.increment)
+        self.resolve(var_for.body)
+        self.endscope()
+        InvariantHoister().hoist(var_for)
+
+    def visitforin(self, forin):
+        if self.functions:
+            self.functions[-1][0].hasloops = True
+        self.resolve(forin.iterable)
+        # the loop variable lives in its own scope, as the for loop variables
+        self.beginscope()
+        self.declare(forin.name)
+        self.define(forin.name)
+        self.resolve(forin.body)
+        self.endscope()
+
     def visitif(self, var_if):
         self.resolve(var_if.condition)
         self.resolve(var_if.thenbranch)
         if var_if.elsebranch is not None:
             self.resolve(var_if.elsebranch)
 
+    def visitimport(self, var_import):
+        # the module defines globals, a loop or a block would import it
+        # again and again
+        if not self.outermost:
+            self.error(var_import.keyword, "Can only import at top level.")
+
     def visitprint(self, print):
         self.resolve(print.expression)
 
     def visitreturn(self, var_return):
         if self.current_function == FunctionType.NONE:
-            LoxError.error(var_return.keyword,
+            self.error(var_return.keyword,
                            "Cannot return from top-level code.")
         if var_return.value is not None:
             if self.current_function is FunctionType.INIT:
-                LoxError.error(var_return.keyword,
+                self.error(var_return.keyword,
                                "Cannot return value from an initializer.")
+            self.returns.append(var_return.keyword)
             self.resolve(var_return.value)
 
     def visitvar(self, var):
@@ -208,5 +353,18 @@ class Resolver(Visitor):
         self.define(var.name)
 
     def visitwhile(self, var_while):
+        if self.functions:
+            self.functions[-1][0].hasloops = True
         self.resolve(var_while.condition)
         self.resolve(var_while.body)
+        InvariantHoister().hoist(var_while)
+
+    def visityield(self, var_yield):
+        if self.current_function == FunctionType.NONE:
+            self.error(var_yield.keyword, "Cannot yield from top-level code.")
+        elif self.current_function is FunctionType.INIT:
+            self.error(var_yield.keyword, "Cannot yield from an initializer.")
+        else:
+            self.functions[-1][0].generator = True
+        self.yields += 1
+        self.resolve(var_yield.value)
@@ -0,0 +1,341 @@
+# Runtime of the python modules written by lox.transpile
+#
+# The generated code keeps lox values as the interpreter does (None, bool,
+# int, float, str and LoxString) and calls the functions below wherever the
+# interpreter checks its operands, so both give the same results and the
+# same runtime errors. Lox functions are Function objects around python
+# functions, lox classes are python classes created by make_class whose
+# instances keep their fields in their __dict__.
+import types
+
+from lox.callable import LoxCallable
+from lox.loxstring import LoxString
+from lox.constants import LoxConstant
+from lox.error import (OperandsError, InterpreterError, DivisionByZeroError,
+                       BreakException, LoxRuntimeError)
+from lox.native import NativeObject, builtins, newnative, wait
+from lox.output import OutputSink
+from lox.token import LoxToken
+
+max_int = LoxConstant.max_int
+numbers = (int, float, complex)
+strings = (str, LoxString)
+PythonFunction = types.FunctionType
+
+
+class Context:
+    """What the natives expect from the interpreter calling them."""
+
+    loop = None
+    newnative = staticmethod(newnative)
+
+    def wait(self, coroutine) -> object:
+        return wait(coroutine, self.loop)
+
+
+context = Context()
+
+
+class Function(LoxCallable):
+    """Lox function: a python function and its lox name."""
+
+    __slots__ = ("function", "params", "name")
+
+    def __init__(self, function, name: str, params: int):
+        self.function = function
+        self.name = name
+        self.params = params
+
+    def arity(self) -> int:
+        return self.params
+
+    def call(self, interpreter, arguments: list) -> object:
+        return self.function(*arguments)
+
+    def __str__(self):
+        if self.name is None:
+            return "<function>"
+        return "<function: " + self.name + ">"
+
+
+class BoundMethod(Function):
+    """Method of a class bound to an instance."""
+
+    __slots__ = ("instance",)
+
+    def __init__(self, method, instance: "Instance"):
+        super().__init__(method, method.lox_name, method.arity)
+        self.instance = instance
+
+    def call(self, interpreter, arguments: list) -> object:
+        return self.function(self.instance, *arguments)
+
+
+class LoxClassType(type):
+    """Type of the lox classes: a lox class prints as its name."""
+
+    def __str__(cls):
+        return cls.lox_name
+
+
+class Instance(metaclass=LoxClassType):
+    """Base of the lox classes."""
+
+    lox_name = "Instance"
+    # the initializer of the class itself (an inherited one is not called)
+    initializer = None
+    params = 0
+
+    def __str__(self):
+        return type(self).lox_name
+
+
+def make_class(name: str, superclass, methods: dict) -> LoxClassType:
+    """Python class of a lox class, methods maps the python names of the
+    methods ('m_' + lox name) to python functions taking the instance first."""
+    namespace = dict(methods)
+    namespace["lox_name"] = name
+    initializer = methods.get("m_" + LoxConstant.init_method)
+    namespace["initializer"] = initializer
+    namespace["params"] = initializer.arity if initializer is not None else 0
+    return LoxClassType(name, (superclass or Instance,), namespace)
+
+
+def method(function, name: str, params: int):
+    """Tag the python function of a method with its lox name and arity."""
+    function.lox_name = name
+    function.arity = params
+    return function
+
+
+def checkclass(superclass, name: LoxToken):
+    if not isinstance(superclass, LoxClassType):
+        raise InterpreterError(name, "Superclass must be a class.")
+    return superclass
+
+
+def stringify(value: object) -> str:
+    if value is None:
+        return "nil"
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    text = str(value)
+    if type(value) is float and text.endswith(".0"):
+        return text[:-2]
+    return text
+
+
+def istruthy(value: object) -> bool:
+    return value is not None and value is not False
+
+
+#
+# Operators, as Interpreter.visitbinary and visitunary
+#
+
+def negate(right, op: LoxToken):
+    if isinstance(right, numbers):
+        return -right
+    raise OperandsError(op, "a number", right)
+
+
+def checknumbers(left, right, op: LoxToken):
+    if isinstance(left, numbers) and isinstance(right, numbers):
+        return
+    raise OperandsError(op, "two numbers", left, right)
+
+
+def checkcomparable(left, right, op: LoxToken):
+    # numbers compare with numbers, strings with strings
+    if isinstance(left, numbers) and isinstance(right, numbers):
+        return
+    if isinstance(left, strings) and isinstance(right, strings):
+        return
+    raise OperandsError(op, "two numbers or two strings", left, right)
+
+
+def intresult(result: int):
+    if -max_int <= result <= max_int:
+        return result
+    return float(result)
+
+
+def add(left, right, op: LoxToken):
+    if type(left) is int and type(right) is int:
+        return intresult(left + right)
+    if isinstance(left, strings) and isinstance(right, strings):
+        return LoxString(left, right)
+    if isinstance(left, (int, float)) and isinstance(right, (int, float)):
+        return left + right
+    if isinstance(left, strings) and isinstance(right, (int, float)):
+        return LoxString(left, stringify(right))
+    if isinstance(right, strings) and isinstance(left, (int, float)):
+        return LoxString(stringify(left), right)
+    return None
+
+
+def subtract(left, right, op: LoxToken):
+    if type(left) is int and type(right) is int:
+        return intresult(left - right)
+    checknumbers(left, right, op)
+    return left - right
+
+
+def multiply(left, right, op: LoxToken):
+    if type(left) is int and type(right) is int:
+        return intresult(left * right)
+    checknumbers(left, right, op)
+    return left * right
+
+
+def divide(left, right, op: LoxToken):
+    checknumbers(left, right, op)
+    if right == 0:
+        raise DivisionByZeroError(op)
+    return left / right
+
+
+def less(left, right, op: LoxToken):
+    if type(left) is not int or type(right) is not int:
+        checkcomparable(left, right, op)
+    return left < right
+
+
+def lessequal(left, right, op: LoxToken):
+    if type(left) is not int or type(right) is not int:
+        checkcomparable(left, right, op)
+    return left <= right
+
+
+def greater(left, right, op: LoxToken):
+    if type(left) is not int or type(right) is not int:
+        checkcomparable(left, right, op)
+    return left > right
+
+
+def greaterequal(left, right, op: LoxToken):
+    if type(left) is not int or type(right) is not int:
+        checkcomparable(left, right, op)
+    return left >= right
+
+
+#
+# Variables, calls and properties
+#
+
+def setglobal(namespace: dict, name: str, value, token: LoxToken):
+    """Value assigned to an existing global variable."""
+    if name not in namespace:
+        raise LoxRuntimeError(
+            token, "Undefined variable " + token.lexeme + " " + str(token))
+    return value
+
+
+def setbox(box: list, value):
+    box[0] = value
+    return value
+
+
+def call(callee, paren: LoxToken, *arguments):
+    if type(callee) is Function:
+        if len(arguments) != callee.params:
+            raise InterpreterError(paren, "expected {} arguments. {} were provided.".format(
+                callee.params, len(arguments)))
+        return callee.function(*arguments)
+    if isinstance(callee, LoxClassType):
+        if len(arguments) != callee.params:
+            raise InterpreterError(paren, "expected {} arguments. {} were provided.".format(
+                callee.params, len(arguments)))
+        instance = callee()
+        if callee.initializer is not None:
+            callee.initializer(instance, *arguments)
+        return instance
+    if not isinstance(callee, LoxCallable):
+        raise InterpreterError(paren, "can only call functions.")
+    arity = callee.arity()
+    if len(arguments) != arity:
+        raise InterpreterError(paren, "expected {} arguments. {} were provided.".format(
+            arity, len(arguments)))
+    return callee.call(context, list(arguments))
+
+
+def findmethod(instance, name: str, pyname: str, token: LoxToken):
+    """Field of an instance or python function of its method, for invoke."""
+    if isinstance(instance, Instance):
+        fields = instance.__dict__
+        if name in fields:
+            return fields[name]
+        function = getattr(type(instance), pyname, None)
+        if function is not None:
+            return function
+        raise InterpreterError(token, "Undefined property.")
+    if isinstance(instance, NativeObject):
+        return instance.get_property(token, None)
+    raise InterpreterError(token, "Properties are allowed on instances only.")
+
+
+def invoke(function, instance, paren: LoxToken, *arguments):
+    """Call what findmethod found, without binding the method."""
+    if type(function) is PythonFunction:
+        if len(arguments) != function.arity:
+            raise InterpreterError(paren, "expected {} arguments. {} were provided.".format(
+                function.arity, len(arguments)))
+        return function(instance, *arguments)
+    return call(function, paren, *arguments)
+
+
+def get(instance, name: str, pyname: str, token: LoxToken):
+    found = findmethod(instance, name, pyname, token)
+    if type(found) is PythonFunction:
+        return BoundMethod(found, instance)
+    return found
+
+
+def checkinstance(instance, token: LoxToken):
+    if not isinstance(instance, Instance):
+        raise InterpreterError(token, "Properties can only be set on instances.")
+    return instance
+
+
+def setfield(instance, name: str, value):
+    instance.__dict__[name] = value
+
+
+def supermethod(superclass, pyname: str, token: LoxToken):
+    function = getattr(superclass, pyname, None)
+    if function is None:
+        raise InterpreterError(token, "Properties can only be set on instances.")
+    return function
+
+
+def getsuper(superclass, instance, pyname: str, token: LoxToken):
+    return BoundMethod(supermethod(superclass, pyname, token), instance)
+
+
+def breakloop():
+    """break outside of a loop of its function: the interpreter leaves the
+    loop of the caller."""
+    raise BreakException(None)
+
+
+def run(main, output: OutputSink = None):
+    """Run the main function of a transpiled module, report the runtime
+    errors as the interpreter does."""
+    output = output if output is not None else OutputSink()
+    for name, value in builtins().items():
+        main.__globals__["g_" + name] = value
+    try:
+        main(output.writeline)
+    except (InterpreterError, LoxRuntimeError) as error:
+        output.writeline("error:  " + str(error))
+    except NameError as error:
+        # a global read before it is defined
+        if not error.name.startswith("g_"):
+            raise
+        output.writeline("error:  Undefined variable '" + error.name[2:] + "'.")
+    except RecursionError:
+        output.writeline("error:  Stack overflow.")
+    finally:
+        output.flush()
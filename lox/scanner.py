@@ -4,6 +4,7 @@
 from lox.tokentype import TokensDic
 from lox.token import LoxToken
 from lox.error import LoxError
+from lox.constants import LoxConstant
 
 
 def is_at_end(source, positions):
@@ -19,9 +20,9 @@ def advance(source, positions):
 
 
 def advance_eol(source, positions):
-    c = advance(source, positions) != '\n'
-    while c != '\n' and c != "":
-        c = advance(source, positions)
+    # the end of line is left to the scanner to count the line
+    while peek(source, positions) != '\n' and peek(source, positions) != "":
+        advance(source, positions)
 
 
 def peek(source, positions):
@@ -40,14 +41,14 @@ def peek_next(source, positions):
         return source[positions['current']+1:positions['current']+2]
 
 
-def string(source, positions):
+def string(source, positions, errors=None):
     """Scan strings."""
     while not is_at_end(source, positions) and peek(source, positions) != '"':
         if peek(source, positions) == '\n':
             positions['line'] += 1
         advance(source, positions)
     if is_at_end(source, positions):
-        LoxError.error(positions['line'], "String is not ended with quotes.")
+        LoxError.error(positions['line'], "String is not ended with quotes.", errors)
         return None
     # Closing quote
     else:
@@ -69,13 +70,18 @@ def number(source, positions):
     while is_digit(peek(source, positions)):
         advance(source, positions)
 
-    if peek(source, positions) == '.':
-        if is_digit(peek_next(source, positions)):
-            advance(source, positions)
+    # Integral literals are kept as int, the runtime promotes to float when needed
+    if peek(source, positions) == '.' and is_digit(peek_next(source, positions)):
+        advance(source, positions)
         while is_digit(peek(source, positions)):
             advance(source, positions)
+        return float(source[positions['start']:positions['current']])
 
-    return float(source[positions['start']:positions['current']])
+    value = int(source[positions['start']:positions['current']])
+    # out of the double exact range, as the runtime does
+    if value > LoxConstant.max_int:
+        return float(value)
+    return value
 
 
 def is_alpha(c):
@@ -124,8 +130,8 @@ def scan_token(source, positions, tokens, errors):
             positions['line'] += 1
     # String literals
     elif c == '"':
-        value = string(source, positions)
-        if value:
+        value = string(source, positions, errors)
+        if value is not None:
             tokens.append(LoxToken(TokensDic.STRING, "",
                                    value, positions['line']))
     # Numbers
@@ -143,6 +149,8 @@ def scan_token(source, positions, tokens, errors):
         else:
             tokens.append(LoxToken(TokensDic.IDENTIFIER,
                                    value, "", positions['line']))
+    else:
+        LoxError.error(positions['line'], "Unexpected character '" + c + "'.", errors)
 
 
 def scan_tokens(source, positions, tokens, errors):
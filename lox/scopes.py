@@ -0,0 +1,273 @@
+# Scopes of the variables of a resolved program, for the backends compiling
+# it (lox.transpile, lox.ir) and the type inference of lox.typeinfer
+#
+# Scopes finds the declaration (Binding) of each variable as the resolver
+# does, the function declaring it and how closures use it: whether it is
+# captured by a nested function, assigned after its declaration, used by
+# its own function or class.
+from lox.visitor import Visitor
+from lox.token import LoxToken
+from lox.tokentype import TokensDic as Tk
+
+
+class Binding:
+    """Local variable of the lox program.
+
+    pyname -- its python name, unique in the module
+    function -- the FunctionScope declaring it
+    top -- declared in the top scope of the function (a parameter, 'this' or
+           a variable of the body), so python closures see it as lox does
+    captured -- used by a nested function
+    assigned -- assigned after its declaration
+    recursive -- a function or class using its own name"""
+
+    def __init__(self, pyname: str, function: "FunctionScope", top: bool):
+        self.pyname = pyname
+        self.function = function
+        self.top = top
+        self.captured = False
+        self.assigned = False
+        self.recursive = False
+
+    @property
+    def bydefault(self) -> bool:
+        """Given to the nested functions using it as a default argument."""
+        return self.captured and not self.top
+
+    @property
+    def boxed(self) -> bool:
+        return self.bydefault and (self.assigned or self.recursive)
+
+
+class FunctionScope:
+    """What the python function of a lox function (or main) declares.
+
+    uses -- bindings of the enclosing functions used in it or its nested
+            functions
+    assigns -- bindings of the enclosing functions it assigns
+    globals -- python names of the globals it assigns"""
+
+    def __init__(self, parent: "FunctionScope" = None):
+        self.parent = parent
+        self.uses = {}
+        self.assigns = {}
+        self.globals = set()
+        self.loops = 0
+
+    def defaults(self) -> list:
+        return [binding.pyname for binding in self.uses if binding.bydefault]
+
+    def nonlocals(self) -> list:
+        return [binding.pyname for binding in self.assigns if not binding.bydefault]
+
+
+class Scopes(Visitor):
+    """Find the binding of each variable as the resolver does, the python
+    functions they belong to and how closures capture them."""
+
+    def __init__(self):
+        self.scopes = []
+        self.function = FunctionScope()
+        self.main = self.function
+        self.functions = {}
+        self.declared = {}
+        self.references = {}
+        # super binding of each subclass, this binding of each method
+        self.supers = {}
+        self.thises = {}
+        self.counts = {}
+        # bindings of the functions and classes being defined
+        self.defining = []
+        # a break outside of a loop of its function
+        self.straybreak = False
+
+    def pyname(self, prefix: str, name: str) -> str:
+        key = prefix + name
+        count = self.counts.get(key, 0)
+        self.counts[key] = count + 1
+        return key if count == 0 else "{}_{}".format(key, count)
+
+    def beginscope(self, top: bool = False):
+        self.scopes.append(({}, top))
+
+    def endscope(self):
+        self.scopes.pop()
+
+    def declare(self, token, pyname: str = None) -> Binding:
+        if not self.scopes:
+            # a global variable
+            self.function.globals.add("g_" + token.lexeme)
+            return None
+        scope, top = self.scopes[-1]
+        binding = Binding(pyname or self.pyname("v_", token.lexeme), self.function, top)
+        scope[token.lexeme] = binding
+        self.declared[token] = binding
+        return binding
+
+    def lookup(self, node, name: str, assign: bool = False) -> Binding:
+        for scope, _ in reversed(self.scopes):
+            binding = scope.get(name)
+            if binding is not None:
+                break
+        else:
+            if assign:
+                self.function.globals.add("g_" + name)
+            return None
+        self.references[node] = binding
+        if binding in self.defining:
+            binding.recursive = True
+        if assign:
+            binding.assigned = True
+        function = self.function
+        if binding.function is not function:
+            binding.captured = True
+            if assign:
+                function.assigns[binding] = True
+            while function is not binding.function:
+                function.uses[binding] = True
+                function = function.parent
+        return binding
+
+    def resolve(self, item):
+        if item is not None:
+            item.accept(self)
+
+    def resolvefunction(self, functionexp, method: bool = False):
+        enclosing = self.function
+        self.function = self.functions[functionexp] = FunctionScope(enclosing)
+        self.beginscope(top=True)
+        if method:
+            this = LoxToken(Tk.THIS, "this", None, functionexp.name.line)
+            self.thises[functionexp] = self.declare(this, "this")
+        for param in functionexp.params:
+            self.declare(param)
+        for statement in functionexp.body:
+            self.resolve(statement)
+        self.endscope()
+        self.function = enclosing
+
+    def visitassign(self, assign):
+        self.resolve(assign.value)
+        self.lookup(assign, assign.name.lexeme, assign=True)
+
+    def visitbinary(self, binary):
+        self.resolve(binary.left)
+        self.resolve(binary.right)
+
+    def visitcall(self, call):
+        self.resolve(call.callee)
+        for argument in call.arguments:
+            self.resolve(argument)
+
+    def visitfunctionexp(self, functionexp):
+        self.resolvefunction(functionexp)
+
+    def visitget(self, get):
+        self.resolve(get.getobject)
+
+    def visitgrouping(self, grouping):
+        self.resolve(grouping.expression)
+
+    def visitliteral(self, literal):
+        pass
+
+    def visitlogical(self, logical):
+        self.resolve(logical.left)
+        self.resolve(logical.right)
+
+    def visitset(self, var_set):
+        self.resolve(var_set.setobject)
+        self.resolve(var_set.value)
+
+    def visitsuper(self, var_super):
+        self.lookup(var_super, "super")
+        self.lookup(var_super.keyword, "this")
+
+    def visitthis(self, this):
+        self.lookup(this, "this")
+
+    def visitunary(self, unary):
+        self.resolve(unary.right)
+
+    def visitvariable(self, variable):
+        self.lookup(variable, variable.name.lexeme)
+
+    def visitblock(self, block):
+        self.beginscope()
+        for statement in block.statements:
+            self.resolve(statement)
+        self.endscope()
+
+    def visitbreak(self, var_break):
+        if self.function.loops == 0:
+            self.straybreak = True
+
+    def visitfunction(self, function):
+        binding = self.declare(function.funcexp.name)
+        self.defining.append(binding)
+        self.resolvefunction(function.funcexp)
+        self.defining.pop()
+
+    def visitclass(self, var_class):
+        binding = self.declare(var_class.name)
+        self.resolve(var_class.superclass)
+        self.defining.append(binding)
+        self.beginscope()
+        if var_class.superclass is not None:
+            pyname = self.pyname("super_", var_class.name.lexeme)
+            binding = self.supers[var_class] = Binding(pyname, self.function, False)
+            self.scopes[-1][0]["super"] = binding
+        for method in var_class.methods:
+            self.resolvefunction(method, method=True)
+        self.endscope()
+        self.defining.pop()
+
+    def visitexpression(self, expression):
+        self.resolve(expression.expression)
+
+    def visitfor(self, var_for):
+        self.beginscope()
+        self.resolve(var_for.initializer)
+        self.resolve(var_for.condition)
+        self.resolve(var_for.increment)
+        self.function.loops += 1
+        self.resolve(var_for.body)
+        self.function.loops -= 1
+        self.endscope()
+
+    def visitforin(self, forin):
+        self.resolve(forin.iterable)
+        self.beginscope()
+        self.declare(forin.name)
+        self.function.loops += 1
+        self.resolve(forin.body)
+        self.function.loops -= 1
+        self.endscope()
+
+    def visitif(self, var_if):
+        self.resolve(var_if.condition)
+        self.resolve(var_if.thenbranch)
+        self.resolve(var_if.elsebranch)
+
+    def visitimport(self, var_import):
+        pass
+
+    def visitprint(self, print):
+        self.resolve(print.expression)
+
+    def visitreturn(self, var_return):
+        self.resolve(var_return.value)
+
+    def visitvar(self, var):
+        # the initializer cannot see the variable (the resolver rejects it)
+        self.resolve(var.initializer)
+        self.declare(var.name)
+
+    def visitwhile(self, var_while):
+        self.resolve(var_while.condition)
+        self.function.loops += 1
+        self.resolve(var_while.body)
+        self.function.loops -= 1
+
+    def visityield(self, var_yield):
+        self.resolve(var_yield.value)
@@ -0,0 +1,71 @@
+# Heap snapshots: run a prelude once, start new interpreters from its globals
+#
+#     python3 -m lox.lox prelude.lox --save-snapshot prelude.snap
+#     python3 -m lox.lox --snapshot prelude.snap script.lox
+#
+# A snapshot pickles the global environment of an interpreter: the values of
+# the globals, with the functions (their FunctionExp trees and closure
+# environments), the classes and their methods, the instances and strings
+# they reach. The depths the resolver gave to the local variables of these
+# trees are pickled along, so the restored functions need no new resolution.
+# The caches the interpreter keeps on the trees stay valid: the global cells
+# belong to the restored environment, the reusable call frames are dropped.
+#
+# Native functions are pickled as any python object: the ones given by the
+# host (lox.api globals) must be picklable or defined again after restoring.
+import copyreg
+import gc
+import io
+import pickle
+
+from lox.expr import FunctionExp
+
+# format of the snapshots this module reads
+VERSION = 1
+
+
+def reduce_function(fundec: FunctionExp):
+    """A function declaration without its reusable call frames."""
+    state = dict(vars(fundec))
+    state["frames"] = []
+    return copyreg.__newobj__, (type(fundec),), state
+
+
+class SnapshotPickler(pickle.Pickler):
+    dispatch_table = copyreg.dispatch_table.copy()
+    dispatch_table[FunctionExp] = reduce_function
+
+
+def take(interpreter) -> bytes:
+    """Snapshot of the globals of an interpreter, between runs."""
+    stream = io.BytesIO()
+    SnapshotPickler(stream, pickle.HIGHEST_PROTOCOL).dump(
+        (VERSION, interpreter.global_env, interpreter.locals))
+    return stream.getvalue()
+
+
+def restore(interpreter, data: bytes):
+    """Replace the globals of an interpreter by the ones of a snapshot, its
+    output and instrumentation are kept. ValueError on another format."""
+    # the collector would walk the growing graph many times while it loads
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        version, global_env, variables = pickle.loads(data)
+    finally:
+        if enabled:
+            gc.enable()
+    if version != VERSION:
+        raise ValueError("snapshot format {}, expected {}".format(version, VERSION))
+    interpreter.global_env = interpreter.current_env = global_env
+    interpreter.locals.update(variables)
+
+
+def save(interpreter, path: str):
+    with open(path, "wb") as f:
+        f.write(take(interpreter))
+
+
+def load(interpreter, path: str):
+    with open(path, "rb") as f:
+        restore(interpreter, f.read())
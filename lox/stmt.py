@@ -4,12 +4,28 @@ from lox.expr import Expr, Variable, FunctionExp
 
 
 class Stmt:
-    pass
+    # first token of the statement, set by the parser
+    first = None
+    # set when the statement runs under lox.coverage
+    covered = False
+    # set by the resolver: the statement holds a yield of its function
+    yields = False
+
+    @property
+    def line(self) -> int:
+        """Line of the statement, it follows the token when edits move it."""
+        if self.first is None:
+            return None
+        return self.first.line
 
 
 class Block(Stmt):
     def __init__(self, statements: List[Stmt]):
         self.statements = statements
+        # set by the resolver: the block declares variables (needs a scope)
+        self.hasdeclarations = True
+        # set by the resolver: a variable of the block is used by a closure
+        self.captured = True
 
     def accept(self, visitor):
         return visitor.visit(self)
@@ -49,6 +65,27 @@ class Expression(Stmt):
         return visitor.visit(self)
 
 
+class For(Stmt):
+    def __init__(self, initializer: Stmt, condition: Expr, increment: Expr, body: Stmt):
+        self.initializer = initializer
+        self.condition = condition
+        self.increment = increment
+        self.body = body
+
+    def accept(self, visitor):
+        return visitor.visit(self)
+
+
+class ForIn(Stmt):
+    def __init__(self, name: LoxToken, iterable: Expr, body: Stmt):
+        self.name = name
+        self.iterable = iterable
+        self.body = body
+
+    def accept(self, visitor):
+        return visitor.visit(self)
+
+
 class If(Stmt):
     def __init__(self, condition: Expr, thenbranch: Stmt, elsebranch: Stmt):
         self.condition = condition
@@ -59,6 +96,15 @@ class If(Stmt):
         return visitor.visit(self)
 
 
+class Import(Stmt):
+    def __init__(self, keyword: LoxToken, path: LoxToken):
+        self.keyword = keyword
+        self.path = path
+
+    def accept(self, visitor):
+        return visitor.visit(self)
+
+
 class Print(Stmt):
     def __init__(self, expression: Expr):
         self.expression = expression
@@ -71,6 +117,9 @@ class Return(Stmt):
     def __init__(self, keyword: LoxToken, value: Expr):
         self.keyword = keyword
         self.value = value
+        # set by the resolver: last statement of a function body, it gives
+        # its value to the call instead of raising
+        self.last = False
 
     def accept(self, visitor):
         return visitor.visit(self)
@@ -92,3 +141,14 @@ class While(Stmt):
 
     def accept(self, visitor):
         return visitor.visit(self)
+
+
+class Yield(Stmt):
+    yields = True
+
+    def __init__(self, keyword: LoxToken, value: Expr):
+        self.keyword = keyword
+        self.value = value
+
+    def accept(self, visitor):
+        return visitor.visit(self)
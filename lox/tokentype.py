@@ -32,6 +32,8 @@ class TokensDefinition:
     FUN = "FUN"
     FOR = "FOR"
     IF = "IF"
+    IMPORT = "IMPORT"
+    IN = "IN"
     NIL = "NIL"
     OR = "OR"
     PRINT = "PRINT"
@@ -41,6 +43,7 @@ class TokensDefinition:
     TRUE = "TRUE"
     VAR = "VAR"
     WHILE = "WHILE"
+    YIELD = "YIELD"
     EOF = "EOF"
 
     def __init__(self):
@@ -76,6 +79,8 @@ class TokensDefinition:
             self.FUN: ('fun', 'reserved'),
             self.FOR: ('for', 'reserved'),
             self.IF: ('if', 'reserved'),
+            self.IMPORT: ('import', 'reserved'),
+            self.IN: ('in', 'reserved'),
             self.NIL: ('nil', 'reserved'),
             self.OR: ('or', 'reserved'),
             self.PRINT: ('print', 'reserved'),
@@ -85,6 +90,7 @@ class TokensDefinition:
             self.TRUE: ('true', 'reserved'),
             self.VAR: ('var', 'reserved'),
             self.WHILE: ('while', 'reserved'),
+            self.YIELD: ('yield', 'reserved'),
             self.EOF: (None, None)
         }
         self.types = []
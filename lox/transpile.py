@@ -0,0 +1,491 @@
+# Ahead of time compilation of a lox program to a python module
+#
+#     python -m lox.transpile fib.lox -o fib.py   # then: python fib.py
+#     code = lox.transpile.load(source)           # compiled python code
+#     lox.transpile.run(source)
+#
+# Lox functions become python functions nested as in the lox source, their
+# local variables python locals, lox classes python classes built by
+# lox.runtime.make_class, break and return the python statements. Global
+# variables are the module globals, named g_<name>, the top level code runs
+# in main(write) with write receiving the printed lines.
+#
+# Python closures see the variables of their enclosing functions, not of
+# one run of a block: a variable declared in a block (a loop body) and used
+# by a function created in it is given to the function as a default
+# argument, in a one item list (a box) when it is assigned after the
+# function is created.
+#
+# The results and the runtime errors are the ones of the interpreter (see
+# lox.runtime), the instrumentation of the interpreter (budget, heap,
+# allocations) does not apply to transpiled programs.
+import argparse
+import sys
+
+from lox.visitor import Visitor
+from lox.expr import Binary, Unary, Literal, Logical, Grouping, Invariant, Get, Super, Assign, Variable
+from lox.tokentype import TokensDic as Tk
+from lox.constants import LoxConstant
+from lox.scopes import Scopes, FunctionScope
+from lox.error import Diagnostic
+from lox import api
+
+# runtime names used by the generated code
+runtime_names = ["Function", "make_class", "method", "checkclass", "stringify",
+                 "negate", "add", "subtract", "multiply", "divide", "less",
+                 "lessequal", "greater", "greaterequal", "setglobal", "setbox",
+                 "call", "findmethod", "invoke", "get", "checkinstance", "setfield",
+                 "supermethod", "getsuper", "breakloop", "BreakException", "run"]
+
+# helpers of the binary operators, the int ones are inlined for simple operands
+arithmetic = {Tk.PLUS: ("+", "add"), Tk.MINUS: ("-", "subtract"), Tk.STAR: ("*", "multiply")}
+comparisons = {Tk.LESS: ("<", "less"), Tk.LESS_EQUAL: ("<=", "lessequal"),
+               Tk.GREATER: (">", "greater"), Tk.GREATER_EQUAL: (">=", "greaterequal")}
+equalities = {Tk.EQUAL_EQUAL: "==", Tk.BANG_EQUAL: "!="}
+
+
+class Transpiler(Visitor):
+    """Python source of a resolved lox program.
+
+    Expression visitors return python expressions, statement visitors write
+    python lines. The python functions of lambdas are written before the
+    statement using them."""
+
+    def __init__(self, scopes: Scopes):
+        self.scopes = scopes
+        self.lines = []
+        self.indent = 0
+        self.tokens = {}
+        self.temps = 0
+        self.function = scopes.main
+        self.loops = 0
+
+    def transpile(self, statements: list) -> str:
+        self.line("def main(write):")
+        self.indent += 1
+        self.declarations(self.scopes.main)
+        self.suite(statements)
+        self.indent -= 1
+        header = ["# generated by lox.transpile",
+                  "from lox.runtime import " + ", ".join(runtime_names),
+                  "from lox.token import LoxToken",
+                  "", "G = globals()"]
+        for token, name in self.tokens.values():
+            header.append("{} = LoxToken({!r}, {!r}, {!r}, {!r})".format(
+                name, token.type, token.lexeme, token.literal, token.line))
+        footer = ["", "", "if __name__ == \"__main__\":", "    run(main)"]
+        return "\n".join(header + ["", ""] + self.lines + footer) + "\n"
+
+    def line(self, text: str):
+        self.lines.append("    " * self.indent + text)
+
+    def suite(self, statements: list):
+        """Statements of an indented block, pass if they write nothing."""
+        count = len(self.lines)
+        for statement in statements:
+            statement.accept(self)
+        if len(self.lines) == count:
+            self.line("pass")
+
+    def block(self, statement):
+        self.indent += 1
+        self.suite([statement])
+        self.indent -= 1
+
+    def token(self, token) -> str:
+        """Name of the module constant holding a token used in errors."""
+        if id(token) not in self.tokens:
+            self.tokens[id(token)] = (token, "k_{}".format(len(self.tokens)))
+        return self.tokens[id(token)][1]
+
+    def temp(self) -> str:
+        self.temps += 1
+        return "t_{}".format(self.temps)
+
+    def expr(self, expr) -> str:
+        return expr.accept(self)
+
+    def isboolean(self, expr) -> bool:
+        """The expression gives a python bool, usable as a condition as is."""
+        while type(expr) in (Grouping, Invariant):
+            expr = expr.expression
+        if isinstance(expr, Binary):
+            return expr.operator.type in comparisons or expr.operator.type in equalities
+        if isinstance(expr, Unary):
+            return expr.operator.type == Tk.BANG
+        if type(expr) is Literal:
+            return type(expr.value) is bool
+        if type(expr) is Logical:
+            return self.isboolean(expr.left) and self.isboolean(expr.right)
+        return False
+
+    def condition(self, expr) -> str:
+        code = self.expr(expr)
+        if self.isboolean(expr):
+            return code
+        temp = self.temp()
+        return "({} := {}) is not None and {} is not False".format(temp, code, temp)
+
+    def simple(self, expr) -> bool:
+        """The python code of the expression is a name or a number: it can
+        be evaluated twice."""
+        while type(expr) in (Grouping, Invariant):
+            expr = expr.expression
+        if type(expr) is Literal:
+            return type(expr.value) in (int, float)
+        binding = self.scopes.references.get(expr)
+        if binding is not None:
+            return not binding.boxed
+        return type(expr) is Variable
+
+    def isint(self, expr) -> bool:
+        while type(expr) in (Grouping, Invariant):
+            expr = expr.expression
+        return type(expr) is Literal and type(expr.value) is int
+
+    def declarations(self, function: FunctionScope):
+        if function.globals:
+            self.line("global " + ", ".join(sorted(function.globals)))
+        nonlocals = function.nonlocals()
+        if nonlocals:
+            self.line("nonlocal " + ", ".join(nonlocals))
+
+    def definefunction(self, functionexp, pyname: str, method: bool = False):
+        """Write the python function of a lox function."""
+        function = self.scopes.functions[functionexp]
+        params = ["this"] if method else []
+        params += [self.scopes.declared[param].pyname for param in functionexp.params]
+        defaults = function.defaults()
+        if defaults:
+            params.append("*")
+            params += ["{}={}".format(name, name) for name in defaults]
+        self.line("def {}({}):".format(pyname, ", ".join(params)))
+        enclosing, loops = self.function, self.loops
+        self.function, self.loops = function, 0
+        self.indent += 1
+        self.declarations(function)
+        self.suite(functionexp.body)
+        self.indent -= 1
+        self.function, self.loops = enclosing, loops
+
+    def define(self, token, value: str):
+        """Write the declaration of a variable."""
+        binding = self.scopes.declared.get(token)
+        if binding is None:
+            self.line("g_{} = {}".format(token.lexeme, value))
+        elif binding.boxed:
+            self.line("{} = [{}]".format(binding.pyname, value))
+        else:
+            self.line("{} = {}".format(binding.pyname, value))
+
+    def assign(self, token, value: str):
+        """Write the assignment of a declared variable (functions and classes
+        boxed before their definition)."""
+        binding = self.scopes.declared.get(token)
+        if binding is None:
+            self.line("g_{} = {}".format(token.lexeme, value))
+        elif binding.boxed:
+            self.line("{}[0] = {}".format(binding.pyname, value))
+        else:
+            self.line("{} = {}".format(binding.pyname, value))
+
+    def prebox(self, token):
+        binding = self.scopes.declared.get(token)
+        if binding is not None and binding.boxed:
+            self.line("{} = [None]".format(binding.pyname))
+
+    def loop(self, header: str, body, increment=None):
+        """Write a loop, a break raised by a called function stops it too."""
+        wrap = self.scopes.straybreak
+        if wrap:
+            self.line("try:")
+            self.indent += 1
+        self.line(header)
+        self.indent += 1
+        self.loops += 1
+        count = len(self.lines)
+        body.accept(self)
+        if increment is not None:
+            self.statement(increment)
+        if len(self.lines) == count:
+            self.line("pass")
+        self.loops -= 1
+        self.indent -= 1
+        if wrap:
+            self.indent -= 1
+            self.line("except BreakException:")
+            self.line("    pass")
+
+    def statement(self, expr):
+        """Write an expression evaluated for its effects."""
+        if type(expr) is Assign:
+            binding = self.scopes.references.get(expr)
+            value = self.expr(expr.value)
+            if binding is None:
+                name = "g_" + expr.name.lexeme
+                self.line("{} = setglobal(G, {!r}, {}, {})".format(
+                    name, name, value, self.token(expr.name)))
+            elif binding.boxed:
+                self.line("{}[0] = {}".format(binding.pyname, value))
+            else:
+                self.line("{} = {}".format(binding.pyname, value))
+        else:
+            self.line(self.expr(expr))
+
+    #
+    # Expressions
+    #
+
+    def variable(self, node, name: str) -> str:
+        binding = self.scopes.references.get(node)
+        if binding is None:
+            return "g_" + name
+        if binding.boxed:
+            return binding.pyname + "[0]"
+        return binding.pyname
+
+    def visitassign(self, assign):
+        binding = self.scopes.references.get(assign)
+        value = self.expr(assign.value)
+        if binding is None:
+            name = "g_" + assign.name.lexeme
+            return "({} := setglobal(G, {!r}, {}, {}))".format(
+                name, name, value, self.token(assign.name))
+        if binding.boxed:
+            return "setbox({}, {})".format(binding.pyname, value)
+        return "({} := {})".format(binding.pyname, value)
+
+    def visitbinary(self, binary):
+        left = self.expr(binary.left)
+        right = self.expr(binary.right)
+        optype = binary.operator.type
+        if optype in equalities:
+            return "({} {} {})".format(left, equalities[optype], right)
+        if optype == Tk.SLASH:
+            return "divide({}, {}, {})".format(left, right, self.token(binary.operator))
+        operator, helper = arithmetic.get(optype) or comparisons[optype]
+        call = "{}({}, {}, {})".format(helper, left, right, self.token(binary.operator))
+        if not (self.simple(binary.left) and self.simple(binary.right)):
+            return call
+        # int operands are the common case: no call
+        checks = ["type({}) is int".format(code)
+                  for code, expr in ((left, binary.left), (right, binary.right))
+                  if not self.isint(expr)]
+        check = " and ".join(checks) if checks else "True"
+        if optype in comparisons:
+            return "({} {} {} if {} else {})".format(left, operator, right, check, call)
+        temp = self.temp()
+        return "({} if {} and -{} <= ({} := {} {} {}) <= {} else {})".format(
+            temp, check, LoxConstant.max_int, temp, left, operator, right,
+            LoxConstant.max_int, call)
+
+    def visitcall(self, call):
+        callee = call.callee
+        arguments = "".join(", " + self.expr(argument) for argument in call.arguments)
+        paren = self.token(call.paren)
+        if type(callee) is Get:
+            instance = self.temp()
+            found = "findmethod({} := {}, {!r}, {!r}, {})".format(
+                instance, self.expr(callee.getobject), callee.name.lexeme,
+                "m_" + callee.name.lexeme, self.token(callee.name))
+            return "invoke({}, {}, {}{})".format(found, instance, paren, arguments)
+        if type(callee) is Super:
+            found = "supermethod({}, {!r}, {})".format(
+                self.variable(callee, "super"), "m_" + callee.method.lexeme,
+                self.token(callee.method))
+            return "invoke({}, {}, {}{})".format(
+                found, self.variable(callee.keyword, "this"), paren, arguments)
+        function = self.expr(callee)
+        if not self.simple(callee):
+            return "call({}, {}{})".format(function, paren, arguments)
+        # a lox function of the right arity is called directly
+        return "({}.function({}) if type({}) is Function and {}.params == {} else call({}, {}{}))".format(
+            function, arguments[2:], function, function, len(call.arguments),
+            function, paren, arguments)
+
+    def visitfunctionexp(self, functionexp):
+        pyname = self.scopes.pyname("f_", "lambda")
+        self.definefunction(functionexp, pyname)
+        return "Function({}, None, {})".format(pyname, len(functionexp.params))
+
+    def visitget(self, get):
+        return "get({}, {!r}, {!r}, {})".format(
+            self.expr(get.getobject), get.name.lexeme, "m_" + get.name.lexeme,
+            self.token(get.name))
+
+    def visitgrouping(self, grouping):
+        return "(" + self.expr(grouping.expression) + ")"
+
+    def visitliteral(self, literal):
+        return repr(literal.value)
+
+    def visitlogical(self, logical):
+        left = self.expr(logical.left)
+        right = self.expr(logical.right)
+        if self.isboolean(logical.left) and self.isboolean(logical.right):
+            operator = "or" if logical.operator.type == Tk.OR else "and"
+            return "({} {} {})".format(left, operator, right)
+        temp = self.temp()
+        truthy = "({} := {}) is not None and {} is not False".format(temp, left, temp)
+        if logical.operator.type == Tk.OR:
+            return "({} if {} else {})".format(temp, truthy, right)
+        return "({} if {} else {})".format(right, truthy, temp)
+
+    def visitset(self, var_set):
+        return "setfield(checkinstance({}, {}), {!r}, {})".format(
+            self.expr(var_set.setobject), self.token(var_set.name),
+            var_set.name.lexeme, self.expr(var_set.value))
+
+    def visitsuper(self, var_super):
+        return "getsuper({}, {}, {!r}, {})".format(
+            self.variable(var_super, "super"), self.variable(var_super.keyword, "this"),
+            "m_" + var_super.method.lexeme, self.token(var_super.method))
+
+    def visitthis(self, this):
+        return self.variable(this, "this")
+
+    def visitunary(self, unary):
+        if unary.operator.type == Tk.BANG:
+            return "(not {})".format(self.condition(unary.right))
+        if self.isint(unary.right) or (type(unary.right) is Literal and type(unary.right.value) is float):
+            return "(-{})".format(self.expr(unary.right))
+        return "negate({}, {})".format(self.expr(unary.right), self.token(unary.operator))
+
+    def visitvariable(self, variable):
+        return self.variable(variable, variable.name.lexeme)
+
+    #
+    # Statements
+    #
+
+    def visitblock(self, block):
+        for statement in block.statements:
+            statement.accept(self)
+
+    def visitbreak(self, var_break):
+        self.line("break" if self.loops else "breakloop()")
+
+    def visitfunction(self, function):
+        funcexp = function.funcexp
+        name = funcexp.name.lexeme
+        self.prebox(funcexp.name)
+        pyname = self.scopes.pyname("f_", name)
+        self.definefunction(funcexp, pyname)
+        value = "Function({}, {!r}, {})".format(pyname, name, len(funcexp.params))
+        binding = self.scopes.declared.get(funcexp.name)
+        if binding is not None and binding.boxed:
+            self.assign(funcexp.name, value)
+        else:
+            self.define(funcexp.name, value)
+
+    def visitclass(self, var_class):
+        name = var_class.name.lexeme
+        superclass = "None"
+        if var_class.superclass is not None:
+            superclass = self.scopes.supers[var_class].pyname
+            self.line("{} = checkclass({}, {})".format(
+                superclass, self.expr(var_class.superclass), self.token(var_class.name)))
+        self.prebox(var_class.name)
+        methods = []
+        for functionexp in var_class.methods:
+            pyname = self.scopes.pyname("m_{}_".format(name), functionexp.name.lexeme)
+            self.definefunction(functionexp, pyname, method=True)
+            methods.append("{!r}: method({}, {!r}, {})".format(
+                "m_" + functionexp.name.lexeme, pyname, functionexp.name.lexeme,
+                len(functionexp.params)))
+        value = "make_class({!r}, {}, {{{}}})".format(name, superclass, ", ".join(methods))
+        binding = self.scopes.declared.get(var_class.name)
+        if binding is not None and binding.boxed:
+            self.assign(var_class.name, value)
+        else:
+            self.define(var_class.name, value)
+
+    def visitexpression(self, expression):
+        self.statement(expression.expression)
+
+    def visitfor(self, var_for):
+        if var_for.initializer is not None:
+            var_for.initializer.accept(self)
+        self.loop("while {}:".format(self.condition(var_for.condition)),
+                  var_for.body, var_for.increment)
+
+    def visitif(self, var_if):
+        self.line("if {}:".format(self.condition(var_if.condition)))
+        self.block(var_if.thenbranch)
+        if var_if.elsebranch is not None:
+            self.line("else:")
+            self.block(var_if.elsebranch)
+
+    def visitforin(self, forin):
+        raise api.CompileError([str(Diagnostic(forin.name.line, "",
+                                               "For in loops only run on the interpreter."))])
+
+    def visitimport(self, var_import):
+        raise api.CompileError([str(Diagnostic(var_import.keyword.line, "",
+                                               "Imports only run on the interpreter."))])
+
+    def visitprint(self, print):
+        self.line("write(stringify({}))".format(self.expr(print.expression)))
+
+    def visitreturn(self, var_return):
+        if var_return.value is None:
+            self.line("return")
+        else:
+            self.line("return " + self.expr(var_return.value))
+
+    def visitvar(self, var):
+        value = "None"
+        if var.initializer is not None:
+            value = self.expr(var.initializer)
+        self.define(var.name, value)
+
+    def visitwhile(self, var_while):
+        self.loop("while {}:".format(self.condition(var_while.condition)), var_while.body)
+
+    def visityield(self, var_yield):
+        raise api.CompileError([str(Diagnostic(var_yield.keyword.line, "",
+                                               "Generators only run on the interpreter."))])
+
+
+def transpile(source: str) -> str:
+    """Python source of a lox source, CompileError on errors."""
+    statements = api.compile(source).statements
+    scopes = Scopes()
+    for statement in statements:
+        scopes.resolve(statement)
+    return Transpiler(scopes).transpile(statements)
+
+
+def load(source: str, path: str = None):
+    """Compiled python code of a lox source, the python source is written to
+    path when given."""
+    python = transpile(source)
+    if path is not None:
+        with open(path, "w") as f:
+            f.write(python)
+    return compile(python, path or "<lox>", "exec")
+
+
+def run(code, output=None):
+    """Run compiled python code (see load) as a new program."""
+    from lox import runtime
+    namespace = {"__name__": "lox"}
+    exec(code, namespace)
+    runtime.run(namespace["main"], output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile lox files to python")
+    parser.add_argument("file", help="lox source file")
+    parser.add_argument("-o", "--output", help="python file to write")
+    parser.add_argument("--run", action="store_true", help="run the program")
+    args = parser.parse_args()
+    with open(args.file) as f:
+        source = f.read()
+    try:
+        code = load(source, args.output)
+    except api.CompileError as error:
+        print(error, file=sys.stderr)
+        sys.exit(65)
+    if args.run or args.output is None:
+        run(code)
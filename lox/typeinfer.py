@@ -0,0 +1,321 @@
+# Flow sensitive type inference, run by the resolver on each resolved top
+# level statement
+#
+# The type of a value is the set of the kinds it may have (a number, a
+# string...), None when anything is possible. Local variables of the
+# function being analyzed have a type at each point of its code, from their
+# declaration and assignments, narrowed by the operations that check them:
+# after 'n - 1' ran, n passed the number check. Branches join their types,
+# loops are analyzed until their types no longer grow.
+#
+# The arithmetic operations and comparisons whose operands are proven to
+# pass the number checks of the interpreter become NumericBinary or
+# NumericUnary nodes, evaluated without the checks. The others keep them and
+# raise OperandsError as before.
+import operator
+
+from lox.visitor import Visitor
+from lox.expr import Unary, Grouping, Invariant, Literal, Variable, NumericBinary, NumericUnary
+from lox.scopes import Scopes
+from lox.tokentype import TokensDic as Tk
+
+NUMBER = frozenset(["number"])
+STRING = frozenset(["string"])
+BOOLEAN = frozenset(["boolean"])
+NIL = frozenset(["nil"])
+INSTANCE = frozenset(["instance"])
+CALLABLE = frozenset(["callable"])
+# what passes the number checks of the interpreter (booleans are python ints)
+CHECKED = NUMBER | BOOLEAN
+# what passes the checks of the comparisons
+COMPARABLE = CHECKED | STRING
+
+arithmetic = {Tk.MINUS, Tk.STAR, Tk.SLASH}
+comparisons = {Tk.LESS, Tk.LESS_EQUAL, Tk.GREATER, Tk.GREATER_EQUAL}
+
+# operations of the specialized nodes
+functions = {Tk.PLUS: operator.add, Tk.MINUS: operator.sub, Tk.STAR: operator.mul,
+             Tk.SLASH: operator.truediv, Tk.LESS: operator.lt, Tk.LESS_EQUAL: operator.le,
+             Tk.GREATER: operator.gt, Tk.GREATER_EQUAL: operator.ge}
+
+
+def union(first, second):
+    if first is None or second is None:
+        return None
+    return first | second
+
+
+def join(first: dict, second: dict) -> dict:
+    """Types after either of two paths, a state is None on no path."""
+    if first is None:
+        return second
+    if second is None:
+        return first
+    return {binding: union(kind, second[binding])
+            for binding, kind in first.items() if binding in second}
+
+
+def simple(expr) -> bool:
+    """Evaluating the expression changes nothing."""
+    while type(expr) in (Grouping, Invariant):
+        expr = expr.expression
+    return type(expr) in (Literal, Variable)
+
+
+class TypeInference(Visitor):
+    """Specialize the numeric operations of a statement.
+
+    Expression visitors return the type of the expression, statements
+    update the types of the variables (state, None where no path goes).
+
+    candidates -- operations checking their operands
+    specialized -- the ones proven not to need it"""
+
+    def __init__(self):
+        self.scopes = Scopes()
+        self.function = None
+        self.state = {}
+        self.breaks = None
+        # operation: all its visits had proven operands
+        self.proven = {}
+        self.candidates = 0
+        self.specialized = 0
+
+    def infer(self, statement):
+        self.scopes.resolve(statement)
+        self.function = self.scopes.main
+        statement.accept(self)
+        for node, proven in self.proven.items():
+            self.candidates += 1
+            if proven:
+                self.specialized += 1
+                # same attributes, evaluated by another visitor method
+                if isinstance(node, Unary):
+                    node.__class__ = NumericUnary
+                else:
+                    node.__class__ = NumericBinary
+                    node.function = functions[node.operator.type]
+
+    def prove(self, node, proven: bool):
+        self.proven[node] = self.proven.get(node, True) and proven
+
+    def tracked(self, node):
+        """Binding of a variable whose type is followed, None otherwise:
+        globals, variables of enclosing functions and variables closures
+        may assign are not."""
+        binding = self.scopes.references.get(node)
+        if binding is None or binding.function is not self.function or (
+                binding.captured and binding.assigned):
+            return None
+        return binding
+
+    def narrow(self, expr, kind: frozenset):
+        """The value of a variable passed a check."""
+        while type(expr) in (Grouping, Invariant):
+            expr = expr.expression
+        if type(expr) is not Variable:
+            return
+        binding = self.tracked(expr)
+        if binding is not None:
+            current = self.state.get(binding)
+            self.state[binding] = kind if current is None else current & kind
+
+    def evaluate(self, expr):
+        if expr is None or self.state is None:
+            return None
+        return expr.accept(self)
+
+    def execute(self, statement):
+        if statement is not None and self.state is not None:
+            statement.accept(self)
+
+    def function_body(self, functionexp, method: bool = False):
+        """Analyze a function on its own: its parameters may be anything."""
+        saved = (self.function, self.state, self.breaks)
+        self.function = self.scopes.functions[functionexp]
+        self.state, self.breaks = {}, None
+        if method:
+            self.state[self.scopes.thises[functionexp]] = INSTANCE
+        for statement in functionexp.body:
+            self.execute(statement)
+        self.function, self.state, self.breaks = saved
+
+    def define(self, token, kind):
+        binding = self.scopes.declared.get(token)
+        if binding is not None:
+            self.state[binding] = kind
+
+    def loop(self, condition, body, increment=None):
+        breaks = self.breaks
+        while True:
+            head = dict(self.state)
+            self.breaks = None
+            self.evaluate(condition)
+            exit = self.state
+            self.state = dict(exit) if exit is not None else None
+            self.execute(body)
+            self.evaluate(increment)
+            grown = join(head, self.state)
+            if grown == head:
+                break
+            self.state = grown
+        self.state = join(exit, self.breaks)
+        self.breaks = breaks
+
+    #
+    # Expressions
+    #
+
+    def visitassign(self, assign):
+        kind = self.evaluate(assign.value)
+        binding = self.tracked(assign)
+        if binding is not None:
+            self.state[binding] = kind
+        return kind
+
+    def visitbinary(self, binary):
+        left = self.evaluate(binary.left)
+        right = self.evaluate(binary.right)
+        optype = binary.operator.type
+        if optype in (Tk.EQUAL_EQUAL, Tk.BANG_EQUAL):
+            return BOOLEAN
+        checked = left is not None and right is not None
+        if optype == Tk.PLUS:
+            if checked and left <= CHECKED and right <= CHECKED:
+                self.prove(binary, True)
+                return NUMBER
+            self.prove(binary, False)
+            if checked and STRING in (left, right) and (left | right) <= COMPARABLE:
+                return STRING
+            return None
+        accepted = CHECKED if optype in arithmetic else COMPARABLE
+        self.prove(binary, checked and left <= CHECKED and right <= CHECKED)
+        # the check passed if the evaluation goes on, the right operand is
+        # read last, the left one only if the right one changes nothing
+        self.narrow(binary.right, accepted)
+        if simple(binary.right):
+            self.narrow(binary.left, accepted)
+        return NUMBER if optype in arithmetic else BOOLEAN
+
+    def visitcall(self, call):
+        self.evaluate(call.callee)
+        for argument in call.arguments:
+            self.evaluate(argument)
+        return None
+
+    def visitfunctionexp(self, functionexp):
+        self.function_body(functionexp)
+        return CALLABLE
+
+    def visitget(self, get):
+        self.evaluate(get.getobject)
+        return None
+
+    def visitgrouping(self, grouping):
+        return self.evaluate(grouping.expression)
+
+    def visitliteral(self, literal):
+        value = literal.value
+        if value is None:
+            return NIL
+        if type(value) is bool:
+            return BOOLEAN
+        if type(value) in (int, float):
+            return NUMBER
+        return STRING
+
+    def visitlogical(self, logical):
+        left = self.evaluate(logical.left)
+        skipped = dict(self.state)
+        right = self.evaluate(logical.right)
+        self.state = join(skipped, self.state)
+        return union(left, right)
+
+    def visitset(self, var_set):
+        self.evaluate(var_set.setobject)
+        self.evaluate(var_set.value)
+        return NIL
+
+    def visitsuper(self, var_super):
+        return CALLABLE
+
+    def visitthis(self, this):
+        binding = self.tracked(this)
+        return self.state.get(binding) if binding is not None else None
+
+    def visitunary(self, unary):
+        right = self.evaluate(unary.right)
+        if unary.operator.type == Tk.BANG:
+            return BOOLEAN
+        self.prove(unary, right is not None and right <= CHECKED)
+        self.narrow(unary.right, CHECKED)
+        return NUMBER
+
+    def visitvariable(self, variable):
+        binding = self.tracked(variable)
+        return self.state.get(binding) if binding is not None else None
+
+    #
+    # Statements
+    #
+
+    def visitblock(self, block):
+        for statement in block.statements:
+            self.execute(statement)
+
+    def visitbreak(self, var_break):
+        self.breaks = join(self.breaks, self.state)
+        self.state = None
+
+    def visitclass(self, var_class):
+        self.evaluate(var_class.superclass)
+        for functionexp in var_class.methods:
+            self.function_body(functionexp, method=True)
+        self.define(var_class.name, CALLABLE)
+
+    def visitexpression(self, expression):
+        self.evaluate(expression.expression)
+
+    def visitfor(self, var_for):
+        self.execute(var_for.initializer)
+        self.loop(var_for.condition, var_for.body, var_for.increment)
+
+    def visitfunction(self, function):
+        self.define(function.funcexp.name, CALLABLE)
+        self.function_body(function.funcexp)
+
+    def visitforin(self, forin):
+        self.evaluate(forin.iterable)
+        # the loop variable may be anything at each iteration
+        self.define(forin.name, None)
+        self.loop(None, forin.body)
+
+    def visitif(self, var_if):
+        self.evaluate(var_if.condition)
+        before = dict(self.state)
+        self.execute(var_if.thenbranch)
+        after = self.state
+        self.state = before
+        self.execute(var_if.elsebranch)
+        self.state = join(after, self.state)
+
+    def visitimport(self, var_import):
+        # defines globals only
+        pass
+
+    def visitprint(self, print):
+        self.evaluate(print.expression)
+
+    def visitreturn(self, var_return):
+        self.evaluate(var_return.value)
+        self.state = None
+
+    def visitvar(self, var):
+        kind = NIL if var.initializer is None else self.evaluate(var.initializer)
+        self.define(var.name, kind)
+
+    def visitwhile(self, var_while):
+        self.loop(var_while.condition, var_while.body)
+
+    def visityield(self, var_yield):
+        self.evaluate(var_yield.value)
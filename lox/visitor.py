@@ -32,6 +32,10 @@ class Visitor:
     def visit(self, grouping):
         return self.visitgrouping(grouping)
 
+    @visitor(Invariant)
+    def visit(self, invariant):
+        return self.visitinvariant(invariant)
+
     @visitor(Literal)
     def visit(self, literal):
         return self.visitliteral(literal)
@@ -60,6 +64,14 @@ class Visitor:
     def visit(self, variable):
         return self.visitvariable(variable)
 
+    @visitor(NumericBinary)
+    def visit(self, numericbinary):
+        return self.visitnumericbinary(numericbinary)
+
+    @visitor(NumericUnary)
+    def visit(self, numericunary):
+        return self.visitnumericunary(numericunary)
+
     @visitor(Block)
     def visit(self, block):
         return self.visitblock(block)
@@ -80,10 +92,22 @@ class Visitor:
     def visit(self, expression):
         return self.visitexpression(expression)
 
+    @visitor(For)
+    def visit(self, var_for):
+        return self.visitfor(var_for)
+
+    @visitor(ForIn)
+    def visit(self, forin):
+        return self.visitforin(forin)
+
     @visitor(If)
     def visit(self, var_if):
         return self.visitif(var_if)
 
+    @visitor(Import)
+    def visit(self, var_import):
+        return self.visitimport(var_import)
+
     @visitor(Print)
     def visit(self, print):
         return self.visitprint(print)
@@ -99,3 +123,18 @@ class Visitor:
     @visitor(While)
     def visit(self, var_while):
         return self.visitwhile(var_while)
+
+    @visitor(Yield)
+    def visit(self, var_yield):
+        return self.visityield(var_yield)
+
+    def visitinvariant(self, invariant):
+        """Hoisted loop invariants are transparent unless a visitor cares."""
+        return invariant.expression.accept(self)
+
+    def visitnumericbinary(self, binary):
+        """Specialized operations are plain ones unless a visitor cares."""
+        return self.visitbinary(binary)
+
+    def visitnumericunary(self, unary):
+        return self.visitunary(unary)
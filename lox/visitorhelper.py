@@ -17,11 +17,24 @@ def _declaring_class(obj):
 # Mapping table between class and visitor method
 _methods = {}
 
+# Method found for a (visitor class, visited class), filled on first visit
+_dispatch = {}
+
 # Returning the method based on the class of the visitor and the visited object
 
 
 def _visitor_impl(self, arg):
     """Actual visitor method implementation."""
+    key = (type(self), type(arg))
+    if key in _dispatch:
+        return _dispatch[key](self, arg)
+    method = _find_method(self, arg)
+    _dispatch[key] = method
+    return method(self, arg)
+
+
+def _find_method(self, arg):
+    """Look for the visit method in the visitor class hierarchy."""
     # let's return the correct visit method based on visitor and visited class
     if (_qualname(type(self)), type(arg)) in _methods:
         # we have the right key (visitor class, item class)
@@ -36,7 +49,7 @@ def _visitor_impl(self, arg):
         else:
             raise ValueError("No visitor is implementing visit method for {0}, {1}".format(
                 type(self), type(arg)))
-    return method(self, arg)
+    return method
 #
 # The actual @visitor decorator
 #
@@ -0,0 +1,406 @@
+# Virtual machine running the IR of lox.ir
+#
+#     python -m lox.vm file.lox                  # all the passes of lox.passes
+#     python -m lox.vm file.lox --passes inline  # only some
+#     python -m lox.vm file.lox --dump           # the optimized IR
+#
+# Each instruction is prepared once per code as a python closure working on
+# the slots of a call, constants get slots of their own. Values, functions,
+# classes and the runtime errors are the ones of lox.runtime, so a program
+# prints the same on the interpreter, the transpiler and the VM.
+import argparse
+import sys
+
+from lox import api, ir, passes, runtime
+from lox.runtime import (Function, call, findmethod, invoke, get, checkinstance,
+                         setfield, getsuper, checkclass, make_class, method, stringify)
+from lox.error import InterpreterError, LoxRuntimeError, BreakException
+from lox.native import builtins
+from lox.output import OutputSink
+from lox.tokentype import TokensDic as Tk
+
+operators = {Tk.PLUS: runtime.add, Tk.MINUS: runtime.subtract, Tk.STAR: runtime.multiply,
+             Tk.SLASH: runtime.divide, Tk.LESS: runtime.less, Tk.LESS_EQUAL: runtime.lessequal,
+             Tk.GREATER: runtime.greater, Tk.GREATER_EQUAL: runtime.greaterequal}
+
+
+class Prepared:
+    """Closures of the blocks of a code.
+
+    template -- initial slots of a call, constants included
+    blocks -- (instructions, terminator, index of the break handler)
+    result -- slot of the returned value"""
+
+    def __init__(self, template: list, blocks: list, result: int):
+        self.template = template
+        self.blocks = blocks
+        self.result = result
+
+
+class VM:
+    """Run the codes of a module on new globals."""
+
+    def __init__(self, module: ir.Module, output: OutputSink = None):
+        self.module = module
+        self.output = output if output is not None else OutputSink()
+        self.globals = builtins()
+        self.prepared = {}
+
+    def run(self):
+        """Run the top level code, report runtime errors as the interpreter."""
+        output = self.output
+        try:
+            self.execute(self.module.main, (), ())
+        except (InterpreterError, LoxRuntimeError) as error:
+            output.writeline("error:  " + str(error))
+        except RecursionError:
+            output.writeline("error:  Stack overflow.")
+        finally:
+            output.flush()
+
+    def execute(self, code: ir.Code, cells, arguments) -> object:
+        prepared = self.prepared.get(code)
+        if prepared is None:
+            prepared = self.prepared[code] = self.prepare(code)
+        slots = prepared.template[:]
+        nargs = code.nargs
+        slots[:nargs] = arguments
+        if cells:
+            slots[nargs:nargs + code.free] = cells
+        for slot in code.cells:
+            slots[slot] = [slots[slot]]
+        blocks = prepared.blocks
+        index = 0
+        while True:
+            instructions, terminator, handler = blocks[index]
+            try:
+                for instruction in instructions:
+                    instruction(slots)
+            except BreakException:
+                if handler is None:
+                    raise
+                index = handler
+                continue
+            index = terminator(slots)
+            if index < 0:
+                return slots[prepared.result]
+
+    def function(self, code: ir.Code, cells: list) -> Function:
+        execute = self.execute
+
+        def function(*arguments):
+            return execute(code, cells, arguments)
+        # what the inlined calls check
+        function.code = code
+        return Function(function, code.name, code.params)
+
+    def method(self, code: ir.Code, cells: list):
+        execute = self.execute
+
+        def function(this, *arguments):
+            return execute(code, cells, (this,) + arguments)
+        return method(function, code.name, code.params)
+
+    def prepare(self, code: ir.Code) -> Prepared:
+        template = [None] * code.slots
+        constants = {}
+
+        def slot(arg) -> int:
+            if type(arg) is int:
+                return arg
+            key = (type(arg.value), arg.value)
+            if key not in constants:
+                constants[key] = len(template)
+                template.append(arg.value)
+            return constants[key]
+
+        result = len(template)
+        template.append(None)
+        blocks = []
+        for block in code.blocks:
+            instructions = []
+            for instr in block.instrs:
+                args = [slot(arg) for arg in instr.args]
+                instructions.append(getattr(self, "op_" + instr.op.lower())(instr, instr.dest, args))
+            term = block.term
+            args = [slot(arg) for arg in term.args]
+            terminator = getattr(self, "op_" + term.op.lower())(term, result, args)
+            handler = block.handler.index if block.handler is not None else None
+            blocks.append((instructions, terminator, handler))
+        return Prepared(template, blocks, result)
+
+    #
+    # Instructions: closures on the slots of a call
+    #
+
+    def op_move(self, instr, dest, args):
+        source, = args
+
+        def move(slots):
+            slots[dest] = slots[source]
+        return move
+
+    def op_newcell(self, instr, dest, args):
+        source, = args
+
+        def newcell(slots):
+            slots[dest] = [slots[source]]
+        return newcell
+
+    def op_loadcell(self, instr, dest, args):
+        cell, = args
+
+        def loadcell(slots):
+            slots[dest] = slots[cell][0]
+        return loadcell
+
+    def op_storecell(self, instr, dest, args):
+        cell, source = args
+
+        def storecell(slots):
+            slots[cell][0] = slots[source]
+        return storecell
+
+    def op_getglobal(self, instr, dest, args):
+        token, variables = instr.extra, self.globals
+        name = token.lexeme
+
+        def getglobal(slots):
+            try:
+                slots[dest] = variables[name]
+            except KeyError:
+                raise LoxRuntimeError(token, "Undefined variable '" + name + "'.") from None
+        return getglobal
+
+    def op_setglobal(self, instr, dest, args):
+        token, variables = instr.extra, self.globals
+        name, source = token.lexeme, args[0]
+
+        def setglobal(slots):
+            if name not in variables:
+                raise LoxRuntimeError(token, "Undefined variable " + name + " " + str(token))
+            variables[name] = slots[source]
+        return setglobal
+
+    def op_defglobal(self, instr, dest, args):
+        name, source, variables = instr.extra, args[0], self.globals
+
+        def defglobal(slots):
+            variables[name] = slots[source]
+        return defglobal
+
+    def op_binary(self, instr, dest, args):
+        left, right = args
+        token = instr.extra
+        operator = operators[token.type]
+
+        def binary(slots):
+            slots[dest] = operator(slots[left], slots[right], token)
+        return binary
+
+    def op_equal(self, instr, dest, args):
+        left, right = args
+        if instr.extra:
+            def equal(slots):
+                slots[dest] = slots[left] == slots[right]
+        else:
+            def equal(slots):
+                slots[dest] = slots[left] != slots[right]
+        return equal
+
+    def op_not(self, instr, dest, args):
+        source, = args
+
+        def negation(slots):
+            value = slots[source]
+            slots[dest] = value is None or value is False
+        return negation
+
+    def op_negate(self, instr, dest, args):
+        source, = args
+        token, negate = instr.extra, runtime.negate
+
+        def minus(slots):
+            slots[dest] = negate(slots[source], token)
+        return minus
+
+    def op_call(self, instr, dest, args):
+        callee, arguments = args[0], args[1:]
+        paren, count = instr.extra[0], len(arguments)
+        if count == 1:
+            argument, = arguments
+
+            def call1(slots):
+                function = slots[callee]
+                if type(function) is Function and function.params == 1:
+                    slots[dest] = function.function(slots[argument])
+                else:
+                    slots[dest] = call(function, paren, slots[argument])
+            return call1
+
+        def calln(slots):
+            function = slots[callee]
+            values = [slots[argument] for argument in arguments]
+            if type(function) is Function and function.params == count:
+                slots[dest] = function.function(*values)
+            else:
+                slots[dest] = call(function, paren, *values)
+        return calln
+
+    def op_invoke(self, instr, dest, args):
+        instance, arguments = args[0], args[1:]
+        token, paren = instr.extra
+        name, pyname = token.lexeme, "m_" + token.lexeme
+
+        def invokemethod(slots):
+            value = slots[instance]
+            slots[dest] = invoke(findmethod(value, name, pyname, token), value, paren,
+                                 *[slots[argument] for argument in arguments])
+        return invokemethod
+
+    def op_getprop(self, instr, dest, args):
+        instance, = args
+        token = instr.extra
+        name, pyname = token.lexeme, "m_" + token.lexeme
+
+        def getprop(slots):
+            slots[dest] = get(slots[instance], name, pyname, token)
+        return getprop
+
+    def op_checkinstance(self, instr, dest, args):
+        source, = args
+        token = instr.extra
+
+        def check(slots):
+            slots[dest] = checkinstance(slots[source], token)
+        return check
+
+    def op_setprop(self, instr, dest, args):
+        instance, source = args
+        name = instr.extra
+
+        def setprop(slots):
+            setfield(slots[instance], name, slots[source])
+        return setprop
+
+    def op_getsuper(self, instr, dest, args):
+        superclass, this = args
+        token = instr.extra
+        pyname = "m_" + token.lexeme
+
+        def getsuperclass(slots):
+            slots[dest] = getsuper(slots[superclass], slots[this], pyname, token)
+        return getsuperclass
+
+    def op_checkclass(self, instr, dest, args):
+        source, = args
+        token = instr.extra
+
+        def check(slots):
+            slots[dest] = checkclass(slots[source], token)
+        return check
+
+    def op_closure(self, instr, dest, args):
+        code, makefunction = instr.extra, self.function
+
+        def closure(slots):
+            slots[dest] = makefunction(code, [slots[cell] for cell in args])
+        return closure
+
+    def op_class(self, instr, dest, args):
+        superclass, captures = args[0], args[1:]
+        name, codes = instr.extra
+        makemethod = self.method
+
+        def newclass(slots):
+            methods, start = {}, 0
+            for code in codes:
+                cells = [slots[cell] for cell in captures[start:start + code.free]]
+                start += code.free
+                methods["m_" + code.name] = makemethod(code, cells)
+            slots[dest] = make_class(name, slots[superclass], methods)
+        return newclass
+
+    def op_print(self, instr, dest, args):
+        source, = args
+        write = self.output.writeline
+
+        def printvalue(slots):
+            write(stringify(slots[source]))
+        return printvalue
+
+    #
+    # Terminators: return the index of the next block, -1 to return
+    #
+
+    def op_jump(self, instr, result, args):
+        target = instr.extra.index
+        return lambda slots: target
+
+    def op_branch(self, instr, result, args):
+        condition, = args
+        iftrue, iffalse = [block.index for block in instr.extra]
+
+        def branch(slots):
+            value = slots[condition]
+            return iffalse if value is None or value is False else iftrue
+        return branch
+
+    def op_guard(self, instr, result, args):
+        callee, = args
+        code = instr.extra[0]
+        inlined, called = [block.index for block in instr.extra[1:]]
+
+        def guard(slots):
+            function = slots[callee]
+            if type(function) is Function and getattr(function.function, "code", None) is code:
+                return inlined
+            return called
+        return guard
+
+    def op_return(self, instr, result, args):
+        source, = args
+
+        def ret(slots):
+            slots[result] = slots[source]
+            return -1
+        return ret
+
+    def op_break(self, instr, result, args):
+        def breakloop(slots):
+            raise BreakException(None)
+        return breakloop
+
+
+def compile(source: str, names: list = None) -> ir.Module:
+    """Optimized IR of a source, CompileError on errors.
+
+    names -- passes to run (see lox.passes.PASSES), all by default"""
+    module = ir.lower(api.compile(source).statements)
+    passes.PassManager(names).run(module)
+    return module
+
+
+def run(module: ir.Module, output: OutputSink = None):
+    VM(module, output).run()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run lox files on the IR virtual machine")
+    parser.add_argument("file", help="lox source file")
+    parser.add_argument("--passes", help="comma separated passes to run, among " +
+                        ", ".join(passes.PASSES) + " (all by default, none with '')")
+    parser.add_argument("--dump", action="store_true", help="print the IR instead of running it")
+    args = parser.parse_args()
+    with open(args.file) as f:
+        source = f.read()
+    names = None if args.passes is None else [name for name in args.passes.split(",") if name]
+    try:
+        module = compile(source, names)
+    except api.CompileError as error:
+        print(error, file=sys.stderr)
+        sys.exit(65)
+    if args.dump:
+        print(ir.dump(module))
+    else:
+        run(module)
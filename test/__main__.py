@@ -1,3 +1,4 @@
-from .test_lox import run_test
+import sys
+from .runner import main
 
-run_test()
+sys.exit(main())
@@ -0,0 +1,59 @@
+# Lox scripts waiting for I/O concurrently with lox.api.run_async
+#     python3 -m test.benchmark.async_io
+# A local server stands in for a remote service answering in 10ms.
+import asyncio
+import time
+from lox import api
+from lox.output import MemoryOutput
+
+scripts = 1000
+requests = 5
+latency = 0.01
+
+source = """
+var total = 0;
+for (var i = 0; i < requests; i = i + 1) {
+  total = total + fetch(i);
+}
+print total;
+"""
+
+
+async def serve(reader, writer):
+    while True:
+        line = await reader.readline()
+        if not line:
+            break
+        await asyncio.sleep(latency)
+        writer.write(line)
+        await writer.drain()
+    writer.close()
+
+
+async def main():
+    server = await asyncio.start_server(serve, "127.0.0.1", 0, backlog=scripts)
+    port = server.sockets[0].getsockname()[1]
+    program = api.compile(source)
+
+    async def script():
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+
+        async def fetch(value):
+            writer.write("{}\n".format(value).encode())
+            return int(await reader.readline())
+
+        output = MemoryOutput()
+        await api.run_async(program, {"requests": requests, "fetch": fetch}, output)
+        writer.close()
+        return output.getvalue()
+
+    before = time.perf_counter()
+    outputs = await asyncio.gather(*[script() for _ in range(scripts)])
+    after = time.perf_counter()
+    assert all(output == "10\n" for output in outputs)
+    server.close()
+    print("{} scripts x {} requests of {}ms: {:.3f}s ({:.0f}s sequentially)".format(
+        scripts, requests, latency * 1000, after - before, scripts * requests * latency))
+
+
+asyncio.run(main())
@@ -0,0 +1,28 @@
+# Overhead of the line coverage of lox.coverage on the interpreter (best of
+# 5 runs, alternating with and without coverage)
+#     python3 -m test.benchmark.coverage [files]
+import os
+import sys
+import time
+from lox.lox import Lox
+from lox.coverage import Coverage
+from lox.output import MemoryOutput
+
+here = os.path.dirname(__file__)
+files = sys.argv[1:] or [os.path.join(here, name) for name in
+                         ("method_call.lox", "invocation.lox", "string_concat.lox")]
+
+for path in files:
+    with open(path) as f:
+        source = f.read()
+    coverage = Coverage()
+    elapsed = {None: [], coverage: []}
+    for _ in range(5):
+        for covering in elapsed:
+            lox = Lox(output=MemoryOutput(), coverage=covering)
+            before = time.perf_counter()
+            lox.run(source, [], path)
+            elapsed[covering].append(time.perf_counter() - before)
+    timings = [min(elapsed[None]), min(elapsed[coverage])]
+    print("{:20} {:.2f}s, with coverage {:.2f}s ({:+.0%})".format(
+        os.path.basename(path), timings[0], timings[1], timings[1] / timings[0] - 1))
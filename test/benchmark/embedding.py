@@ -0,0 +1,25 @@
+# Calls of lox functions from python through lox.api
+#     python3 -m test.benchmark.embedding
+import time
+from lox import api
+
+source = """
+var threshold = 100;
+fun identity(x) { return x; }
+fun score(amount, count) {
+  if (amount > threshold) return amount - count;
+  return amount + count;
+}
+"""
+
+calls = 100000
+program = api.compile(source).run()
+for name in ("identity", "score"):
+    function = program.get_function(name)
+    arguments = (7,) * function.arity
+    before = time.perf_counter()
+    for i in range(calls):
+        function(*arguments)
+    after = time.perf_counter()
+    print("{}: {} calls in {:.3f}s, {:.0f} calls/s".format(
+        name, calls, after - before, calls / (after - before)))
@@ -0,0 +1,50 @@
+# Stream 10M values through a generator pipeline (lox.generators), against a
+# pipeline building lists of a tenth of the values, with the growth of the
+# peak memory of the process
+#     python3 -m test.benchmark.generators [count]
+import resource
+import sys
+import time
+from lox.lox import Lox
+from lox.output import MemoryOutput
+
+count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000000
+
+functions = """
+fun triple(x) { return 3 * x; }
+fun small(x) { return x < 1000000000000; }
+"""
+streaming = functions + """
+fun naturals() { var n = 0; while (true) { yield n; n = n + 1; } }
+var total = 0;
+for (var x in take(filter(map(naturals(), triple), small), {count})) total = total + x;
+print total;
+"""
+eager = functions + """
+var numbers = List();
+for (var n = 0; n < {count}; n = n + 1) numbers.push(n);
+var tripled = List();
+for (var x in numbers) tripled.push(triple(x));
+var kept = List();
+for (var x in tripled) if (small(x)) kept.push(x);
+var total = 0;
+for (var x in kept) total = total + x;
+print total;
+"""
+
+
+def run(source: str, count: int):
+    output = MemoryOutput()
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    before = time.perf_counter()
+    Lox(output=output).run(source.replace("{count}", str(count)), [])
+    elapsed = time.perf_counter() - before
+    growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - peak
+    assert output.getvalue() == "{}\n".format(3 * count * (count - 1) // 2)
+    return elapsed, growth
+
+
+for name, source, values in (("generators", streaming, count), ("lists", eager, count // 10)):
+    elapsed, growth = run(source, values)
+    print("{:10} {:9} values {:7.1f}s {:5.2f}us per value, peak memory +{}kB".format(
+        name, values, elapsed, 1e6 * elapsed / values, growth))
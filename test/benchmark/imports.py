@@ -0,0 +1,49 @@
+# A script using a large library: concatenated to the script, imported by a
+# first interpreter (compiled), by later ones (compiled module cached) and
+# imported without using it (never run), best of 5
+#     python3 -m test.benchmark.imports
+import os
+import tempfile
+import time
+from lox.lox import Lox
+from lox.output import MemoryOutput
+from lox import modules
+
+template = """class Rule{0} {{
+  init(limit) {{ this.limit = limit; }}
+  check(amount) {{ return amount <= this.limit; }}
+}}
+fun rule{0}(amount) {{
+  var total = 0;
+  for (var i = 0; i < 3; i = i + 1) total = total + amount * i;
+  return total;
+}}
+var default{0} = Rule{0}({0});
+"""
+library = "".join(template.format(n) for n in range(500))
+script = "print default42.check(10) and rule7(2);"
+directory = tempfile.mkdtemp()
+with open(os.path.join(directory, "library.lox"), "w") as f:
+    f.write(library)
+
+
+def timed(source: str, fresh: bool = False) -> float:
+    elapsed = []
+    for _ in range(5):
+        if fresh:
+            modules.registry.modules.clear()
+        lox = Lox(output=MemoryOutput())
+        lox.interpreter.directory = directory
+        before = time.perf_counter()
+        lox.run(source, [])
+        elapsed.append(time.perf_counter() - before)
+    return min(elapsed)
+
+
+importing = 'import "library.lox";\n'
+for label, source, fresh in (("concatenated", library + script, False),
+                             ("import", importing + script, True),
+                             ("cached", importing + script, False),
+                             ("unused", importing, False)):
+    print("{:14} {:7.1f}ms".format(label, 1000 * timed(source, fresh)))
+print("{} lines of library".format(library.count("\n")))
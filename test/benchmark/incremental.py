@@ -0,0 +1,63 @@
+# Edits of a 10k line file with the incremental front end of lox.incremental
+#     python3 -m test.benchmark.incremental
+import time
+from lox import api
+from lox.incremental import Document
+
+template = """fun rule{0}(amount, count) {{
+  var total = 0;
+  for (var i = 0; i < count; i = i + 1) {{
+    if (amount > {0}) total = total + amount;
+    else total = total - 1;
+  }}
+  // running total of rule {0}
+  print "rule {0}: " + total;
+  return total;
+}}
+"""
+source = "".join(template.format(n) for n in range(1000))
+
+
+def timed(action, repeat=1):
+    before = time.perf_counter()
+    for _ in range(repeat):
+        action()
+    return (time.perf_counter() - before) / repeat
+
+
+print("{} lines".format(source.count("\n")))
+print("full compile: {:.1f}ms".format(1000 * timed(lambda: api.compile(source))))
+document = None
+
+
+def create():
+    global document
+    document = Document(source)
+
+
+print("document creation: {:.1f}ms".format(1000 * timed(create)))
+middle = source.index("total + amount", len(source) // 2)
+edits = 100
+
+
+def typing():
+    # type a character then delete it, in a function in the middle
+    document.edit(middle, middle, "x")
+    document.edit(middle, middle + 1, "")
+
+
+def newline():
+    document.edit(middle, middle, "\n")
+    document.edit(middle, middle + 1, "")
+
+
+def statement():
+    line = source.index("  // running total", middle)
+    document.edit(line, line, "  print total;\n")
+    document.edit(line, line + len("  print total;\n"), "")
+
+
+for name, action in (("typing a character", typing), ("adding a line break", newline),
+                     ("adding a statement", statement)):
+    print("{}: {:.2f}ms per edit".format(name, 1000 * timed(action, edits) / 2))
+assert document.source == source and not document.errors()
@@ -0,0 +1,32 @@
+# Time to the first statement and whole run of a script calling 2 of its
+# 1000 functions, parsed up front or lazily (lox.lazy), best of 5
+#     python3 -m test.benchmark.lazy
+import time
+from lox.lox import Lox
+from lox.output import MemoryOutput
+
+template = """fun rule{0}(amount, count) {{
+  var total = 0;
+  for (var i = 0; i < count; i = i + 1) {{
+    if (amount > {0}) total = total + amount;
+    else total = total - 1;
+  }}
+  print "rule {0}: " + total;
+  return total;
+}}
+"""
+source = "var start = clock();\n" + "".join(template.format(n) for n in range(1000)) + \
+    "rule7(10, 3);\nrule42(10, 3);\n"
+
+
+for lazy in (False, True):
+    first, total = [], []
+    for _ in range(5):
+        lox = Lox(output=MemoryOutput(), lazy=lazy)
+        before = time.perf_counter()
+        lox.run(source, [])
+        total.append(time.perf_counter() - before)
+        first.append(lox.interpreter.global_env.get("start") - before)
+    print("{:8} first statement {:6.1f}ms, run {:6.1f}ms".format(
+        "lazy" if lazy else "eager", 1000 * min(first), 1000 * min(total)))
+print("{} lines".format(source.count("\n")))
@@ -0,0 +1,63 @@
+# A compute heavy function over 64 values with map (one core) and with
+# parallelMap (lox.parallel) on 1, 2, 4 and 8 worker processes, best of 3.
+# The speedup over one worker should stay near linear up to the number of
+# cores: each run with no more workers than cores is checked to reach 70%
+# of the ideal speedup.
+#     python3 -m test.benchmark.parallel
+import os
+import time
+from lox.lox import Lox
+from lox.output import MemoryOutput
+
+source = """
+fun work(seed) {
+  var total = 0;
+  for (var i = 0; i < 10000; i = i + 1) total = total + (seed * i + 7) / (i + 1);
+  return total;
+}
+var values = List();
+for (var n = 0; n < 64; n = n + 1) values.push(n);
+"""
+WORKERS = (1, 2, 4, 8)
+# share of the ideal speedup expected when every worker has a core
+EFFICIENCY = 0.7
+
+
+def timed(script: str):
+    elapsed = []
+    for _ in range(3):
+        lox = Lox(output=MemoryOutput())
+        lox.run(source, [])
+        before = time.perf_counter()
+        lox.run(script, [])
+        elapsed.append(time.perf_counter() - before)
+        results = lox.interpreter.global_env.get("results")
+    return min(elapsed), results.items
+
+
+def cores() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count()
+
+
+if __name__ == "__main__":
+    # worker processes started by spawn (macOS, Windows) import this module
+    # again: the benchmark only runs in the main process
+    available = cores()
+    print("{} cores".format(available))
+    serial, expected = timed("var results = List(); for (var x in map(values, work)) results.push(x);")
+    print("{:14} {:6.2f}s".format("map", serial))
+    single = None
+    for workers in WORKERS:
+        elapsed, results = timed("var results = parallelMap(work, values, {});".format(workers))
+        assert results == expected
+        single = single or elapsed
+        speedup = single / elapsed
+        print("{:14} {:6.2f}s speedup {:4.2f} over 1 worker, {:4.2f} over map".format(
+            "parallelMap {}".format(workers), elapsed, speedup, serial / elapsed))
+        if workers <= available:
+            assert speedup >= EFFICIENCY * workers, \
+                "{} workers on {} cores: speedup {:.2f}".format(workers, available, speedup)
+        else:
+            print("{:14} not checked, more workers than cores".format(""))
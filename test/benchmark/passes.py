@@ -0,0 +1,31 @@
+# The benchmarks run on the IR virtual machine of lox.vm, with no pass, each
+# pass of lox.passes alone and all of them (best of 3 runs)
+#     python3 -m test.benchmark.passes [files]
+import os
+import sys
+import time
+from lox import ir, vm, passes
+from lox.output import MemoryOutput
+
+here = os.path.dirname(__file__)
+files = sys.argv[1:] or [os.path.join(here, name) for name in
+                         ("method_call.lox", "invocation.lox", "string_concat.lox")]
+configurations = [("none", [])] + [(name, [name]) for name in passes.PASSES] + [("all", None)]
+
+
+def size(module: ir.Module) -> int:
+    return sum(len(list(code.instructions())) for code in module.allcodes())
+
+
+for path in files:
+    with open(path) as f:
+        source = f.read()
+    print(os.path.basename(path))
+    for label, names in configurations:
+        module = vm.compile(source, names)
+        elapsed = []
+        for _ in range(3):
+            before = time.perf_counter()
+            vm.run(module, MemoryOutput())
+            elapsed.append(time.perf_counter() - before)
+        print("  {:12} {:4} instructions {:.2f}s".format(label, size(module), min(elapsed)))
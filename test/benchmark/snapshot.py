@@ -0,0 +1,56 @@
+# Start of an interpreter running a large prelude against one restoring the
+# snapshot of its globals (lox.snapshot), best of 5
+#     python3 -m test.benchmark.snapshot
+import time
+from lox.lox import Lox
+from lox.output import MemoryOutput
+from lox import snapshot
+
+template = """class Rule{0} {{
+  init(limit) {{ this.limit = limit; this.hits = 0; }}
+  check(amount) {{
+    if (amount > this.limit) {{ this.hits = this.hits + 1; return false; }}
+    return true;
+  }}
+}}
+fun rule{0}(amount) {{
+  var total = 0;
+  for (var i = 0; i < 3; i = i + 1) total = total + amount * i;
+  return total;
+}}
+var default{0} = Rule{0}({0});
+"""
+prelude = "".join(template.format(n) for n in range(500))
+script = "print default42.check(10) and rule7(2);"
+
+
+def timed(action) -> float:
+    elapsed = []
+    for _ in range(5):
+        before = time.perf_counter()
+        action()
+        elapsed.append(time.perf_counter() - before)
+    return min(elapsed)
+
+
+def execute():
+    lox = Lox(output=MemoryOutput())
+    lox.run(prelude, [])
+    return lox
+
+
+def restore():
+    lox = Lox(output=MemoryOutput())
+    snapshot.restore(lox.interpreter, data)
+    return lox
+
+
+data = snapshot.take(execute().interpreter)
+for label, start in (("execute", execute), ("snapshot", restore)):
+    output = MemoryOutput()
+    lox = start()
+    lox.interpreter.output = output
+    lox.run(script, [])
+    print("{:10} {:7.1f}ms  prints {}".format(label, 1000 * timed(start),
+                                               output.getvalue().strip()))
+print("{} lines of prelude, snapshot of {} KB".format(prelude.count("\n"), len(data) // 1024))
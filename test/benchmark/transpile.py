@@ -0,0 +1,28 @@
+# The benchmarks run by the interpreter and compiled to python by lox.transpile
+#     python3 -m test.benchmark.transpile [files]
+import os
+import sys
+import time
+from lox import api, transpile
+from lox.output import MemoryOutput
+
+here = os.path.dirname(__file__)
+files = sys.argv[1:] or [os.path.join(here, name) for name in
+                         ("method_call.lox", "invocation.lox", "string_concat.lox")]
+
+
+def timed(action):
+    before = time.perf_counter()
+    action()
+    return time.perf_counter() - before
+
+
+for path in files:
+    with open(path) as f:
+        source = f.read()
+    program = api.compile(source)
+    interpreted = timed(lambda: program.run(output=MemoryOutput()))
+    code = transpile.load(source)
+    compiled = timed(lambda: transpile.run(code, MemoryOutput()))
+    print("{}: interpreter {:.2f}s, transpiled {:.2f}s, x{:.1f}".format(
+        os.path.basename(path), interpreted, compiled, interpreted / compiled))
@@ -0,0 +1,83 @@
+# Share of the checked operations type inference specializes in the test
+# files, and a numeric program run with and without the specialized nodes
+# (best of 3 runs)
+#     python3 -m test.benchmark.types [files]
+import contextlib
+import glob
+import io
+import os
+import sys
+import time
+from lox.scanner import scan_tokens
+from lox.parser import Parser
+from lox.resolver import Resolver
+from lox.interpreter import Interpreter
+from lox.output import MemoryOutput
+from test.runner import TESTFILES
+
+here = os.path.dirname(__file__)
+files = sys.argv[1:] or sorted(glob.glob(os.path.join(TESTFILES, "*.lox")))
+
+numeric = """
+fun loop(n) {
+  var total = 0;
+  var x = 0.5;
+  for (var i = 0; i < n; i = i + 1) {
+    x = x * 0.999 + 0.25;
+    total = total + x / 2 - -x;
+  }
+  return total;
+}
+print loop(200000);
+"""
+
+
+class Checked(Interpreter):
+    """Interpreter checking the operands of the specialized nodes too."""
+
+    def visitnumericbinary(self, expr):
+        return self.visitbinary(expr)
+
+    def visitnumericunary(self, expr):
+        return self.visitunary(expr)
+
+
+def resolve(source: str, interpreter: Interpreter) -> tuple:
+    """Statements and resolver of a source, None for the files testing
+    compilation errors."""
+    tokens, errors = [], []
+    with contextlib.redirect_stdout(io.StringIO()):
+        scan_tokens(source, {'start': 0, 'current': 0, 'line': 1}, tokens, errors)
+        statements = Parser(tokens, errors).parse()
+        if errors:
+            return None
+        resolver = Resolver(interpreter, errors)
+        resolver.resolvelist(statements)
+    return (statements, resolver) if not errors else None
+
+
+candidates = specialized = 0
+for path in files:
+    with open(path) as f:
+        source = f.read()
+    resolved = resolve(source, Interpreter(MemoryOutput()))
+    if resolved is None:
+        continue
+    resolver = resolved[1]
+    candidates += resolver.candidates
+    specialized += resolver.specialized
+    if resolver.candidates:
+        print("  {:28} {:3}/{:3}".format(os.path.basename(path), resolver.specialized,
+                                         resolver.candidates))
+print("specialized {}/{} operations ({:.0%})".format(
+    specialized, candidates, specialized / candidates if candidates else 0))
+
+for label, cls in (("checked", Checked), ("specialized", Interpreter)):
+    elapsed = []
+    for _ in range(3):
+        interpreter = cls(MemoryOutput())
+        statements, _ = resolve(numeric, interpreter)
+        before = time.perf_counter()
+        interpreter.interpret(statements)
+        elapsed.append(time.perf_counter() - before)
+    print("  {:12} {:.2f}s".format(label, min(elapsed)))
@@ -0,0 +1,266 @@
+"""Run a corpus of lox files in parallel and check their output.
+
+Expectations are read from the comments of each file, in the format of the
+craftinginterpreters test suite:
+
+    print 1 + 2; // expect: 3
+    foo();       // expect runtime error: can only call functions.
+    print this;  // Error : Cannot use 'this' outside of a class.
+    // [line 4] Error : A variable with this name has already been declared...
+
+A file without expectation comments is compared with its golden file
+(same path with an '.expected' extension) written by --update.
+
+    python -m test.runner                      # the test/testfiles corpus
+    python -m test.runner path/to/test -j 8    # any folder or files
+    python -m test.runner --backend interpreter --backend other
+"""
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import re
+import sys
+import time
+import traceback
+
+from lox.lox import Lox
+
+TESTFILES = os.path.join(os.path.dirname(__file__), "testfiles")
+
+expect_output = re.compile(r"// expect: ?(.*)")
+expect_runtime_error = re.compile(r"// expect runtime error: (.+)")
+expect_compile_error = re.compile(r"// (\[line (\d+)\] )?(Error.*)")
+# how the lox compiler reports errors
+compile_error_line = re.compile(r"\[line \d+\] Error")
+runtime_error_prefix = "error:"
+compile_summary = "Syntax errors detected during compilation"
+
+
+def run_interpreter(source: str) -> str:
+    """Run a source with the tree-walking interpreter, return its output."""
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        Lox().run(source, [])
+    return output.getvalue()
+
+
+def run_transpiler(source: str) -> str:
+    """Compile a source to python with lox.transpile and run it, return its
+    output."""
+    from lox import api, transpile
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        try:
+            code = transpile.load(source)
+        except api.CompileError as error:
+            for message in error.messages:
+                print(message)
+            print(compile_summary)
+        else:
+            transpile.run(code)
+    return output.getvalue()
+
+
+def run_vm(source: str) -> str:
+    """Run a source on the virtual machine of lox.vm, all the IR passes on,
+    return its output."""
+    from lox import api, vm
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        try:
+            module = vm.compile(source)
+        except api.CompileError as error:
+            for message in error.messages:
+                print(message)
+            print(compile_summary)
+        else:
+            vm.run(module)
+    return output.getvalue()
+
+
+# Backends able to run a lox source, by name
+BACKENDS = {
+    "interpreter": run_interpreter,
+    "transpiler": run_transpiler,
+    "vm": run_vm,
+}
+
+
+class Expectation:
+    """What a lox file is expected to print."""
+
+    def __init__(self, output, compile_errors, runtime_error):
+        self.output = output
+        self.compile_errors = compile_errors
+        self.runtime_error = runtime_error
+
+    @staticmethod
+    def from_source(source: str) -> "Expectation":
+        """Expectations from the comments, None if the file has none."""
+        output = []
+        compile_errors = []
+        runtime_error = None
+        found = False
+        for lineno, line in enumerate(source.splitlines(), 1):
+            match = expect_output.search(line)
+            if match:
+                output.append(match.group(1))
+                found = True
+                continue
+            match = expect_runtime_error.search(line)
+            if match:
+                runtime_error = match.group(1)
+                found = True
+                continue
+            match = expect_compile_error.search(line)
+            if match:
+                errorline = match.group(2) or lineno
+                compile_errors.append(
+                    "[line {}] {}".format(errorline, match.group(3)))
+                found = True
+        if not found:
+            return None
+        return Expectation(output, compile_errors, runtime_error)
+
+    @staticmethod
+    def from_output(text: str) -> "Expectation":
+        """Split what a run printed in output, compile and runtime errors."""
+        output = []
+        compile_errors = []
+        runtime_error = None
+        for line in text.splitlines():
+            if compile_error_line.match(line):
+                compile_errors.append(line)
+            elif line.startswith(runtime_error_prefix):
+                runtime_error = line[len(runtime_error_prefix):].strip()
+            elif line != compile_summary:
+                output.append(line)
+        return Expectation(output, compile_errors, runtime_error)
+
+    def differences(self, actual: "Expectation") -> list:
+        failures = []
+        if self.output != actual.output:
+            failures.append("expected output {} got {}".format(
+                self.output, actual.output))
+        if sorted(self.compile_errors) != sorted(actual.compile_errors):
+            failures.append("expected compile errors {} got {}".format(
+                self.compile_errors, actual.compile_errors))
+        if self.runtime_error != actual.runtime_error:
+            failures.append("expected runtime error {!r} got {!r}".format(
+                self.runtime_error, actual.runtime_error))
+        return failures
+
+
+def golden_path(path: str) -> str:
+    return os.path.splitext(path)[0] + ".expected"
+
+
+def run_file(job) -> dict:
+    """Worker: run one file with one backend and time it."""
+    path, backend = job
+    result = {"path": path, "backend": backend, "output": None, "crash": None}
+    with open(path, "r") as f:
+        source = f.read()
+    start = time.perf_counter()
+    try:
+        result["output"] = BACKENDS[backend](source)
+    except Exception:
+        result["crash"] = traceback.format_exc()
+    result["time"] = time.perf_counter() - start
+    return result
+
+
+def check(result: dict, update: bool) -> list:
+    """Failures of a run compared to the expectations of its file."""
+    if result["crash"] is not None:
+        return ["crashed:\n" + result["crash"]]
+    with open(result["path"], "r") as f:
+        expected = Expectation.from_source(f.read())
+    if expected is not None:
+        return expected.differences(Expectation.from_output(result["output"]))
+    golden = golden_path(result["path"])
+    if update:
+        with open(golden, "w") as f:
+            f.write(result["output"])
+        return []
+    if not os.path.exists(golden):
+        return ["no expectation comment and no golden file " + golden]
+    with open(golden, "r") as f:
+        if f.read() != result["output"]:
+            return ["output differs from " + golden]
+    return []
+
+
+def collect(paths: list) -> list:
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, name)
+                             for name in names if name.endswith(".lox"))
+        else:
+            files.append(path)
+    return sorted(files)
+
+
+def run_corpus(paths: list, backends: list, jobs: int = None, timeout: float = 60,
+               update: bool = False, verbose: bool = False, stream=sys.stdout) -> int:
+    """Run and check all the files, return the number of failures."""
+    files = collect(paths)
+    failures = 0
+    with multiprocessing.Pool(jobs) as pool:
+        pending = [(path, backend, pool.apply_async(run_file, ((path, backend),)))
+                   for path in files for backend in backends]
+        outputs = {}
+        for path, backend, async_result in pending:
+            try:
+                result = async_result.get(timeout)
+                problems = check(result, update)
+            except multiprocessing.TimeoutError:
+                result = {"time": timeout, "output": None}
+                problems = ["timed out after {}s".format(timeout)]
+            outputs.setdefault(path, {})[backend] = result["output"]
+            if problems:
+                failures += 1
+            if problems or verbose:
+                stream.write("{:4} {:7.3f}s [{}] {}\n".format(
+                    "FAIL" if problems else "ok", result["time"], backend, path))
+            for problem in problems:
+                stream.write("       " + problem + "\n")
+        pool.terminate()
+    # backends must agree with each other, not only with the expectations
+    if len(backends) > 1:
+        for path, results in outputs.items():
+            if len(set(results.values())) > 1:
+                failures += 1
+                stream.write("DIFF  backends disagree on {}\n".format(path))
+    stream.write("{} files, {} backend(s), {} failure(s)\n".format(
+        len(files), len(backends), failures))
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="*", default=[TESTFILES],
+                        help="lox files or folders (default: test/testfiles)")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="number of worker processes (default: cpu count)")
+    parser.add_argument("--backend", action="append", choices=sorted(BACKENDS),
+                        help="backend to run, repeat to check they are equivalent")
+    parser.add_argument("--timeout", type=float, default=60,
+                        help="seconds allowed for each file")
+    parser.add_argument("--update", action="store_true",
+                        help="write the golden files of files without expectations")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="report every file with its wall time")
+    args = parser.parse_args(argv)
+    failures = run_corpus(args.paths, args.backend or ["interpreter"], args.jobs,
+                          args.timeout, args.update, args.verbose)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
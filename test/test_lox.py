@@ -1,7 +1,28 @@
 from lox.lox import Lox
+from lox import api, transpile, ir, vm, snapshot, modules
+from lox.error import InterpreterError, BudgetExceeded, HeapLimitExceeded, LoxError
+from lox.instrumentation import ExecutionBudget, HeapTracker
+from lox.incremental import Document
+from lox.coverage import Coverage
+from lox.scanner import scan_tokens
+from lox.parser import Parser
+from lox.resolver import Resolver
+from lox.interpreter import Interpreter
+from lox.expr import Unary, NumericBinary
+from lox.astprinter import PrinterVisitor
+from lox.output import MemoryOutput
+from lox.native import NativeMethod
+from test.runner import run_corpus, TESTFILES
+from tools import generate_ast
+import threading
+import asyncio
+import warnings
 import os
+import io
 import argparse
 import traceback
+import subprocess
+import sys
 
 
 def run_test(filename):
@@ -21,6 +42,594 @@ def run_test(filename):
               format(filepath, str(err), traceback.format_exc()))
 
 
+def test_corpus():
+    # Every file of testfiles must print what its comments expect
+    report = io.StringIO()
+    failures = run_corpus([TESTFILES], ["interpreter"], stream=report)
+    assert failures == 0, report.getvalue()
+
+
+def test_transpile(tmp_path):
+    # The transpiled corpus prints what the interpreter prints
+    report = io.StringIO()
+    failures = run_corpus([TESTFILES], ["interpreter", "transpiler"], stream=report)
+    assert failures == 0, report.getvalue()
+    # the written module runs on its own
+    path = tmp_path / "counter.py"
+    transpile.load("""
+        fun counter() { var n = 0; fun next() { n = n + 1; return n; } return next; }
+        var next = counter();
+        next();
+        print next();
+        """, str(path))
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, str(path)], capture_output=True, text=True,
+                            env=dict(os.environ, PYTHONPATH=root))
+    assert result.stdout == "2\n", result.stderr
+
+
+def test_generate_ast(tmp_path):
+    # The generator writes the tree and visitor modules of the package
+    generate_ast.generate(str(tmp_path))
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for name in ("expr.py", "stmt.py", "visitor.py"):
+        with open(os.path.join(root, "lox", name)) as f:
+            assert (tmp_path / name).read_text() == f.read(), name
+
+
+def test_ir_passes():
+    # The VM prints what the interpreter prints, whatever the passes
+    report = io.StringIO()
+    failures = run_corpus([TESTFILES], ["interpreter", "vm"], stream=report)
+    assert failures == 0, report.getvalue()
+    source = """
+        fun square(x) { var unused = x; return x * x; print "never"; }
+        print square(3);
+        square = fun (x) { return x; };
+        print square(3);
+        """
+    outputs = []
+    for names in ([], None):
+        module = vm.compile(source, names)
+        output = MemoryOutput()
+        vm.run(module, output)
+        outputs.append(output.getvalue())
+    assert outputs == ["9\n3\n"] * 2
+    listing = ir.dump(module)
+    # the first call is inlined behind a guard, the reassigned function is called
+    assert "GUARD" in listing and "never" not in listing
+    square = [code for code in module.allcodes() if code.name == "square"][0]
+    assert [instr.op for instr in square.instructions()] == ["BINARY", "RETURN"]
+
+
+def test_type_inference():
+    # Operations on proven numbers skip the checks, the others still raise
+    tokens, errors = [], []
+    scan_tokens("""
+        fun f(n) {
+          var s = 0;
+          for (var i = 0; i < 10; i = i + 1) s = s + i;
+          return -n + s;
+        }
+        print f(1);
+        print f("a");
+        """, {'start': 0, 'current': 0, 'line': 1}, tokens, errors)
+    statements = Parser(tokens, errors).parse()
+    output = MemoryOutput()
+    interpreter = Interpreter(output)
+    resolver = Resolver(interpreter, errors)
+    resolver.resolvelist(statements)
+    body = statements[0].funcexp.body
+    loop = body[1]
+    assert type(loop.increment.value) is NumericBinary
+    assert type(loop.body.expression.value) is NumericBinary
+    # n may be anything, -n gives a number
+    assert type(body[2].value.left) is Unary
+    assert type(body[2].value) is NumericBinary
+    assert (resolver.candidates, resolver.specialized) == (5, 4)
+    interpreter.interpret(statements)
+    assert output.getvalue().startswith("44\nerror:  - operator requires")
+
+
+def test_snapshot(tmp_path):
+    # A script run after restoring a prelude snapshot prints what it prints
+    # after the prelude itself
+    prelude = """
+        fun counter() { var n = 0; fun inc() { n = n + 1; return n; } return inc; }
+        var tick = counter();
+        tick();
+        class Shape { init(name) { this.name = name; } describe() { return this.name + this.area(); } }
+        class Square < Shape { init(side) { super.init("square "); this.side = side; } area() { return this.side * this.side; } }
+        var unit = Square(1);
+        var text = "";
+        for (var i = 0; i < 3000; i = i + 1) text = text + "x";
+        """
+    script = """
+        print tick();
+        print Square(3).describe();
+        print unit.describe();
+        unit.side = 2;
+        print unit.area();
+        print text == text + "";
+        """
+    outputs = []
+    for restored in (False, True):
+        output = MemoryOutput()
+        lox = Lox(output=output)
+        if restored:
+            snapshot.load(lox.interpreter, str(tmp_path / "prelude.snap"))
+        else:
+            lox.run(prelude, [])
+            snapshot.save(lox.interpreter, str(tmp_path / "prelude.snap"))
+        lox.run(script, [])
+        outputs.append(output.getvalue())
+    assert outputs[0] == outputs[1] == "2\nsquare 9\nsquare 1\n4\ntrue\n"
+
+
+def test_import(tmp_path):
+    # Modules run once, on first use of their names, with their own globals
+    (tmp_path / "lib").mkdir()
+    (tmp_path / "lib" / "util.lox").write_text("""
+        print "loading util";
+        fun double(x) { return 2 * x; }
+        """)
+    (tmp_path / "lib" / "shapes.lox").write_text("""
+        import "util.lox";
+        print "loading shapes";
+        var count = 0;
+        class Square {
+          init(side) { this.side = side; count = count + 1; }
+          perimeter() { return double(2 * this.side); }
+        }
+        """)
+    (tmp_path / "main.lox").write_text("""
+        import "lib/shapes.lox";
+        print "before";
+        print Square(3).perimeter();
+        import "lib/shapes.lox";
+        print count;
+        print double;
+        """)
+    compiled = modules.registry.misses
+    outputs = []
+    for _ in range(2):
+        output = MemoryOutput()
+        lox = Lox(output=output)
+        lox.run_files([str(tmp_path / "main.lox")])
+        outputs.append(output.getvalue())
+    assert outputs[0] == outputs[1] == ("before\nloading shapes\nloading util\n12\n1\n"
+                                        "error:  Undefined variable 'double'.\n")
+    # the second interpreter used the compiled modules
+    assert modules.registry.misses == compiled + 2
+    assert "util.lox: compiled" in modules.report(lox.interpreter)
+    output = MemoryOutput()
+    Lox(output=output).run('import "missing.lox";', [])
+    assert output.getvalue().startswith("error:  Cannot import 'missing.lox'")
+    try:
+        transpile.transpile('import "lib/util.lox";')
+        assert False, "the transpiler compiled an import"
+    except api.CompileError as error:
+        assert "Imports only run on the interpreter." in str(error)
+    try:
+        api.compile('while (false) { import "lib/util.lox"; }')
+        assert False, "an import compiled in a loop"
+    except api.CompileError as error:
+        assert "Can only import at top level." in str(error)
+
+
+def test_coverage():
+    # Lines are counted over runs, functions and branches not run stay at 0
+    source = """var x = 1;
+fun never() {
+  print "never";
+}
+if (x > 0) {
+  print "positive";
+} else {
+  print "negative";
+}
+var f = fun () { return x; };
+print f();
+"""
+    coverage = Coverage()
+    lox = Lox(output=MemoryOutput(), coverage=coverage)
+    for _ in range(2):
+        lox.run(source, [], "test.lox")
+    lines = coverage.files["test.lox"]
+    assert lines == {1: 2, 2: 2, 3: 0, 5: 2, 6: 2, 8: 0, 10: 2, 11: 2}
+    report = coverage.lcov()
+    assert "SF:test.lox\nDA:1,2\n" in report and "LF:8\nLH:6\n" in report
+    # lazy bodies never called keep their lines, at 0
+    coverage = Coverage()
+    Lox(output=MemoryOutput(), coverage=coverage, lazy=True).run(source, [], "test.lox")
+    assert coverage.files["test.lox"] == {1: 1, 2: 1, 3: 0, 5: 1, 6: 1, 8: 0, 10: 1, 11: 1}
+    # generator bodies are counted as they run
+    source = """fun values(n) {
+  while (n > 0) {
+    if (n > 5) {
+      yield n;
+    }
+    n = n - 1;
+  }
+}
+for (var x in values(6)) print x;
+"""
+    coverage = Coverage()
+    Lox(output=MemoryOutput(), coverage=coverage).run(source, [], "gen.lox")
+    assert coverage.files["gen.lox"] == {1: 1, 2: 1, 3: 1, 4: 1, 6: 1, 9: 1}
+
+
+def test_lazy_parsing():
+    # Top level bodies are parsed on first call, their errors reported then
+    source = """
+        fun broken() { var = 1; }
+        fun add(a, b) { var c = a + b; return c; }
+        fun outer() { fun inner() { return add(1, 2); } return inner; }
+        print add(1, 2);
+        print outer()();
+        broken();
+        """
+    output = MemoryOutput()
+    lox = Lox(output=output, lazy=True)
+    lox.run(source, [])
+    assert output.getvalue() == ("3\n3\nerror:  Errors in the body of 'broken':\n"
+                                 "[line 2] Error at '=': Expect a variable identifier\n")
+    add = lox.interpreter.global_env.get("add").fundec
+    assert add.pending is None and add.result.last
+    assert lox.interpreter.global_env.get("broken").fundec.pending is not None
+    errors = []
+    with LoxError.collecting():
+        Lox(output=MemoryOutput(), lazy=True).run("fun f() { { print 1; }", errors)
+    assert len(errors) == 1
+
+
+def test_native_map():
+    # Map keys follow lox equality, maps survive snapshots
+    output = MemoryOutput()
+    lox = Lox(output=output)
+    lox.run("""
+        var m = Map();
+        for (var i = 0; i < 100; i = i + 1) m.set("k" + i, i);
+        m.set(1, "one");
+        print m.get(1.0) + " " + m.get("k" + 99) + " " + m.size();
+        """, [])
+    assert output.getvalue() == "one 99 101\n"
+    entries = lox.interpreter.global_env.get("m").entries
+    assert all(type(key) in (str, int) for key in entries)
+    fresh = Lox(output=output)
+    snapshot.restore(fresh.interpreter, snapshot.take(lox.interpreter))
+    assert fresh.interpreter.global_env.get("m").entries == entries
+    try:
+        api.compile("Map().get(clock);").run(output=MemoryOutput())
+        assert False
+    except InterpreterError as error:
+        assert str(error) == "Map keys must be strings, numbers, booleans or nil."
+    # the methods bound on each property access have no __dict__
+    assert not hasattr(NativeMethod(len, 1, None), "__dict__")
+
+
+def test_generators():
+    # Generator bodies run as their values are asked, one at a time
+    source = """
+        fun naturals() { var n = 0; while (true) { print "at " + n; yield n; n = n + 1; } }
+        fun square(x) { return x * x; }
+        for (var x in take(map(naturals(), square), 2)) print x;
+        fun until(list, last) {
+          for (var x in list) { yield x; if (x == last) return; }
+        }
+        var items = List(); items.push(1); items.push(2); items.push(3);
+        var g = until(items, 2);
+        for (var x in g) { print x; break; }
+        for (var x in g) print x;
+        class Box {
+          init(items) { this.items = items; }
+          each() { for (var i = 0; i < this.items.size(); i = i + 1) yield this.items.get(i); }
+        }
+        for (var x in filter(Box(items).each(), fun (x) { return x > 1; })) print x;
+        print g;
+        """
+    output = MemoryOutput()
+    Lox(output=output).run(source, [])
+    assert output.getvalue() == ("at 0\n0\nat 1\n1\n1\n2\n2\n3\n<generator: until>\n")
+    # loops holding them are left alone by invariant hoisting
+    output = MemoryOutput()
+    Lox(output=output).run("""
+        fun pairs(list, n) {
+          for (var i = 0; i < n; i = i + 1) {
+            while (true) { for (var x in list) yield x * (n + 1) + i; break; }
+          }
+        }
+        var items = List(); items.push(1); items.push(2);
+        for (var x in pairs(items, 2)) print x;
+        """, [])
+    assert output.getvalue() == "3\n6\n4\n7\n"
+    errors = []
+    with LoxError.collecting():
+        Lox(output=MemoryOutput()).run("""
+            yield 1;
+            fun f() { yield 1; return 2; }
+            class A { init() { yield 1; } }
+            """, errors)
+    assert [error.message for error in errors] == [
+        "Cannot yield from top-level code.", "Cannot return a value from a generator.",
+        "Cannot yield from an initializer."]
+    output = MemoryOutput()
+    Lox(output=output).run("for (var x in 3) print x;", [])
+    assert output.getvalue() == "error:  Can only iterate over generators, streams, lists and maps.\n"
+    try:
+        transpile.transpile("fun f() { yield 1; }")
+        assert False, "the transpiler compiled a generator"
+    except api.CompileError as error:
+        assert "Generators only run on the interpreter." in str(error)
+
+
+def test_parallel_map():
+    # Worker processes get a copy of the globals, results come back in order
+    source = """
+        var offset = 100;
+        fun work(n) { if (n == 2) print "two"; return n * n + offset; }
+        var values = List();
+        for (var i = 0; i < 7; i = i + 1) values.push(i);
+        var results = parallelMap(work, values, 3);
+        for (var x in results) print x;
+        print parallelMap(fun (n) { return 1 / (n - 3); }, values, 2);
+        """
+    output = MemoryOutput()
+    Lox(output=output).run(source, [])
+    assert output.getvalue() == ("two\n100\n101\n104\n109\n116\n125\n136\n"
+                                 "error:  Division by zero line:8\n")
+    output = MemoryOutput()
+    Lox(output=output).run("""
+        fun naturals() { var n = 0; while (true) { yield n; n = n + 1; } }
+        var numbers = naturals();
+        print parallelMap(fun (n) { return n; }, take(numbers, 2), 2);
+        """, [])
+    assert output.getvalue() == ("error:  parallelMap() cannot send 'numbers' to the workers: "
+                                 "cannot pickle 'generator' object.\n")
+    # errors in the workers are reported as they are, not as pickling errors
+    source = """
+        fun naturals() { var n = 0; while (true) { yield n; n = n + 1; } }
+        var values = List();
+        for (var i = 0; i < 4; i = i + 1) values.push(i);
+        print parallelMap(fun (n) { return %s; }, values, 2);
+        """
+    output = MemoryOutput()
+    Lox(output=output).run(source % "nil()", [])
+    assert output.getvalue() == "error:  can only call functions.\n"
+    output = MemoryOutput()
+    Lox(output=output).run(source % "naturals()", [])
+    assert output.getvalue() == ("error:  parallelMap() cannot send the results back: "
+                                 "cannot pickle 'generator' object.\n")
+
+
+def test_api_function():
+    # Compile once, call the functions with python values
+    output = MemoryOutput()
+    program = api.compile("""
+        var greeting = "hello ";
+        fun greet(name) { print greeting + name; return greeting + name; }
+        fun total(a, b) { return a + b + bonus(a); }
+        """).run(globals={"bonus": lambda a: a * 10}, output=output)
+    assert program.get_function("greet")("lox") == "hello lox"
+    assert output.getvalue() == "hello lox\n"
+    assert program.get_function("total")(1, 2) == 13
+    assert program.get_global("greeting") == "hello "
+
+
+def test_api_errors():
+    try:
+        api.compile("return 1;")
+        assert False, "compile error expected"
+    except api.CompileError as error:
+        assert error.messages == ["[line 1] Error : Cannot return from top-level code."]
+    # all the syntax errors are reported in one pass
+    try:
+        api.compile("var = 1;\nprint (1;\nprint 2")
+        assert False, "compile error expected"
+    except api.CompileError as error:
+        assert [(e.line, e.where) for e in error.errors] == [
+            (1, "at '='"), (2, "at ';'"), (3, "at end")]
+    errors = []
+    tokens = []
+    scan_tokens("var = 1; var = 2; var = 3;", {'start': 0, 'current': 0, 'line': 1}, tokens, errors)
+    with LoxError.collecting():
+        statements = Parser(tokens, errors, 2).parse()
+    assert len(errors) == 2 and statements == [None, None]
+    program = api.compile("fun f(a) { return -a; }")
+    try:
+        program.get_function("f")(1, 2)
+        assert False, "arity error expected"
+    except TypeError:
+        pass
+    try:
+        program.get_function("f")("a")
+        assert False, "runtime error expected"
+    except InterpreterError:
+        pass
+
+
+def test_global_cells():
+    # the sites of a tree cache the cells of the globals of one run only
+    program = api.compile("fun get() { return limit; }")
+    first = program.run({"limit": 1}).get_function("get")
+    assert first() == 1
+    second = program.run({"limit": 2}).get_function("get")
+    assert second() == 2 and first() == 1
+
+
+def test_api_threads():
+    # Calls of one run from several threads are serialized
+    program = api.compile("""
+        var count = 0;
+        fun add(n) { for (var i = 0; i < n; i = i + 1) count = count + 1; return count; }
+        """).run()
+    add = program.get_function("add")
+    threads = [threading.Thread(target=add, args=(500,)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert program.get_global("count") == 2000
+
+
+def test_api_async():
+    # Both scripts wait in the same native: they only end if they run concurrently
+    program = api.compile("print meet(name);")
+
+    async def main():
+        arrived = []
+        everyone = asyncio.Event()
+
+        async def meet(name):
+            arrived.append(name)
+            if len(arrived) == 2:
+                everyone.set()
+            await asyncio.wait_for(everyone.wait(), 5)
+            return name + " met"
+
+        outputs = [MemoryOutput(), MemoryOutput()]
+        await asyncio.gather(*[
+            api.run_async(program, {"name": name, "meet": meet}, output)
+            for name, output in zip(["a", "b"], outputs)])
+        return [output.getvalue() for output in outputs]
+
+    assert asyncio.run(main()) == ["a met\n", "b met\n"]
+
+
+def test_api_async_native_sync_run():
+    async def double(x):
+        await asyncio.sleep(0)
+        return x * 2
+    output = MemoryOutput()
+    api.compile("print double(21);").run({"double": double}, output)
+    assert output.getvalue() == "42\n"
+
+    # a synchronous run inside a running event loop cannot wait for it
+    async def main():
+        try:
+            api.compile("print double(21);").run({"double": double}, MemoryOutput())
+            assert False, "interpreter error expected"
+        except InterpreterError as error:
+            assert "use lox.api.run_async" in str(error)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        asyncio.run(main())
+
+
+def run_budget(source, budget):
+    # Limit over expected, return its error
+    try:
+        api.compile(source).run(budget=budget, output=MemoryOutput())
+    except BudgetExceeded as error:
+        return error
+    assert False, "budget exceeded expected"
+
+
+def test_budget():
+    forever = "var i = 0;\nwhile (true) {\n  i = i + 1;\n}"
+    error = run_budget(forever, ExecutionBudget(steps=1000))
+    assert (error.limit, error.line) == ("more than 1000 steps", 3)
+    error = run_budget(forever, ExecutionBudget(seconds=0.1))
+    assert error.limit == "more than 0.1s"
+    recursion = "fun f(n) {\n  return f(n + 1);\n}\nf(0);"
+    error = run_budget(recursion, ExecutionBudget(depth=200))
+    assert (error.limit, error.line) == ("more than 200 nested blocks and calls", 2)
+    closures = "while (true) {\n  fun f() {}\n}"
+    error = run_budget(closures, ExecutionBudget(environments=100))
+    assert error.limit == "more than 100 environments"
+    # a budget large enough changes nothing
+    output = MemoryOutput()
+    api.compile("var n = 0; for (var i = 0; i < 10; i = i + 1) n = n + i; print n;").run(
+        budget=ExecutionBudget(1000, 10, 100, 10), output=output)
+    assert output.getvalue() == "45\n"
+
+
+def test_function_metadata():
+    program = api.compile("""
+        fun tick() { print 1; }
+        fun counter() {
+          var n = 0;
+          fun next() { n = n + 1; return n; }
+          while (n < 1) next();
+          return next;
+        }
+        class A { name() { return "A"; } self() { return this; } }
+        """)
+    tick, counter = [statement.funcexp for statement in program.statements[:2]]
+    assert not tick.scoped and tick.locals == 0 and not tick.hascalls
+    assert counter.scoped and counter.captured and counter.locals == 2 and counter.depth == 1
+    assert counter.hasloops and counter.hascalls and counter.result is not None
+    nested = counter.body[1].funcexp
+    assert nested.upvalues == {"n"} and not nested.scoped and not nested.usesthis
+    name, self_ = program.statements[2].methods
+    assert name.upvalues == set() and not name.usesthis
+    assert self_.upvalues == {"this"} and self_.usesthis
+
+
+def test_heap():
+    source = """
+        class Node { init(next) { this.next = next; } }
+        var list = nil;
+        for (var i = 0; i < size; i = i + 1) list = Node(list);
+        """
+    heap = HeapTracker()
+    api.compile(source).run({"size": 100}, heap=heap)
+    count, size = heap.summary()["Node"]
+    assert count == 100 and size > 0
+    try:
+        api.compile(source).run({"size": 100000}, heap=HeapTracker(20 * size))
+        assert False, "heap limit exceeded expected"
+    except HeapLimitExceeded as error:
+        assert error.limit == 20 * size
+    # lists and maps are charged as they grow, with no allocation after them
+    source = """
+        var items = List();
+        var index = Map();
+        for (var i = 0; i < size; i = i + 1) { items.push(i); index.set(i, i); }
+        """
+    heap = HeapTracker()
+    api.compile(source).run({"size": 1000}, heap=heap)
+    summary = heap.summary()
+    assert summary["list"][0] == 1 and summary["list"][1] > 8000
+    assert summary["map"][0] == 1 and summary["map"][1] > summary["list"][1]
+    try:
+        api.compile(source).run({"size": 10 ** 7}, heap=HeapTracker(10 ** 6))
+        assert False, "heap limit exceeded expected"
+    except HeapLimitExceeded as error:
+        assert error.size > error.limit == 10 ** 6
+
+
+def test_incremental():
+    source = """fun add(a, b) {
+  return a + b;
+}
+var x = add(1, 2);
+print x;
+"""
+    document = Document(source)
+    kept = document.statements[0]
+    # edit the second declaration, the function is reused
+    start = source.index("1, 2")
+    document.edit(start, start + 1, "40")
+    assert document.statements[0] is kept
+    output = MemoryOutput()
+    document.program().run(output=output)
+    assert output.getvalue() == "42\n"
+    # a line break moves the declarations after it
+    document.edit(0, 0, "\n")
+    assert document.statements[0] is kept and document.statements[1].line == 5
+    # errors come and go with the edits
+    start = document.source.index("print")
+    document.edit(start, start + 5, "prnt")
+    assert document.errors()
+    document.edit(start, start + 4, "print")
+    assert not document.errors()
+    fresh = Document(document.source)
+    printer = PrinterVisitor()
+    assert [printer.print(s) for s in document.statements] == \
+        [printer.print(s) for s in fresh.statements]
+
+
 # Main routine for compiling Lox language
 #
 if __name__ == "__main__":
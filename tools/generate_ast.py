@@ -1,4 +1,9 @@
 # Generate AST
+#
+# python tools/generate_ast.py lox writes lox/expr.py, lox/stmt.py and
+# lox/visitor.py. A node is "Name : Type field, Type field", or a tuple
+# (node, fields) where fields are the lines ending __init__: the metadata
+# the resolver and the interpreter set on the node, with their comments.
 import argparse
 import os
 import keyword
@@ -6,7 +11,7 @@ import builtins
 
 
 def define_import(lines):
-    lines.append("from loxtoken import LoxToken")
+    lines.append("from lox.token import LoxToken")
     lines.append("from typing import List")
 
 # to define a visitor base class with visit method
@@ -14,14 +19,14 @@ def define_import(lines):
 
 
 def define_visitor_base_import(lines):
-    lines.append("from visitorhelper import *")
-    lines.append("from loxtoken import LoxToken")
+    lines.append("from lox.visitorhelper import *")
+    lines.append("from lox.token import LoxToken")
     lines.append("from typing import List")
 
 
 def define_visitormethods(visitor_lines, classname):
     # visitor method
-    visitor_lines.append("\n")
+    visitor_lines.append("")
     visitordef = "@visitor(" + classname + ")"
     visitor_lines.append(visitordef.rjust(len(visitordef)+4))
     if keyword.iskeyword(classname.lower() or classname.lower() in dir(builtins)):
@@ -42,31 +47,42 @@ def define_visitor_file(visitor_lines, outputdir, basename):
         # base class
         for l in visitor_lines:
             f.write(l+"\n")
-    f.closed
 
 
 def define_visitor_import(lines, basename):
-    lines.insert(0, "from " + basename.lower() + " import *")
+    lines.insert(0, "from lox." + basename.lower() + " import *")
 
 # to define a class with attributes valuated in init
 
 
-def define_class(lines, classname, parentname, attributes):
-    lines.append("\n")
-    if len(parentname) > 0:
-        classdef = "class " + classname + "(" + parentname + "):"
-    else:
-        classdef = "class " + classname + ":"
-    lines.append(classdef)
-    if (len(attributes) > 0):
-        # split the string in (argname: type)
-        initargs = [s[1]+": "+s[0]
-                    for s in (x.split() for x in attributes.split(","))]
+def define_class(lines, classname, parentname, attributes, fields=()):
+    lines.append("")
+    lines.append("")
+    lines.append("class " + classname + "(" + parentname + "):")
+    members = [a.strip() for a in attributes.split(",") if a.strip()]
+    if members and members[0].startswith('"""'):
+        # a node specializing another one: its docstring, no new attribute
+        lines.append("    " + ", ".join(members))
+        lines.append("")
+        members = []
+    while members and "=" in members[0]:
+        # class attribute
+        lines.append("    " + members.pop(0))
+        lines.append("")
+    if members:
+        # split the string in (argname: type), an argument may have no type
+        initargs = []
+        for member in members:
+            words = member.split()
+            initargs.append(words[-1] + ": " + words[0] if len(words) > 1 else words[0])
         initdef = "def __init__(self, " + ', '.join(initargs) + "):"
         lines.append(initdef.rjust(len(initdef)+4))
         for t in initargs:
             initval = "self." + t.split(":")[0] + " = " + t.split(":")[0]
             lines.append(initval.rjust(len(initval)+8))
+        for field in fields:
+            lines.append(field.rjust(len(field)+8))
+        lines.append("")
     # visitor method
     visitordef = "def accept(self, visitor):"
     lines.append(visitordef.rjust(len(visitordef)+4))
@@ -91,51 +107,90 @@ def define_filename(outputdir, basename):
 # Defining a set of classes from a main class
 
 
-def define_ast(outputdir, basename, types, visitor_lines):
+def define_ast(outputdir, basename, types, visitor_lines, imports=(), base=("pass",), preamble=()):
     lines = []
-    newline = "\n"
     define_import(lines)
     define_visitor_import(visitor_lines, basename)
-    if basename == "Stmt":
-        lines.append("from expr import Expr, Variable")
-    lines.append(newline)
+    lines.extend(imports)
+    lines.append("")
+    lines.append("")
     lines.append("class " + basename + ":")
-    lines.append("pass".rjust(8))
-    lines.append(newline)
+    for line in base:
+        lines.append(("    " + line).rstrip())
+    if preamble:
+        lines.append("")
+        lines.append("")
+        lines.extend(preamble)
+    names = []
     for type in types:
-        typedef = type.split(":")
+        type, fields = (type, ()) if isinstance(type, str) else type
+        typedef = type.split(":", 1)
         typename = typedef[0].strip()
-        define_class(lines, typename, basename, typedef[1])
+        parentname = basename
+        if "(" in typename:
+            typename, parentname = typename.rstrip(")").split("(")
+        define_class(lines, typename, parentname, typedef[1], fields)
+        names.append(typename)
     with open(define_filename(outputdir, basename), 'w') as f:
         # base class
         for l in lines:
             f.write(l+"\n")
-    f.closed
     # Visitor
-    for type in types:
-        typedef = type.split(":")
-        typename = typedef[0].strip()
+    for typename in names:
         define_visitormethods(visitor_lines, typename)
 
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser("generate_ast")
-    parser.add_argument(
-        "output_dir", help="output directory where the ast classes are generated", type=str)
-    args = parser.parse_args()
+def generate(outputdir):
     visitor_lines = []
     define_visitor_base_import(visitor_lines)
+    visitor_lines.append("")
+    visitor_lines.append("")
     visitor_lines.append("class Visitor:")
+    visitor_lines.append('    """Visitor class for Expr and Stmt, all visitors must inherit from this one."""')
     # defining all the classes for the abstract syntax tree
-    define_ast(args.output_dir, "Expr", [
+    define_ast(outputdir, "Expr", [
         # Statements and State assign-Expression
-        "Assign   : LoxToken name, Expr value",
+        ("Assign   : LoxToken name, Expr value", [
+            "# cell of the global variable assigned, cached by the interpreter",
+            "self.cell = None"]),
         "Binary   : Expr left, LoxToken operator, Expr right",
         # Functions call-Expr
-        "Call     : Expr callee, LoxToken paren, List[Expr] arguments",
+        ("Call     : Expr callee, LoxToken paren, List[Expr] arguments", [
+            "# last callee validated at this call site (its declaration for functions)",
+            "self.cache = UNCACHED"]),
+        # Functions and lambdas, the body of a function statement too
+        ("FunctionExp : LoxToken name, List[LoxToken] params, \"List[Stmt]\" body, functiontype", [
+            "# metadata set by the resolver:",
+            "# a closure created by the function may keep its frame",
+            "self.captured = True",
+            "# the function declares parameters or variables, so each call needs",
+            "# an environment",
+            "self.scoped = True",
+            "# the body without its last statement when it is a return, and this",
+            "# return, run without raising",
+            "self.statements = body",
+            "self.result = None",
+            "# names declared in the function, outside of its nested functions,",
+            "# and deepest nesting of its scopes",
+            "self.locals = 0",
+            "self.depth = 0",
+            "# local variables of enclosing functions it uses, 'this' and 'super'",
+            "# included",
+            "self.upvalues = set()",
+            "self.usesthis = False",
+            "self.hasloops = False",
+            "self.hascalls = False",
+            "# call frames of the function ready for reuse when not captured",
+            "self.frames = []",
+            "# body left to parse and resolve on the first call (see lox.lazy)",
+            "self.pending = None",
+            "# the body yields: a call returns a generator (see lox.generators)",
+            "self.generator = False"]),
         # Classes get-ast
         "Get      : Expr getobject, LoxToken name",
         "Grouping : Expr expression",
+        # Loop invariant expression hoisted by the resolver
+        "Invariant : Expr expression",
         "Literal  : object value",
         # Control Flow logical-ast
         "Logical  : Expr left, LoxToken operator, Expr right",
@@ -147,28 +202,83 @@ if __name__ == "__main__":
         "This     : LoxToken keyword",
         # Statements and State var-Expr
         "Unary    : LoxToken operator, Expr right",
-        "Variable : LoxToken name"
-    ], visitor_lines)
+        ("Variable : LoxToken name", [
+            "# cell of the global variable read, cached by the interpreter",
+            "self.cell = None"]),
+        # Operations specialized by lox.typeinfer
+        "NumericBinary(Binary) : \"\"\"Binary whose operands are proven numbers by lox.typeinfer.\"\"\"",
+        "NumericUnary(Unary) : \"\"\"Unary minus whose operand is proven a number by lox.typeinfer.\"\"\""
+    ], visitor_lines, preamble=[
+        "# cache of a call site validating no callee yet, nil included",
+        "UNCACHED = object()"])
 
     # defining all the statements for the abstract syntax tree
-    define_ast(args.output_dir, "Stmt", [
+    define_ast(outputdir, "Stmt", [
         # > block-ast
-        "Block      : List[Stmt] statements",
+        ("Block      : List[Stmt] statements", [
+            "# set by the resolver: the block declares variables (needs a scope)",
+            "self.hasdeclarations = True",
+            "# set by the resolver: a variable of the block is used by a closure",
+            "self.captured = True"]),
         "Break      : LoxToken keyword",
         # Functions function-ast
-        "Function   : LoxToken name, List[LoxToken] params, List[Stmt] body",
+        "Function   : FunctionExp funcexp",
         #  Inheritance superclass-ast
         "Class      : LoxToken name, Variable superclass, List[Function] methods",
         #   Inheritance superclass-ast
         "Expression : Expr expression",
+        # Control Flow for-ast, kept as a node instead of a desugared while
+        "For        : Stmt initializer, Expr condition, Expr increment, Stmt body",
+        # Generators for-in loop over a list, a map or a generator
+        "ForIn      : LoxToken name, Expr iterable, Stmt body",
         # Control Flow if-ast
         "If         : Expr condition, Stmt thenbranch, Stmt elsebranch",
+        # Modules import of a lox file
+        "Import     : LoxToken keyword, LoxToken path",
         # var-stmt-ast
         "Print      : Expr expression",
         # Functions return-ast
-        "Return     : LoxToken keyword, Expr value",
+        ("Return     : LoxToken keyword, Expr value", [
+            "# set by the resolver: last statement of a function body, it gives",
+            "# its value to the call instead of raising",
+            "self.last = False"]),
         # Control Flow while-ast
         "Var        : LoxToken name, Expr initializer",
-        "While      : Expr condition, Stmt body"
-    ], visitor_lines)
-    define_visitor_file(visitor_lines, args.output_dir, "Visitor")
+        "While      : Expr condition, Stmt body",
+        # Generators yield of a value
+        "Yield      : yields = True, LoxToken keyword, Expr value"
+    ], visitor_lines, imports=["from lox.expr import Expr, Variable, FunctionExp"], base=[
+        "# first token of the statement, set by the parser",
+        "first = None",
+        "# set when the statement runs under lox.coverage",
+        "covered = False",
+        "# set by the resolver: the statement holds a yield of its function",
+        "yields = False",
+        "",
+        "@property",
+        "def line(self) -> int:",
+        "    \"\"\"Line of the statement, it follows the token when edits move it.\"\"\"",
+        "    if self.first is None:",
+        "        return None",
+        "    return self.first.line"])
+    visitor_lines.extend([
+        "",
+        "    def visitinvariant(self, invariant):",
+        "        \"\"\"Hoisted loop invariants are transparent unless a visitor cares.\"\"\"",
+        "        return invariant.expression.accept(self)",
+        "",
+        "    def visitnumericbinary(self, binary):",
+        "        \"\"\"Specialized operations are plain ones unless a visitor cares.\"\"\"",
+        "        return self.visitbinary(binary)",
+        "",
+        "    def visitnumericunary(self, unary):",
+        "        return self.visitunary(unary)"])
+    define_visitor_file(visitor_lines, outputdir, "Visitor")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("generate_ast")
+    parser.add_argument(
+        "output_dir", help="output directory where the ast classes are generated", type=str)
+    args = parser.parse_args()
+    generate(args.output_dir)